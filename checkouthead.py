@@ -11,8 +11,8 @@ import os
 import shutil
 import subprocess
 
-from convert import arguments, configuration, utils
-from dls_css_utils import coordinates, config, dependency, utils as css_utils
+from convert import arguments, configuration, dependencies, utils
+from dls_css_utils import coordinates, config, utils as css_utils
 
 LOG_FORMAT = '%(levelname)s:  %(message)s'
 LOG_LEVEL = log.INFO
@@ -72,9 +72,8 @@ def checkout_coords(coords, cfg, include_deps=True, extra_deps=None, force=False
     log.info('Checking out module at: %s', coords)
     log.info('Extra dependencies: %s', extra_deps)
     if include_deps:
-        dp = dependency.DependencyParser.from_coord(coords, additional_depends=extra_deps)
         log.info('Finding dependencies of %s', coords)
-        to_checkout = dp.find_dependencies()
+        to_checkout = dependencies.find_dependencies(coords, additional_depends=extra_deps)
     else:
         to_checkout = {}
 
@@ -139,6 +138,8 @@ if __name__ == '__main__':
     args = arguments.parse_arguments()
     cfg = configuration.GeneralConfig(args.general_config, args.module_config)
     area = css_utils.AREA_IOC if args.ioc else css_utils.AREA_SUPPORT
+    if args.no_dependency_cache:
+        dependencies.disable_disk_cache()
 
     if args.all:
         log.info("Searching for all '%s' modules for checkout.", area)
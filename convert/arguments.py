@@ -14,6 +14,13 @@ def build_parser():
             [-a | -m <module>] -- all or specified module
             [-i | -s] -- IOC or support module
             [-c] -- configuration file location, default "conf/"
+            [--server] -- convert all files in one persistent JVM
+            [--batch] -- convert each module's files in one JVM invocation
+            [-j <jobs>] -- number of processes converting files in a module
+            [-J <jobs>] -- number of modules converted at once
+            [--no-dependency-cache] -- don't reuse dependencies from earlier runs
+            [--native] -- convert simple screens without the Java converter
+            [--reachable-only] -- convert only screens reachable from the launcher
 
     :return: ArgumentParser
     """
@@ -35,6 +42,24 @@ def build_parser():
         help='configuration file directory', metavar='<config-file>', default='conf/')
 
     ap.add_argument('-f', '--force', help='Replace all files', action='store_true')
+    converter_group = ap.add_mutually_exclusive_group()
+    converter_group.add_argument('--server',
+        help='Convert all files using one persistent JVM', action='store_true')
+    converter_group.add_argument('--batch',
+        help="Convert each module's files in one JVM invocation", action='store_true')
+    ap.add_argument('-j', '--jobs', help='Number of processes converting files in a module',
+        metavar='<jobs>', type=int, default=1)
+    ap.add_argument('-J', '--module-jobs', help='Number of modules converted at once',
+        metavar='<jobs>', type=int, default=1)
+    ap.add_argument('--no-dependency-cache',
+        help='Resolve dependencies again rather than reuse those saved by earlier runs',
+        action='store_true')
+    ap.add_argument('--native',
+        help='Convert screens using only common widgets in Python, falling back '
+             'to the Java converter for the rest', action='store_true')
+    ap.add_argument('--reachable-only',
+        help='Convert only EDL files reachable from the launcher applications.xml',
+        action='store_true')
     return ap
 
 
@@ -0,0 +1,132 @@
+"""
+Catalogue of the OPI files in a tree, tagged by the post-processing they
+need.
+
+Each post-process script used to find its own files, by walking the tree
+and reading every OPI file again or by shelling out to find and grep.
+scan() walks the tree once, reads each OPI file once and records which
+of the markers in MARKERS it contains.  The catalogue may be saved so that
+a later scan only reads files which have changed.
+"""
+import collections
+import cPickle as pickle
+import logging as log
+import os
+
+import files
+import mmux
+
+OPI_EXTENSION = '.opi'
+# Default place to save the catalogue between runs
+CATALOGUE_FILE = os.path.join(files.TMP_DIR, 'catalogue.pickle')
+
+# Tags
+MENU_MUX = 'menumux'
+EDM_SYMBOL = 'symbol'
+RULES = 'rules'
+COLOURS = 'colours'
+FONTS = 'fonts'
+
+# Text whose presence in an OPI file means the file has the tag
+MARKERS = collections.OrderedDict([
+    (MENU_MUX, mmux.MENU_MUX_ID),
+    (EDM_SYMBOL, 'EDM Symbol'),
+    (RULES, '<rules'),
+    (COLOURS, '<color'),
+    (FONTS, '<fontdata'),
+])
+
+
+class Catalogue(object):
+    """Tags of each OPI file found by scan()."""
+
+    def __init__(self, tags=None):
+        """
+        Args:
+            tags: dict of filepath:frozenset of tags
+        """
+        self.tags = tags if tags is not None else {}
+
+    def files(self, tag=None):
+        """Return sorted paths of files with tag, or of all files."""
+        return sorted(f for f, t in self.tags.iteritems() if tag is None or tag in t)
+
+    def __len__(self):
+        return len(self.tags)
+
+
+def classify(filepath):
+    """Return the tags of one OPI file."""
+    with open(filepath) as f:
+        text = f.read()
+    return frozenset(tag for tag, marker in MARKERS.iteritems() if marker in text)
+
+
+def _load(cache_file):
+    """Return the saved {filepath: (mtime, size, tags)}, or {} if none."""
+    try:
+        with open(cache_file, 'rb') as f:
+            saved = pickle.load(f)
+    except IOError:
+        return {}
+    except Exception as e:
+        log.warn('Ignoring unreadable catalogue %s: %s', cache_file, e)
+        return {}
+    if saved.get('markers') != MARKERS.items():
+        return {}
+    return saved['files']
+
+
+def _save(cache_file, entries):
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_file = '{}.{}'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'markers': MARKERS.items(), 'files': entries}, f,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        log.warn('Failed to save catalogue %s: %s', cache_file, e)
+
+
+def scan(basepath, cache_file=None):
+    """ Walk basepath once and tag every OPI file in it.
+
+    Args:
+        basepath: root of search
+        cache_file: if given, file in which the catalogue is saved; files
+            whose mtime and size are unchanged since it was saved are not
+            read again
+
+    Returns:
+        Catalogue
+    """
+    log.info('Cataloguing OPI files in %s', basepath)
+    saved = _load(cache_file) if cache_file is not None else {}
+    entries = {}
+    for dirpath, _, filenames in os.walk(basepath):
+        for filename in filenames:
+            if not filename.endswith(OPI_EXTENSION):
+                continue
+            filepath = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(filepath)
+                previous = saved.get(filepath)
+                if previous is not None and previous[:2] == (st.st_mtime, st.st_size):
+                    tags = previous[2]
+                else:
+                    tags = classify(filepath)
+            except (IOError, OSError) as e:
+                log.warn('Cannot read %s: %s', filepath, e)
+                continue
+            entries[filepath] = (st.st_mtime, st.st_size, tags)
+
+    if cache_file is not None:
+        # Keep the entries of files scanned from other basepaths
+        inside = os.path.join(basepath, '')
+        kept = dict((f, e) for f, e in saved.iteritems() if not f.startswith(inside))
+        kept.update(entries)
+        _save(cache_file, kept)
+    return Catalogue(dict((f, e[2]) for f, e in entries.iteritems()))
@@ -3,9 +3,12 @@ import logging as log
 import os
 import xml.etree.ElementTree as ET
 
+import catalogue
 import utils
 
 COLOR_DEF_FILE = 'res/colourtweak.def'
+# Widget specific overrides, found in the same directory as COLOR_DEF_FILE
+COLOR_ROLES_FILE = 'colourtweak.roles'
 
 DISPLAY = "org.csstudio.opibuilder.Display"
 ACTIONBUTTON = "org.csstudio.opibuilder.widgets.ActionButton"
@@ -24,14 +27,24 @@ BOOLBUTTON = "org.csstudio.opibuilder.widgets.BoolButton"
 
 # dictionary of KEY:(r,g,b) tuple
 colour_dict = {}
+# colour definitions file most recently loaded by init()
+_loaded_file = None
+# list of (EDM name, match last word, typeIds, props or None, new name)
+# in order of precedence
+colour_roles = []
+# dictionary of (EDM name, typeId, prop):new name (None to drop the name),
+# filled in as colours are seen
+_role_lookup = {}
 
 
 def init(filepath=COLOR_DEF_FILE):
     """ Parse a colour definitions file containing "key = r, g, b" lines
+        and the colour roles file next to it
     Args:
         filepath: file to load
 
     """
+    global _loaded_file
     with open(filepath) as f:
         for line in f:
             # get rid of comments
@@ -42,6 +55,67 @@ def init(filepath=COLOR_DEF_FILE):
                 r, g, b = rgb.split(",")
                 colour_dict[name.strip()] = (r.strip(), g.strip(), b.strip())
 
+    load_roles(os.path.join(os.path.dirname(filepath), COLOR_ROLES_FILE))
+    _loaded_file = filepath
+
+
+def ensure_init(filepath=COLOR_DEF_FILE):
+    """ Call init() unless filepath is already loaded
+    Args:
+        filepath: file to load
+
+    """
+    if _loaded_file != filepath:
+        init(filepath)
+
+
+def load_roles(filepath):
+    """ Parse a colour roles file containing
+        "EDM colour | widget types | properties | new colour" lines
+    Args:
+        filepath: file to load
+
+    Raises:
+        ValueError if a line is malformed or names an unknown widget type
+    """
+    roles = []
+    with open(filepath) as f:
+        for line in f:
+            # get rid of comments
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) != 4:
+                raise ValueError("Invalid colour role in {}: {}".format(filepath, line))
+            name, types, props, new_name = fields
+
+            last_word = name.startswith("~")
+            if last_word:
+                name = name[1:].lower()
+            type_ids = set()
+            for widget_type in types.split(","):
+                type_ids.update(_widget_types(widget_type.strip()))
+            if props == "*":
+                props = None
+            else:
+                props = set(prop.strip() for prop in props.split(","))
+            roles.append((name, last_word, type_ids, props, new_name))
+
+    colour_roles[:] = roles
+    _role_lookup.clear()
+
+
+def _widget_types(name):
+    """ Return the typeIds referred to by a name in the colour roles file
+    """
+    if name in WIDGET_TYPES:
+        return WIDGET_TYPES[name]
+    elif "." in name:
+        return [name]
+    else:
+        raise ValueError("Unknown widget type in colour roles: {}".format(name))
+
 
 def set_colour(el, name):
     # set colour attributes to be according to the named colour
@@ -142,6 +216,28 @@ TEXT_MONITORS = [TEXTUPDATE]
 TEXT_STATIC = [LINKINGCONTAINER, LABEL, DETAILPANEL, GROUPINGCONTAINER]
 NON_TEXT = [MULTISTATESYMBOLMONITOR, RECTANGLE, BYTEMONITOR]
 
+# Names usable for widget types in the colour roles file
+WIDGET_TYPES = {
+    "DISPLAY": [DISPLAY],
+    "ACTIONBUTTON": [ACTIONBUTTON],
+    "MULTISTATESYMBOLMONITOR": [MULTISTATESYMBOLMONITOR],
+    "LINKINGCONTAINER": [LINKINGCONTAINER],
+    "RECTANGLE": [RECTANGLE],
+    "LABEL": [LABEL],
+    "DETAILPANEL": [DETAILPANEL],
+    "GROUPINGCONTAINER": [GROUPINGCONTAINER],
+    "TEXTINPUT": [TEXTINPUT],
+    "TEXTUPDATE": [TEXTUPDATE],
+    "MENUBUTTON": [MENUBUTTON],
+    "CHOICEBUTTON": [CHOICEBUTTON],
+    "BYTEMONITOR": [BYTEMONITOR],
+    "BOOLBUTTON": [BOOLBUTTON],
+    "TEXT_CONTROLS": TEXT_CONTROLS,
+    "TEXT_MONITORS": TEXT_MONITORS,
+    "TEXT_STATIC": TEXT_STATIC,
+    "NON_TEXT": NON_TEXT,
+}
+
 
 def change_colours(widget):
     """ Perform colour substitutions in the constructed OPI files.
@@ -177,24 +273,33 @@ def change_colours(widget):
     """
     # Get the widget type
     type_id = widget.get("typeId")
-    # Parent lookup for colours
-    colour_prop = {c:p.tag for p in widget.iter() for c in p}
 
-    # Note: ElementTree doesn't support xpath 'or' (|) so we parse the document
-    # twice
-    for colour in widget.findall("./*/color"):
-        name = colour.get("name")
-        if name is not None:
-            process_element(colour, name, type_id, colour_prop[colour])
+    # Walk down from the widget's own properties so that the enclosing
+    # element of each colour is known without searching the whole subtree;
+    # child widgets are handled by their own call.
+    for prop in widget:
+        for colour in prop.findall("color"):
+            _process_named(colour, type_id, prop.tag)
+
+    for prop in widget:
+        for rule in prop.findall("rule"):
+            for exp in rule:
+                for value in exp:
+                    for colour in value.findall("color"):
+                        _process_named(colour, type_id, value.tag)
+
 
-    for colour in widget.findall("./*/rule/*/*/color"):
-        name = colour.get("name")
-        if name is not None:
-            process_element(colour, name, type_id, colour_prop[colour])
+def _process_named(colour, type_id, prop):
+    name = colour.get("name")
+    if name is not None:
+        process_element(colour, name, type_id, prop)
 
 
 def process_element(colour, name, type_id, prop):
     """ Execute role specific overrides on the passed colour XML element
+
+        The first matching entry in the colour roles file is applied,
+        otherwise the static COLOUR_MAP, otherwise the name is removed.
     Args:
         colour: XML color element
         prop: enclosing element name
@@ -204,78 +309,50 @@ def process_element(colour, name, type_id, prop):
     Returns:
 
     """
-    def match_colour_role(n, t, p=None, reference_name=None):
-        """ Helper method to evaluate match on three arguments.
-
-            The arguments define the subset of widget color rules the
-            transformation should be applied to.
-
-        Args:
-            n (String): EDM colour name for rule
-            t: (String or [String]): name or list of element typeIds
-            p (String or [String]) (optional): property name or list
-            reference_name (String) (optional): EDM colour name for comparison,
-                defaults to process_element 'name' argument
-        """
-        if reference_name is None:
-            reference_name = name
-        return reference_name == n and type_id in t and (p is None or prop in p)
-
-    if match_colour_role("canvas", TEXT_STATIC + [DISPLAY], "background_color",
-                         reference_name=name.split()[-1].lower()):
-        set_colour(colour, "Canvas")
-    elif match_colour_role("Canvas", TEXT_CONTROLS, ["background_color", "off_color", "value"]):
-        set_colour(colour, "Controller: BG")
-    elif match_colour_role("Button: On", CHOICEBUTTON, "selected_color"):
-        set_colour(colour, "Button: On")
-    elif match_colour_role("Button: On", BOOLBUTTON):
-        set_colour(colour, "Button: On")
-    elif match_colour_role("Monitor BG", TEXT_MONITORS, "background_color"):
-        set_colour(colour, "Monitor: BG")
-    elif match_colour_role("Black", TEXT_STATIC + [ACTIONBUTTON], "foreground_color"):
-        set_colour(colour, "Text: FG")
-    elif match_colour_role("Green LED: On", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Green LED: On")
-    elif match_colour_role("Green LED: Off", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Green LED: Off")
-    elif match_colour_role("Red LED: On", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Red LED: On")
-    elif match_colour_role("Red LED: Off", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Red LED: Off")
-    elif match_colour_role("Yellow LED: On", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Yellow LED: On")
-    elif match_colour_role("Yellow LED: Off", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Yellow LED: Off")
-    elif match_colour_role("Controller/alt", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Blue LED: On")
-    elif match_colour_role("cyan-34", BYTEMONITOR, ["on_color", "off_color"]):
-        set_colour(colour, "Blue LED: Off")
-    elif match_colour_role("Monitor: NORMAL", TEXT_MONITORS, "foreground_color"):
-        set_colour(colour, "Monitor: FG")
-    elif match_colour_role("Controller", TEXT_CONTROLS, "foreground_color"):
-        set_colour(colour, "Controller: FG")
-    elif match_colour_role("Shell/reldsp-alt", ACTIONBUTTON, "foreground_color"):
-        set_colour(colour, "Text: FG")
-    elif match_colour_role("Related display", [ACTIONBUTTON, MENUBUTTON], "foreground_color"):
-        set_colour(colour, "Related Display: FG")
-    elif match_colour_role("Exit/Quit/Kill", ACTIONBUTTON, "foreground_color"):
-        set_colour(colour, "Exit: FG")
-    # If we have a static map, then just use that
-    elif name in COLOUR_MAP:
-        set_colour(colour, COLOUR_MAP[name])
+    key = (name, type_id, prop)
+    try:
+        new_name = _role_lookup[key]
+    except KeyError:
+        new_name = _role_lookup[key] = _find_role(name, type_id, prop)
+
+    if new_name is not None:
+        set_colour(colour, new_name)
     else:
         # remove name
         colour.attrib.pop("name")
 
 
+def _find_role(name, type_id, prop):
+    """ Return the colour name to use for an EDM colour in the given widget
+        property, or None if the name should be dropped
+    """
+    words = name.split()
+    last_word = words[-1].lower() if words else None
+    for role_name, match_last_word, type_ids, props, new_name in colour_roles:
+        reference_name = last_word if match_last_word else name
+        if (reference_name == role_name and type_id in type_ids and
+                (props is None or prop in props)):
+            return new_name
+    # If we have a static map, then just use that
+    return COLOUR_MAP.get(name)
+
+
+def transform(root):
+    """ Perform colour substitutions on every widget in an OPI tree.
+    Args:
+        root: root element of the OPI file
+    """
+    for widget in root.findall(".//widget"):
+        change_colours(widget)
+
+
 def parse(filepath):
     try:
         if os.path.exists(filepath) or os.access(filepath, os.R_OK):
             tree = ET.parse(filepath)
             root = tree.getroot()
 
-            for widget in root.findall(".//widget"):
-                change_colours(widget)
+            transform(root)
 
             # write the new tree out to the same file
             utils.make_writeable(filepath)
@@ -287,7 +364,7 @@ def parse(filepath):
 
 
 def build_filelist(basepath):
-    """ Find all OPI files.
+    """ Find all OPI files which may need colour changes.
 
         Arguments:
             basepath - root of search
@@ -295,4 +372,5 @@ def build_filelist(basepath):
             iterator over relative filepaths
     """
     log.info("Building colourtweak list.")
-    return utils.find_opi_files(basepath)
+    opis = catalogue.scan(basepath, catalogue.CATALOGUE_FILE)
+    return opis.files(catalogue.COLOURS)
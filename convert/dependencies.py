@@ -0,0 +1,157 @@
+"""
+Cache of resolved module dependencies.
+
+Finding the dependencies of a module parses the RELEASE files of the module
+and everything it depends on.  Conversion, symbol post-processing, checkout
+and reporting all need the same graphs, so resolved dependencies are kept
+for the life of the process and, unless disabled, in a file under tmp/ so
+that later runs and other tools can reuse them.
+
+An entry is valid while the mtimes of the RELEASE files of the module and
+all of its dependencies are unchanged.  Those are the files in the mirror
+filesystem where they exist there, otherwise the ones in prod.
+"""
+import atexit
+import cPickle as pickle
+import logging as log
+import os
+
+import files
+
+from dls_css_utils import dependency, coordinates
+
+CACHE_FILE = os.path.join(files.TMP_DIR, 'dependencies.pickle')
+RELEASE_FILE = os.path.join('configure', 'RELEASE')
+
+# key -> {'releases': {path: mtime}, 'dependencies': {name: coords}}
+_graphs = {}
+_use_disk = True
+_loaded = False
+_save_registered = False
+
+
+def disable_disk_cache():
+    """Keep resolved dependencies in this process only."""
+    global _use_disk
+    _use_disk = False
+
+
+def clear():
+    """Forget dependencies resolved in this process."""
+    global _loaded
+    _graphs.clear()
+    _loaded = False
+
+
+def release_file(coords, mirror_root=None):
+    """Return the RELEASE file of the module at coords.
+
+    Args:
+        coords: module coordinates, including version
+        mirror_root: root of the mirror filesystem, if the module is
+            found there rather than at its coordinates
+    """
+    module_path = coordinates.as_path(coords)
+    if mirror_root is not None:
+        module_path = os.path.join(mirror_root, module_path[1:])
+    return os.path.join(module_path, RELEASE_FILE)
+
+
+def _parsed_release_file(coords, mirror_root):
+    """Return the RELEASE file read for coords when resolving dependencies:
+    the copy in the mirror filesystem if there is one, otherwise the one
+    at coords.
+    """
+    if mirror_root is not None:
+        mirrored = release_file(coords, mirror_root)
+        if os.path.exists(mirrored):
+            return mirrored
+    return release_file(coords)
+
+
+def _mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime
+    except OSError:
+        return None
+
+
+def _is_valid(entry):
+    for filepath, mtime in entry['releases'].iteritems():
+        if _mtime(filepath) != mtime:
+            return False
+    return True
+
+
+def _load():
+    global _loaded
+    _loaded = True
+    if not _use_disk:
+        return
+    try:
+        with open(CACHE_FILE, 'rb') as f:
+            saved = pickle.load(f)
+    except IOError:
+        return
+    except Exception as e:
+        log.warn('Ignoring unreadable dependency cache %s: %s', CACHE_FILE, e)
+        return
+    for key, entry in saved.iteritems():
+        _graphs.setdefault(key, entry)
+
+
+def save():
+    """Write resolved dependencies to CACHE_FILE."""
+    if not _use_disk:
+        return
+    try:
+        if not os.path.exists(files.TMP_DIR):
+            os.makedirs(files.TMP_DIR)
+        tmp_file = '{}.{}'.format(CACHE_FILE, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(_graphs, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, CACHE_FILE)
+    except (IOError, OSError) as e:
+        log.warn('Failed to save dependency cache %s: %s', CACHE_FILE, e)
+
+
+def _schedule_save():
+    global _save_registered
+    if _use_disk and not _save_registered:
+        atexit.register(save)
+        _save_registered = True
+
+
+def find_dependencies(coords, mirror_root=None, additional_depends=None):
+    """Find all dependencies of a module, as DependencyParser does.
+
+    Args:
+        coords: module coordinates
+        mirror_root: root of the mirror filesystem, if any
+        additional_depends: list of coords of extra dependencies
+
+    Returns:
+        dict {name: coords} for all module dependencies
+    """
+    if not _loaded:
+        _load()
+
+    key = (coords, mirror_root, tuple(additional_depends or []))
+    entry = _graphs.get(key)
+    if entry is None or not _is_valid(entry):
+        log.debug('Resolving dependencies of %s', coords)
+        kwargs = {'additional_depends': additional_depends}
+        if mirror_root is not None:
+            kwargs['mirror_root'] = mirror_root
+        dp = dependency.DependencyParser.from_coord(coords, **kwargs)
+        deps = dp.find_dependencies()
+        releases = {}
+        for c in [coords] + deps.values():
+            filepath = _parsed_release_file(c, mirror_root)
+            releases[filepath] = _mtime(filepath)
+        entry = {'releases': releases, 'dependencies': deps}
+        _graphs[key] = entry
+        _schedule_save()
+
+    # Callers may add to the result.
+    return dict(entry['dependencies'])
@@ -0,0 +1,352 @@
+"""
+Reader for EDM display (.edl) files.
+
+An EDL file (version 4 onwards) is a version line, a block of screen
+properties and a sequence of objects:
+
+    4 0 1
+    beginScreenProperties
+    w 200
+    ...
+    endScreenProperties
+
+    # (Group)
+    object activeGroupClass
+    beginObjectProperties
+    x 10
+    ...
+    beginGroup
+    <objects>
+    endGroup
+    endObjectProperties
+
+Properties are one per line (name followed by value tokens), or span
+several lines between 'name {' and '}'.
+
+tokenize() labels each line of a file and parse() groups them into
+Display and EdlObject records, which keep the original lines so that a
+file can be written out again unchanged apart from deliberate edits.
+Properties are only split out of those lines when first asked for.
+iter_objects() streams the objects of a file without building the tree,
+and read_version() reads no further than the version line.
+"""
+
+SCREEN_START = 'beginScreenProperties'
+SCREEN_END = 'endScreenProperties'
+PROPS_START = 'beginObjectProperties'
+PROPS_END = 'endObjectProperties'
+GROUP_START = 'beginGroup'
+GROUP_END = 'endGroup'
+MARKERS = [SCREEN_START, SCREEN_END, PROPS_START, PROPS_END, GROUP_START, GROUP_END]
+
+GROUP_CLASS = 'activeGroupClass'
+
+# Token kinds
+TEXT = 'text'           # blank lines, comments and anything outside properties
+OBJECT = 'object'       # 'object <class>'; name is the class
+MARKER = 'marker'       # one of MARKERS; name is the marker
+PROPERTY = 'property'   # single line property; name is the property
+BLOCK = 'block'         # 'name {' starting a multi-line property
+ENTRY = 'entry'         # line inside a multi-line property; name is the property
+BLOCK_END = 'blockEnd'  # '}' ending a multi-line property
+
+
+class EdlError(Exception):
+    """ Raised when an EDL file cannot be parsed"""
+    pass
+
+
+def version(lines):
+    """ Return the EDM version of a file
+
+    Args:
+        lines: iterable of lines, only read as far as the version line
+
+    Returns:
+        tuple of ints (major, minor, release), or None if the first line
+        which is not blank or a comment does not start with a version
+    """
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        numbers = []
+        for token in stripped.split()[:3]:
+            if not token.isdigit():
+                break
+            numbers.append(int(token))
+        return tuple(numbers) if numbers else None
+    return None
+
+
+def read_version(filename):
+    """Return the EDM version of the file filename, as version()."""
+    with open(filename) as f:
+        return version(f)
+
+
+def read_properties(lines):
+    """ Collect the properties from lines of an EDL file
+
+    Returns:
+        dict of name to a list of value tokens for a single line
+        property, or to a list of the stripped lines of a multi-line one
+    """
+    props = {}
+    for kind, name, line in tokenize(lines):
+        if kind == PROPERTY:
+            props[name] = line.split()[1:]
+        elif kind == BLOCK:
+            props[name] = []
+        elif kind == ENTRY:
+            props[name].append(line.strip())
+    return props
+
+
+def tokenize(lines):
+    """ Label each line of an EDL file
+
+    Args:
+        lines: iterable of lines, from the start of a file or of an object
+
+    Yields:
+        (kind, name, line) for each line
+    """
+    in_props = False
+    block = None
+    for line in lines:
+        stripped = line.strip()
+        if block is not None:
+            if stripped == '}':
+                yield BLOCK_END, block, line
+                block = None
+            else:
+                yield ENTRY, block, line
+        elif stripped in MARKERS:
+            in_props = stripped in (SCREEN_START, PROPS_START, GROUP_END)
+            yield MARKER, stripped, line
+        elif stripped.startswith('object '):
+            yield OBJECT, stripped.split()[1], line
+        elif in_props and stripped and not stripped.startswith('#'):
+            tokens = stripped.split()
+            if tokens[-1] == '{' and len(tokens) > 1:
+                block = tokens[0]
+                yield BLOCK, block, line
+            else:
+                yield PROPERTY, tokens[0], line
+        else:
+            yield TEXT, None, line
+
+
+class EdlObject(object):
+    """ One object of an EDL file
+
+    lines runs from the end of the previous object (so includes any
+    comment before 'object <class>') to the end of the object's own
+    properties, which for a group is its beginGroup line.  The objects
+    inside a group are its children and the lines from its endGroup on
+    are its tail.
+    """
+
+    __slots__ = ('cls', 'lines', 'children', 'tail', '_props')
+
+    def __init__(self, cls, lines):
+        self.cls = cls
+        self.lines = lines
+        self.children = []
+        self.tail = []
+        self._props = None
+
+    @property
+    def props(self):
+        """Properties of this object (not of its children), as
+        read_properties().  Parsed on first use.
+        """
+        if self._props is None:
+            self._props = read_properties(self.lines)
+            self._props.update(read_properties(self.tail))
+        return self._props
+
+    def get(self, name, default=None):
+        """Return the value of a property of this object."""
+        return self.props.get(name, default)
+
+    def get_int(self, name, default=0):
+        value = self.get(name)
+        if not value:
+            return default
+        try:
+            return int(value[0])
+        except ValueError:
+            raise EdlError('Invalid {} value for {}: {}'.format(
+                name, self.cls, ' '.join(value)))
+
+    def iter_lines(self):
+        """Yield the lines of this object and of the objects in it."""
+        for line in self.lines:
+            yield line
+        for child in self.children:
+            for line in child.iter_lines():
+                yield line
+        for line in self.tail:
+            yield line
+
+    def walk(self):
+        """Yield the objects inside this one, depth first in file order."""
+        for child in self.children:
+            yield child
+            for obj in child.walk():
+                yield obj
+
+    def moved(self, x_move, y_move):
+        """Yield the lines of this object and the objects in it, with their
+        positions and points moved by (x_move, y_move).
+        """
+        moves = {'x': x_move, 'y': y_move}
+        point_moves = {'xPoints': x_move, 'yPoints': y_move}
+        for kind, name, line in tokenize(self.iter_lines()):
+            if kind == PROPERTY and name in moves:
+                line = '{} {}\n'.format(name, int(line.split()[1]) + moves[name])
+            elif kind == ENTRY and name in point_moves:
+                index, value = line.split()
+                indent = line[:len(line) - len(line.lstrip())]
+                line = '{}{} {}\n'.format(indent, index,
+                                          int(value) + point_moves[name])
+            yield line
+
+
+class Display(object):
+    """ A parsed EDL file
+
+    head holds the lines up to the end of the screen properties, objects
+    the top level objects and tail any lines after the last object.
+    """
+
+    __slots__ = ('head', 'objects', 'tail', '_screen')
+
+    def __init__(self, head, objects, tail):
+        self.head = head
+        self.objects = objects
+        self.tail = tail
+        self._screen = None
+
+    @property
+    def screen(self):
+        """Screen properties, as read_properties(), or None if the file
+        has none.  Parsed on first use.
+        """
+        if self._screen is None and self.head:
+            self._screen = read_properties(self.head)
+        return self._screen
+
+    @property
+    def version(self):
+        """EDM version of the file, as version()."""
+        return version(self.head)
+
+    def walk(self):
+        """Yield every object in the file, depth first in file order."""
+        for obj in self.objects:
+            yield obj
+            for child in obj.walk():
+                yield child
+
+    def iter_lines(self):
+        """Yield the lines of the file."""
+        for line in self.head:
+            yield line
+        for obj in self.objects:
+            for line in obj.iter_lines():
+                yield line
+        for line in self.tail:
+            yield line
+
+
+def parse(lines):
+    """ Parse an EDL file into a Display
+
+    Args:
+        lines: iterable of lines of the file, read once
+
+    Returns:
+        Display
+
+    Raises:
+        EdlError if an object or group is not terminated
+    """
+    head = []
+    objects = []
+    groups = []     # groups whose children are being read
+    current = None  # object whose properties are being read
+    pending = []    # lines not yet part of an object
+    target = pending
+    for kind, name, line in tokenize(lines):
+        if kind == OBJECT:
+            current = EdlObject(name, pending)
+            (groups[-1].children if groups else objects).append(current)
+            target = current.lines
+        elif kind == MARKER:
+            if name == GROUP_START and current is not None:
+                target.append(line)
+                groups.append(current)
+                current = None
+                target = pending = []
+                continue
+            elif name == GROUP_END and groups:
+                current = groups.pop()
+                current.tail = pending
+                target = current.tail
+            elif name == PROPS_END and current is not None:
+                target.append(line)
+                current = None
+                target = pending = []
+                continue
+            elif name == SCREEN_END and current is None and not groups:
+                target.append(line)
+                head = pending
+                target = pending = []
+                continue
+        target.append(line)
+
+    if current is not None or groups:
+        obj = current if current is not None else groups[-1]
+        raise EdlError('Unterminated {} object'.format(obj.cls))
+    return Display(head, objects, pending)
+
+
+def iter_objects(lines):
+    """ Stream the objects of an EDL file without building a Display
+
+    Objects are yielded in file order as soon as their own properties
+    have been read, so a group comes before the objects inside it.  The
+    records have no children and no tail: properties a group has after
+    its endGroup are not included.
+
+    Args:
+        lines: iterable of lines of the file
+
+    Yields:
+        (depth, EdlObject) where depth is the number of groups the object
+        is inside
+    """
+    depth = 0
+    current = None
+    for kind, name, line in tokenize(lines):
+        if kind == OBJECT:
+            current = EdlObject(name, [line])
+        elif current is not None:
+            current.lines.append(line)
+            if kind == MARKER and name in (PROPS_END, GROUP_START):
+                yield depth, current
+                current = None
+        if kind == MARKER:
+            if name == GROUP_START:
+                depth += 1
+            elif name == GROUP_END:
+                depth = max(depth - 1, 0)
+
+
+def parse_file(filename):
+    """Parse the EDL file filename into a Display."""
+    with open(filename) as f:
+        return parse(f)
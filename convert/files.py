@@ -1,9 +1,15 @@
+import edl
+import native
 import utils
+import render
+import server
 import symbols
 import glob
 
+import hashlib
 import subprocess
 import shutil
+import tempfile
 import os
 import logging as log
 
@@ -12,54 +18,247 @@ import logging as log
 NULL_FILE = open(os.devnull, 'w')
 TMP_DIR = './tmp'
 SYMBOLS_DIR = os.path.join(TMP_DIR, 'symbols')
+# Converted symbol PNGs keyed by the content of the symbol and its images
+SYMBOL_CACHE_DIR = os.path.join(TMP_DIR, 'symbol_cache')
+# How a cached symbol png was made: drawn by render.py, or a screenshot
+# of EDM taken by SYMBOL_SCRIPT
+DRAWN = 'drawn'
+SCREENSHOT = 'edm'
 # Commands in lists for subprocess
 JAVA = '/usr/bin/java'
+JAVAC = '/usr/bin/javac'
 JAR_FILE = 'res/converter.jar'
 MAIN_CLASS = 'org.csstudio.opibuilder.converter.EdmConverter'
 COLORS_VARIABLE = '-Dedm2xml.colorsFile=res/colors.list'
 SYMBOLS_VARIABLE = '-Dedm2xml.symbolsFile=res/symbols.conf'
 CONVERT_CMD = [JAVA, COLORS_VARIABLE, SYMBOLS_VARIABLE, '-cp', JAR_FILE, MAIN_CLASS]
+# Persistent converter: one JVM handles every file (see server.py).
+# SERVER_SOURCE is compiled once into SERVER_CLASS_DIR by build_server().
+SERVER_SOURCE = 'res/ConverterServer.java'
+SERVER_CLASS = 'ConverterServer'
+SERVER_CLASS_DIR = os.path.join(TMP_DIR, 'classes')
+SERVER_CMD = [JAVA, COLORS_VARIABLE, SYMBOLS_VARIABLE,
+              '-cp', os.pathsep.join([JAR_FILE, SERVER_CLASS_DIR]),
+              SERVER_CLASS, MAIN_CLASS]
+# Batch converter: one JVM per manifest of files (see convert_edl_batch())
+BATCH_CMD = SERVER_CMD
+BATCH_OK = 'OK'
+BATCH_FAIL = 'FAIL'
 UPDATE_CMD = ['edm', '-convert']
 SYMBOL_SCRIPT = os.path.join(os.getcwd(), 'res/auto-symb.sh')
 SYMBOL_TO_PNG_CMD = [SYMBOL_SCRIPT]
+# Code which turns a symbol file into a png, as part of the symbol cache key
+SYMBOL_CODE_MODULES = [render, symbols, edl]
 
+_symbol_code_digest = None
+
+# Shared converter server, if enabled by start_server()
+_server = None
+# Convert simple screens in-process, if enabled by use_native()
+_native = False
 
 
 class OldEdlError(Exception):
     pass
 
 
-def convert_symbol(symbol_file, destinations):
+def build_server():
     """
-    Convert an EDM symbol file into the png used by the CSS symbol widget.
-    This uses an external shell script.
+    Compile SERVER_SOURCE into SERVER_CLASS_DIR, unless the compiled class
+    is already newer than the source.  Needs a JDK providing JAVAC.
+
+    Return True if the compiled class is available.
     """
-    log.debug("Converting symbol %s", symbol_file)
-    if not os.path.exists(SYMBOLS_DIR):
-        os.makedirs(SYMBOLS_DIR)
+    class_file = os.path.join(SERVER_CLASS_DIR, SERVER_CLASS + '.class')
+    try:
+        if os.path.getmtime(class_file) >= os.path.getmtime(SERVER_SOURCE):
+            return True
+    except OSError:
+        pass
+    if not os.path.exists(SERVER_CLASS_DIR):
+        os.makedirs(SERVER_CLASS_DIR)
+    command = [JAVAC, '-cp', JAR_FILE, '-d', SERVER_CLASS_DIR, SERVER_SOURCE]
+    log.info('Compiling converter server: %s', ' '.join(command))
+    try:
+        returncode = subprocess.call(command)
+    except OSError as e:
+        log.warn('Cannot run %s: %s', JAVAC, e)
+        return False
+    if returncode != 0:
+        log.warn('Compiling %s failed with code %s.', SERVER_SOURCE, returncode)
+        return False
+    return True
 
-    temp_file = os.path.join(SYMBOLS_DIR, os.path.basename(symbol_file))
-    utils.make_writeable(temp_file)
-    shutil.copyfile(symbol_file, temp_file)
-    png_files = glob.glob(os.path.join(os.path.dirname(symbol_file), '*.png'))
+
+def start_server():
+    """
+    Route all subsequent EDL conversions through one persistent converter
+    JVM.  The JVM itself is only started when the first file is converted.
+    """
+    global _server
+    if _server is None:
+        _server = server.ConverterServer(SERVER_CMD)
+
+
+def use_native(enabled=True):
+    """
+    Convert EDL files which only use the widgets handled by convert.native
+    in-process, using the Java converter only for the others.
+    """
+    global _native
+    _native = enabled
+
+
+def native_enabled():
+    return _native
+
+
+def stop_server():
+    """
+    Shut down the persistent converter JVM and return to running one
+    java process per file.
+    """
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+def reset_server_after_fork():
+    """
+    Give a newly forked worker process its own converter server.  The
+    parent's server process, if any, must not be shared between processes.
+    """
+    global _server
+    if _server is not None:
+        _server = server.ConverterServer(SERVER_CMD)
+
+
+def _file_hash(filepath):
+    try:
+        with open(filepath, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return ''
+
+
+def symbol_code_digest():
+    """
+    Return a digest of the code which converts symbols to pngs: the
+    modules in SYMBOL_CODE_MODULES and SYMBOL_SCRIPT.  Computed once per
+    process.
+    """
+    global _symbol_code_digest
+    if _symbol_code_digest is None:
+        sha = hashlib.sha1()
+        for filepath in [utils.source_file(m) for m in SYMBOL_CODE_MODULES] + [SYMBOL_SCRIPT]:
+            sha.update(os.path.basename(filepath) + '\0' + _file_hash(filepath))
+        _symbol_code_digest = sha.hexdigest()
+    return _symbol_code_digest
+
+
+def symbol_key(symbol_file):
+    """
+    Return a key identifying the png converted from symbol_file: a hash of
+    the symbol file, the png files next to it (which it may display), the
+    EDM colour list and the code which does the conversion.
+    """
+    # The symbol's own name does not affect the png; images are found by name.
+    sha = hashlib.sha1(_file_hash(symbol_file))
+    sha.update(_file_hash(render.COLORS_FILE))
+    sha.update(symbol_code_digest())
+    png_files = sorted(glob.glob(os.path.join(os.path.dirname(symbol_file), '*.png')))
     for png_file in png_files:
-        shutil.copyfile(png_file, os.path.join(SYMBOLS_DIR, os.path.basename(png_file)))
-    # Update EDM file if necessary.
-    if is_old_edl(temp_file):
-         update_edl(temp_file, in_place=True)
-    # Compress EDM symbol file to minimum rectangle.
+        sha.update(os.path.basename(png_file) + '\0' + _file_hash(png_file))
+    return sha.hexdigest()
+
+
+def _cached_symbol(key, modes):
+    """
+    Return (path, width) of the cached png for key made in one of modes
+    (DRAWN or SCREENSHOT), or None.
+    """
+    for mode in modes:
+        cache_dir = os.path.join(SYMBOL_CACHE_DIR, key, mode)
+        try:
+            entries = [e for e in os.listdir(cache_dir) if e.endswith('.png')]
+        except OSError:
+            continue
+        if entries:
+            return os.path.join(cache_dir, entries[0]), entries[0][:-len('.png')]
+    return None
+
+
+def _cache_symbol(key, png_file, width, mode):
+    """
+    Store a converted png, made in mode, in the symbol cache.  Written via
+    a rename so that concurrent conversions never see a partial file.
+    """
+    cache_dir = os.path.join(SYMBOL_CACHE_DIR, key, mode)
     try:
-        symbols.compress(temp_file)
-    except symbols.SymbolError as e:
-        log.error(e)
-        return
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_file = os.path.join(cache_dir, '{}.tmp'.format(os.getpid()))
+        shutil.copyfile(png_file, tmp_file)
+        os.rename(tmp_file, os.path.join(cache_dir, '{}.png'.format(width)))
+    except (IOError, OSError) as e:
+        log.warn('Failed to cache symbol png %s: %s', png_file, e)
+
+
+def _install(source, target):
+    """
+    Hard link source to target if possible, otherwise copy it.  Any
+    existing target is replaced rather than written through, so the
+    cached file is never modified.
+    """
+    if os.path.lexists(target):
+        utils.make_writeable(target)
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def convert_symbol(symbol_file, destinations, scratch_dir=SYMBOLS_DIR, use_script=True):
+    """
+    Convert an EDM symbol file into the png used by the CSS symbol widget.
+    The symbol is drawn directly if possible, otherwise by an external
+    shell script which screenshots EDM.
+
+    The shell script always works in SYMBOLS_DIR, so only one conversion
+    using it may run at a time.  Conversions which only draw the symbol
+    may run concurrently, each with its own scratch_dir.
+
+    Converted pngs are kept in SYMBOL_CACHE_DIR, so a symbol with the same
+    content (in another module or module version, or in a later run) is
+    not converted again.
+
+    Args:
+        symbol_file: EDM symbol file
+        destinations: directories to copy the png to
+        scratch_dir: directory for intermediate files
+        use_script: if False, raise render.RenderError rather than run
+            the shell script
+
+    Returns:
+        png filename, or None if the symbol could not be converted
+    """
+    log.debug("Converting symbol %s", symbol_file)
+    key = symbol_key(symbol_file)
+    # A screenshot is only used where EDM could have been run to make it
+    cached = _cached_symbol(key, [DRAWN, SCREENSHOT] if use_script else [DRAWN])
+    if cached is not None:
+        source, width = cached
+        log.info('Using cached png for symbol %s', symbol_file)
+    else:
+        source, width, mode = _convert_symbol_png(symbol_file, scratch_dir, use_script)
+        if source is None:
+            return
+        _cache_symbol(key, source, width, mode)
 
-    command = SYMBOL_TO_PNG_CMD + [temp_file]
-    out = subprocess.check_output(" ".join(command), shell=True)
-    # copy png to right location
-    relfilename = out.strip()
-    filename = os.path.basename(relfilename)
-    source = os.path.join(os.getcwd(), relfilename)
+    # Name the png after this symbol file, whichever file it was made from
+    filename = os.path.splitext(symbols.new_name(os.path.basename(symbol_file), width))[0] + '.png'
 
     # Copy the converted png to all specified destinations
     for destination in destinations:
@@ -68,14 +267,58 @@ def convert_symbol(symbol_file, destinations):
             utils.make_writeable(destination)
             absfilename = os.path.join(destination, filename)
 
-            utils.make_writeable(absfilename)
-            shutil.copyfile(source, absfilename)
+            _install(source, absfilename)
         except Exception as e:
             log.error("Failed copying file: %s", str(e))
 
     return filename
 
 
+def _convert_symbol_png(symbol_file, scratch_dir, use_script):
+    """
+    Convert a symbol file to png in scratch_dir, as convert_symbol().
+
+    Returns:
+        (png file, width of one symbol, DRAWN or SCREENSHOT) or
+        (None, None, None) on failure
+    """
+    if not os.path.exists(scratch_dir):
+        os.makedirs(scratch_dir)
+
+    temp_file = os.path.join(scratch_dir, os.path.basename(symbol_file))
+    utils.make_writeable(temp_file)
+    shutil.copyfile(symbol_file, temp_file)
+    png_files = glob.glob(os.path.join(os.path.dirname(symbol_file), '*.png'))
+    for png_file in png_files:
+        shutil.copyfile(png_file, os.path.join(scratch_dir, os.path.basename(png_file)))
+    # Update EDM file if necessary.
+    if is_old_edl(temp_file):
+         update_edl(temp_file, in_place=True)
+    # Compress EDM symbol file to minimum rectangle.
+    try:
+        compressed_file = symbols.compress(temp_file)
+    except symbols.SymbolError as e:
+        log.error(e)
+        return None, None, None
+
+    source = os.path.splitext(compressed_file)[0] + '.png'
+    mode = DRAWN
+    try:
+        render.render_file(compressed_file, source)
+    except render.RenderError as e:
+        if not use_script:
+            raise
+        log.info('Cannot draw %s (%s); using EDM', symbol_file, e)
+        command = SYMBOL_TO_PNG_CMD + [temp_file]
+        out = subprocess.check_output(" ".join(command), shell=True)
+        source = os.path.join(os.getcwd(), out.strip())
+        mode = SCREENSHOT
+
+    # symbols.compress appends the width to the name (eg x-33.edl)
+    width = os.path.splitext(compressed_file)[0].rsplit('-', 1)[1]
+    return source, width, mode
+
+
 def is_old_edl(filename):
     """Check if .edl file is older than version 4 of EDM.
 
@@ -85,14 +328,8 @@ def is_old_edl(filename):
     there are very few old-style files.  Typically files without versions are
     partial or generated files.
     """
-    with open(filename) as edm_file:
-        for line in edm_file.readlines():
-            if line.isspace() or line.strip().startswith('#'):
-                continue
-            try:
-                return int(line.split()[0]) < 4
-            except ValueError:  # no version found
-                return False
+    version = edl.read_version(filename)
+    return version is not None and version[0] < 4
 
 
 def update_edl(filename, in_place=False):
@@ -134,10 +371,20 @@ def convert_edl(filename, destination):
 
     utils.make_writeable(destination)
     log.debug('Converting %s to %s', filename, destination)
-    command = CONVERT_CMD + [filename, destination]
-    log.debug('Conversion command {}'.format(' '.join(command)))
-
-    returncode = subprocess.call(command)
+    if _native and native.convert(filename, destination):
+        log.info('Successfully  converted {} in-process'.format(filename))
+        return True
+    returncode = None
+    if _server is not None:
+        try:
+            returncode = _server.convert(filename, destination)
+        except server.ServerError as e:
+            log.warn('%s; converting with a JVM per file.', e)
+            stop_server()
+    if returncode is None:
+        command = CONVERT_CMD + [filename, destination]
+        log.debug('Conversion command {}'.format(' '.join(command)))
+        returncode = subprocess.call(command)
     if returncode != 0:
         log.warn('Conversion of {0} failed with code {1}.'.format(filename, returncode))
         success = False
@@ -146,3 +393,91 @@ def convert_edl(filename, destination):
         success = True
 
     return success
+
+
+def convert_edl_batch(pairs):
+    """
+    Convert many .edl files in a single JVM.
+
+    The (source, destination) pairs are written to a manifest which is
+    handed to the converter in batch mode; one result is reported back per
+    file.  Files in the old EDM format are not sent to the converter, nor
+    are files converted in-process if use_native() is enabled.
+
+    If the JVM exits part way through, the file it stopped at is converted
+    on its own with convert_edl() and the files after it are sent to a new
+    batch, so that every file still gets its own result.
+
+    Args:
+        pairs: list of (source .edl file, destination .opi file)
+
+    Returns:
+        (results, old_edl_files) where results is a dict
+        source -> True if conversion successful, False otherwise
+    """
+    results = {}
+    old_edl_files = []
+    pending = []
+    for filename, destination in pairs:
+        if is_old_edl(filename):
+            old_edl_files.append(filename)
+            continue
+        utils.make_writeable(destination)
+        if _native and native.convert(filename, destination):
+            log.info('Successfully  converted {} in-process'.format(filename))
+            results[filename] = True
+            continue
+        results[filename] = False
+        pending.append((filename, destination))
+
+    while pending:
+        reported = _run_batch(pending, results)
+        remaining = [(f, d) for f, d in pending if f not in reported]
+        if not remaining:
+            break
+        filename, destination = remaining[0]
+        log.warn('Batch converter stopped at {}; converting it separately.'.format(
+            filename))
+        results[filename] = convert_edl(filename, destination)
+        pending = remaining[1:]
+
+    return results, old_edl_files
+
+
+def _run_batch(pairs, results):
+    """
+    Convert (source, destination) pairs in one batch JVM, recording the
+    result of each file reported in results.
+
+    Return the set of sources a result was reported for.
+    """
+    if not os.path.exists(TMP_DIR):
+        os.makedirs(TMP_DIR)
+    fd, manifest = tempfile.mkstemp(prefix='manifest-', dir=TMP_DIR)
+    reported = set()
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.writelines('{}\t{}\n'.format(*pair) for pair in pairs)
+        command = BATCH_CMD + [manifest]
+        log.info('Converting batch of %s files', len(pairs))
+        log.debug('Conversion command {}'.format(' '.join(command)))
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        for line in iter(process.stdout.readline, ''):
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 2 or parts[1] not in results:
+                log.warn('Unexpected converter output: %s', line.strip())
+                continue
+            reported.add(parts[1])
+            if parts[0] == BATCH_OK:
+                log.info('Successfully  converted {}'.format(parts[1]))
+                results[parts[1]] = True
+            else:
+                reason = parts[2] if len(parts) > 2 else ''
+                log.warn('Conversion of {0} failed: {1}'.format(parts[1], reason))
+        returncode = process.wait()
+        if returncode != 0:
+            log.warn('Batch conversion exited with code {}.'.format(returncode))
+    finally:
+        os.remove(manifest)
+
+    return reported
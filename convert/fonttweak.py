@@ -6,6 +6,7 @@ import xml.etree.ElementTree as ET
 import os
 import logging as log
 
+import catalogue
 import utils
 
 
@@ -20,14 +21,18 @@ def change_font(font_element):
         font_element.set("fontName", FONT_MAP[name])
 
 
+def transform(root):
+    for font_element in root.findall(".//fontdata"):
+        change_font(font_element)
+
+
 def parse(filepath):
     try:
         if os.path.exists(filepath) or os.access(filepath, os.R_OK):
             tree = ET.parse(filepath)
             root = tree.getroot()
 
-            for font_element in root.findall(".//fontdata"):
-                change_font(font_element)
+            transform(root)
 
             # write the new tree out to the same file
             utils.make_writeable(filepath)
@@ -39,7 +44,7 @@ def parse(filepath):
 
 
 def build_filelist(basepath):
-    """ Just find all OPI files.
+    """ Find all OPI files which may need font changes.
 
         Arguments:
             basepath - root of search
@@ -47,4 +52,5 @@ def build_filelist(basepath):
             iterator over relative filepaths
     """
     log.info("Building fonttweak list.")
-    return utils.find_opi_files(basepath)
+    opis = catalogue.scan(basepath, catalogue.CATALOGUE_FILE)
+    return opis.files(catalogue.FONTS)
@@ -81,16 +81,22 @@ def set_grouping_container_size(container_widget):
     return get_container_size(container_widget)
 
 
-def parse(filepath):
-    tree = et.parse(filepath)
-    root = tree.getroot()
-
-    # Set dimensions for all grouping containers
+def transform(root):
+    '''
+    Set dimensions for all grouping containers in the tree.
+    '''
     for child in root:
         if child.tag == 'widget':
             if child.attrib['typeId'] == GROUPING_CONTAINER:
                 set_grouping_container_size(child)
 
+
+def parse(filepath):
+    tree = et.parse(filepath)
+    root = tree.getroot()
+
+    transform(root)
+
     # Overwrite the old file with the new tree
     utils.make_writeable(filepath)
     tree.write(filepath, encoding='utf-8', xml_declaration=True)
@@ -93,6 +93,32 @@ def get_updated_cmds(cmds, cfg):
     return cmd_dict
 
 
+def entry_points(cmds):
+    """Find the EDM screens opened by launcher commands.
+
+    Args:
+        cmds: list of LauncherCommand objects
+
+    Returns:
+        dict {module name: set of EDL files relative to the module root}
+    """
+    points = {}
+    for cmd in cmds:
+        try:
+            cmd.interpret()
+            _, name, version, rel_path = css_utils.parse_module_name(cmd.path_to_run)
+        except (spoof.SpoofError, ValueError) as e:
+            log.info('Failed interpreting command {}: {}'.format(cmd.cmd, e))
+            continue
+        if version is None or not rel_path:
+            log.info('No module screen started by command %s', cmd.cmd)
+            continue
+        # Switch back to edl extension
+        points.setdefault(name, set()).add(rel_path[:-3] + 'edl')
+
+    return points
+
+
 def _get_port(edm_args):
     """ Attempt to parse the PORT from the EDM command arguments.
         Two cases are handled:
@@ -76,6 +76,9 @@ def create_new_clicker(node, x, y):
     children of the node and copy them to the new widget.
 
     Change position to that relative to any grouping containers.
+
+    Elements are copied rather than shared with the original widget, since
+    later post-process steps may modify the same in-memory tree.
     """
 
     if node.attrib['typeId'] == MENU_BUTTON:
@@ -99,30 +102,27 @@ def create_new_clicker(node, x, y):
 
         pvtag = node.find('pv_name')
         if pvtag is not None:
-            nnode.append(pvtag)
+            nnode.append(copy.deepcopy(pvtag))
 
         new_xtag = et.SubElement(nnode, 'x')
         xtag = node.find('x')
         new_xtag.text = str(int(xtag.text) + x)
-        nnode.append(new_xtag)
+        nnode.append(copy.deepcopy(new_xtag))
 
         new_ytag = et.SubElement(nnode, 'y')
         ytag = node.find('y')
         new_ytag.text = str(int(ytag.text) + y)
-        nnode.append(new_ytag)
+        nnode.append(copy.deepcopy(new_ytag))
 
         widthtag = node.find('width')
-        nnode.append(widthtag)
+        nnode.append(copy.deepcopy(widthtag))
         heighttag = node.find('height')
-        nnode.append(heighttag)
+        nnode.append(copy.deepcopy(heighttag))
 
     return nnode
 
 
-def parse(path):
-    tree = et.parse(path)
-    root = tree.getroot()
-
+def transform(root):
     clickables = find_clickables(root, 0, 0)
     log.info("There are %s clickables.", len(clickables))
 
@@ -132,6 +132,13 @@ def parse(path):
 
     root.extend(newcs)
 
+
+def parse(path):
+    tree = et.parse(path)
+    root = tree.getroot()
+
+    transform(root)
+
     # write the new tree out to the same file
     utils.make_writeable(path)
     tree.write(path, encoding='utf-8', xml_declaration=True)
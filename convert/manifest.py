@@ -0,0 +1,173 @@
+"""
+Record of the inputs used to produce each output of a module conversion.
+
+The manifest lives in the module's OPI directory and maps each source file
+(by its path relative to the EDL directory) to a digest of everything its
+output depends on: the source itself and, for EDL files, the converter, its
+configuration files, the post-process code, the module's file indexes and
+whether the source is one of the module's layer or group files.  On a rerun an output is
+only regenerated if it is missing or its digest has changed.
+"""
+import hashlib
+import json
+import logging as log
+import os
+
+import colourtweak
+import edl
+import files
+import fonttweak
+import groups
+import layers
+import mmux
+import native
+import pathindex
+import paths
+import pipeline
+import rules
+import utils
+
+MANIFEST_NAME = '.conversion-manifest.json'
+MANIFEST_VERSION = 1
+
+# Files read by the converter when turning an EDL file into an OPI file
+CONVERTER_FILES = [files.JAR_FILE,
+                   'res/colors.list',
+                   'res/symbols.conf',
+                   colourtweak.COLOR_DEF_FILE,
+                   os.path.join(os.path.dirname(colourtweak.COLOR_DEF_FILE),
+                                colourtweak.COLOR_ROLES_FILE)]
+# Modules applying the post-process steps to converted OPI files
+POST_PROCESS_MODULES = [paths, pathindex, pipeline, layers, groups,
+                        colourtweak, fonttweak, rules, mmux]
+# module.py chooses the post-process steps applied to each file.  It
+# imports this module, so is named by file rather than imported.
+MODULE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'module.py')
+# Modules converting EDL files in-process, if files.use_native() is enabled
+NATIVE_MODULES = [native, edl]
+
+_converter_digest = None
+
+
+def file_digest(filepath):
+    """Return the SHA-1 hex digest of the contents of filepath."""
+    sha = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def converter_digest():
+    """Return a digest of the converter, its configuration and the
+    post-process code, including the in-process converter if it is
+    enabled.  Computed once per process.
+
+    A missing file contributes its name only, so that its later
+    appearance changes the digest.
+    """
+    global _converter_digest
+    if _converter_digest is None:
+        sha = hashlib.sha1()
+        inputs = CONVERTER_FILES + [utils.source_file(m) for m in POST_PROCESS_MODULES]
+        inputs.append(MODULE_FILE)
+        if files.native_enabled():
+            inputs += [utils.source_file(m) for m in NATIVE_MODULES]
+        for filepath in inputs:
+            sha.update(os.path.basename(filepath))
+            try:
+                sha.update(file_digest(filepath))
+            except (IOError, OSError) as e:
+                log.warn('Cannot read conversion input %s: %s', filepath, e)
+        _converter_digest = sha.hexdigest()
+    return _converter_digest
+
+
+def index_digest(*indexes):
+    """Return a digest of the contents of file indexes, as from
+    paths.index_paths(), used to correct paths in converted files.
+    """
+    sha = hashlib.sha1()
+    for index in indexes:
+        sha.update(repr(sorted(index.iteritems())))
+    return sha.hexdigest()
+
+
+def digest(source, edl_file, layer=False, group=False, indexes_digest=None):
+    """Return a digest of the inputs to the output produced from source.
+
+    Args:
+        source: file to be converted or copied
+        edl_file: True if source is converted rather than copied
+        layer: True if source is one of the module's layer files
+        group: True if source is one of the module's group files
+        indexes_digest: index_digest() of the file indexes of the module
+    """
+    if not edl_file:
+        return file_digest(source)
+    sha = hashlib.sha1(converter_digest())
+    sha.update(file_digest(source))
+    sha.update(repr((layer, group, indexes_digest)))
+    return sha.hexdigest()
+
+
+class Manifest(object):
+    """Digests of the outputs of one module conversion.
+
+    Entries read from disk are only consulted; entries recorded during
+    this run replace them when the manifest is saved, so files which were
+    not converted successfully (or no longer exist) drop out.
+    """
+
+    def __init__(self, filepath, root):
+        """
+        Args:
+            filepath: manifest file
+            root: directory to which source paths are made relative
+        """
+        self.filepath = filepath
+        self.root = root
+        self._previous = self._load()
+        self._current = {}
+
+    def _load(self):
+        try:
+            with open(self.filepath) as f:
+                contents = json.load(f)
+        except IOError:
+            return {}
+        except ValueError as e:
+            log.warn('Ignoring invalid manifest %s: %s', self.filepath, e)
+            return {}
+        if contents.get('version') != MANIFEST_VERSION:
+            log.info('Ignoring manifest %s of different version', self.filepath)
+            return {}
+        return contents.get('outputs', {})
+
+    def is_current(self, source, source_digest):
+        """Return True if the output of source was last produced from inputs
+        with the given digest.
+        """
+        return self._previous.get(self._key(source)) == source_digest
+
+    def record(self, source, source_digest):
+        """Note that the output of source is up to date."""
+        self._current[self._key(source)] = source_digest
+
+    def _key(self, source):
+        return os.path.relpath(source, self.root)
+
+    def __len__(self):
+        return len(self._current)
+
+    def save(self):
+        """Write the recorded entries, replacing the previous manifest."""
+        contents = {'version': MANIFEST_VERSION, 'outputs': self._current}
+        tmp_path = self.filepath + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(contents, f, indent=1, sort_keys=True)
+            os.rename(tmp_path, self.filepath)
+        except (IOError, OSError) as e:
+            log.warn('Failed to write manifest %s: %s', self.filepath, e)
@@ -15,11 +15,9 @@ Process:
 3. Replace the reference with the appropriate expression.
 '''
 import os
-import subprocess
 import xml.etree.ElementTree as ET
 import logging as log
 
-import mmux
 import utils
 
 MENU_MUX_ID = 'org.csstudio.opibuilder.widgets.edm.menumux'
@@ -176,41 +174,37 @@ def replace_symbols(node, symbols):
     return warning
 
 
+def transform(root, filepath=None):
+    """
+    Replace menu mux symbols in an OPI tree with local PVs.
+
+    Arguments:
+        root - root element of the OPI file
+        filepath - file name used when reporting problems
+    Returns:
+        True if any menu mux symbols were found
+    """
+    mm_symbols = find_mm_symbols(root)
+    if mm_symbols:
+        log.info('There are %s mm_symbols:', len(mm_symbols))
+        log.info('%s', mm_symbols)
+
+        warning = replace_symbols(root, mm_symbols)
+        if warning:
+            log.warn(">>> Manual post-processing required: '%s' contains Label with PV-value text <<<", filepath)
+
+    return bool(mm_symbols)
+
+
 def parse(filepath):
     if os.path.exists(filepath) or os.access(filepath, os.R_OK):
         tree = ET.parse(filepath)
         root = tree.getroot()
 
-        mm_symbols = find_mm_symbols(root)
-        if mm_symbols:
-            log.info('There are %s mm_symbols:', len(mm_symbols))
-            log.info('%s', mm_symbols)
-
-            warning = replace_symbols(root, mm_symbols)
-            if warning:
-                log.warn(">>> Manual post-processing required: '%s' contains Label with PV-value text <<<", filepath)
-
+        if transform(root, filepath):
             # write the new tree out to the same file
             utils.make_writeable(filepath)
             tree.write(filepath, encoding='utf-8', xml_declaration=True)
     else:
         log.warn("Skipping %s, file not found", filepath)
 
-
-def build_filelist(basepath):
-    """ Execute a grep on the basepath to find all files that contain a menumux
-        control
-
-        Arguments:
-            basepath - root of search
-        Returns:
-            iterator over relative filepaths
-    """
-    log.debug("Building menu mux list.")
-    proc = subprocess.Popen("find " + basepath + " -name \"*.opi\" | xargs grep -sl " + mmux.MENU_MUX_ID,
-                            stdout=subprocess.PIPE,
-                            shell=True)
-
-    for line in iter(proc.stdout.readline, ''):
-        filepath = line.rstrip()
-        yield filepath
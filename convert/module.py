@@ -1,23 +1,69 @@
+import functools
 import logging as log
+import multiprocessing
 import os
 import paths
 import shutil
 
 import colourtweak
+import dependencies
 import files
 import fonttweak
 import rules
 import groups
 import layers
+import manifest
 import mmux
+import pipeline
+import references
 import utils
 
-from dls_css_utils import dependency, coordinates, utils as css_utils
+from dls_css_utils import coordinates, utils as css_utils
 
 EDL_EXTENSION = 'edl'
 OPI_EXTENSION = 'opi'
 
 
+# State of a worker process converting files for one module
+_worker_module = None
+_worker_log = None
+
+
+def _init_worker(mod):
+    """Prepare a worker process to convert files of the given module."""
+    global _worker_module, _worker_log
+    _worker_module = mod
+    _worker_log = utils.RecordBuffer()
+    log.getLogger().handlers = [_worker_log]
+    files.reset_server_after_fork()
+
+
+def _convert_task(task):
+    """Convert one file in a worker process.
+
+    Args:
+        task: (source, target, depth, force) as for Module._convert_one
+
+    Returns:
+        (source, digest as returned by Module._convert_one,
+         True if source is an old-style EDL file, log records)
+    """
+    source, target, depth, force = task
+    _worker_log.records = []
+    old_edl = False
+    source_digest = None
+    try:
+        source_digest = _worker_module._convert_one(source, target, depth, force)
+    except files.OldEdlError:
+        old_edl = True
+    return source, source_digest, old_edl, _worker_log.records
+
+
+def opi_target(target):
+    """Return the OPI file name corresponding to an EDL file name."""
+    return target[:-len(EDL_EXTENSION)] + OPI_EXTENSION
+
+
 class Module(object):
     """Object representing one IOC or support module."""
 
@@ -30,7 +76,7 @@ class Module(object):
             mirror_root: root of target filesystem
         """
         # force colour tweak to parse the lookup table
-        colourtweak.init()
+        colourtweak.ensure_init()
 
         self.coords = coords
         self.edl_dir = module_cfg.edl_dir
@@ -46,6 +92,17 @@ class Module(object):
         self.file_dict = {}
         # Used for locating an executable given only its name.
         self.path_dict = {}
+        # Digests of the inputs of each output, loaded by _convert_all()
+        self.manifest = None
+        # references.ReferenceGraph of the module's EDL files, given to
+        # convert() or read as each file is converted
+        self.graph = None
+        # manifest.index_digest() of file_dict and path_dict, made by
+        # _convert_all()
+        self.indexes_digest = None
+        # paths.PathResolvers for file_dict then path_dict, applied in that
+        # order; made by _convert_all()
+        self.resolvers = None
 
         prod_path = coordinates.as_path(coords, False)
         # prod_path[1:] strips leading / to allow creation of shadow
@@ -65,9 +122,8 @@ class Module(object):
         Returns:
             dict {name: coords} for all module dependencies
         """
-        dp = dependency.DependencyParser.from_coord(
+        return dependencies.find_dependencies(
             self.coords, mirror_root=self.mirror_root, additional_depends=self.extra_deps)
-        return dp.find_dependencies()
 
     def get_path_dirs(self):
         """
@@ -111,11 +167,19 @@ class Module(object):
 
         return file_list
 
-    def convert(self, force):
+    def convert(self, force, batch=False, jobs=1, screens=None, graph=None):
         """Convert entire module.
 
         Args:
-            force: Reconvert if destination exists
+            force: Reconvert even if destination is up to date
+            batch: Convert all EDL files in one converter invocation
+            jobs: Number of worker processes converting files
+            screens: if given, set of the only EDL files to convert
+            graph: references.ReferenceGraph of the module's EDL files, if
+                already read
+
+        Returns:
+            List of old-style EDL files which were not converted
         """
         origin = self.get_edl_path()
         destination = self.get_opi_path()
@@ -125,7 +189,8 @@ class Module(object):
             # directory already exists
             pass
 
-        self._convert_all(origin, destination, force)
+        return self._convert_all(origin, destination, force, batch, jobs, screens,
+                                 graph)
 
     def __str__(self):
         return 'Module at coordinates {}'.format(self.coords)
@@ -145,48 +210,119 @@ class Module(object):
 
             File metadata is preserved for non-EDL files
 
+            The file is skipped if the target exists and the manifest shows
+            that it was produced from the same inputs.
+
         Args:
             source: source file (relative path)
             target: target file (relative path)
             depth: file 'depth' relative to eclipse link base
             force: if True, force reconversion and copy
+
+        Returns:
+            digest of the inputs of target if it is up to date, else None
         """
         log.debug('Handling file: %s to %s', source, target)
         edl_file = source.endswith(EDL_EXTENSION)
         if edl_file:
-            target = target[:-len(EDL_EXTENSION)] + OPI_EXTENSION
+            target = opi_target(target)
 
+        source_digest = self._digest(source, edl_file)
         target_exists = os.path.exists(target)
-        if not force and target_exists:
-            log.info('Skipping existing file {}'.format(target))
+        if self._up_to_date(source, target, source_digest, force):
+            log.info('Skipping up-to-date file {}'.format(target))
+        elif edl_file:
+            self._check_references(source)
+            if not files.convert_edl(source, target):
+                return None
+            self._post_process(source, target, depth)
         else:
-            if edl_file:
-                if files.convert_edl(source, target):
-                    paths.update_opi_file(target, depth, self.file_dict,
-                                          self.coords.module, use_rel=False)
-                    paths.update_opi_file(target, depth, self.path_dict,
-                                          self.coords.module, use_rel=True)
-                    if self.is_layer_file(source):
-                        layers.parse(target)
-                    if self.is_group_file(source):
-                        groups.parse(target)
-                    colourtweak.parse(target)
-                    fonttweak.parse(target)
-                    rules.parse(target)
-                    if utils.grep(target, mmux.MENU_MUX_ID):
-                        mmux.parse(target)
-            else:
-                try:
-                    # don't attempt to copy a file onto itself
-                    if source != target:
-                        # if not writable before copy an error will be raised
-                        # and file will not update
-                        if target_exists:
-                            utils.make_writeable(target)
+            try:
+                # don't attempt to copy a file onto itself
+                if source != target:
+                    # if not writable before copy an error will be raised
+                    # and file will not update
+                    if target_exists:
+                        utils.make_writeable(target)
+
+                    shutil.copy2(source, target)
+            except shutil.Error as e:
+                log.warn('Error trying to copy {}: {}'.format(source, e))
+                return None
+
+        return source_digest
+
+    def _digest(self, source, edl_file):
+        """Return the manifest digest of the inputs to the output of source."""
+        return manifest.digest(source, edl_file,
+                               layer=self.is_layer_file(source),
+                               group=self.is_group_file(source),
+                               indexes_digest=self.indexes_digest)
+
+    def _up_to_date(self, source, target, source_digest, force):
+        """Determine if target need not be regenerated from source.
 
-                        shutil.copy2(source, target)
-                except shutil.Error as e:
-                    log.warn('Error trying to copy {}: {}'.format(source, e))
+        Args:
+            source: source file
+            target: converted or copied file
+            source_digest: digest of the current inputs of target
+            force: if True, nothing is up to date
+
+        Returns:
+            True if target exists and was produced from the same inputs
+        """
+        return (not force and os.path.exists(target) and
+                self.manifest.is_current(source, source_digest))
+
+    def _post_process(self, source, target, depth):
+        """ Update paths in a newly converted OPI file and apply the
+            post-process tweaks.
+
+            The file is parsed once and every step is applied to the
+            in-memory tree before it is written back.
+
+        Args:
+            source: source EDL file
+            target: converted OPI file
+            depth: file 'depth' relative to eclipse link base
+        """
+        pp = pipeline.Pipeline()
+        pp.register(functools.partial(paths.update_tree, depth=depth,
+                                      resolvers=self.resolvers))
+        if self.is_layer_file(source):
+            pp.register(layers.transform)
+        if self.is_group_file(source):
+            pp.register(groups.transform)
+        pp.register(colourtweak.transform)
+        pp.register(fonttweak.transform)
+        pp.register(rules.transform)
+        pp.register(functools.partial(mmux.transform, filepath=target))
+        pp.apply(target)
+
+    def _convert_batch(self, jobs):
+        """ Convert EDL files in one converter invocation, then post-process
+            each successfully converted file.
+
+        Args:
+            jobs: list of (source, target, depth, digest) with target an
+                OPI file and digest as from manifest.digest()
+
+        Returns:
+            List of old-style EDL files which were not converted
+        """
+        pairs = [(source, target) for source, target, _, _ in jobs]
+        for source, _ in pairs:
+            self._check_references(source)
+        results, old_edl_files = files.convert_edl_batch(pairs)
+        for source in old_edl_files:
+            log.warn('Skipping old edl file %s', source)
+
+        for source, target, depth, source_digest in jobs:
+            if results.get(source):
+                self._post_process(source, target, depth)
+                self.manifest.record(source, source_digest)
+
+        return old_edl_files
 
     def is_layer_file(self, f):
         """Determine if file requires post-process 'layer' manipulation.
@@ -210,18 +346,104 @@ class Module(object):
         """
         return f in self.group_files
 
-    def _convert_all(self, origin, destination, force):
+    def _convert_files(self, tasks, force, jobs):
+        """ Convert or copy files, using a pool of worker processes if
+            jobs is greater than one.
+
+            Log output from the workers is emitted in the order of tasks.
+
+        Args:
+            tasks: list of (source, target, depth) as for _convert_one
+            force: if True, force reconversion and copy
+            jobs: number of worker processes
+
+        Returns:
+            List of old-style EDL files which were not converted
+        """
+        old_edl_files = []
+        if jobs > 1 and len(tasks) > 1:
+            log.info('Converting %s files with %s processes', len(tasks), jobs)
+            pool = multiprocessing.Pool(jobs, _init_worker, (self,))
+            try:
+                pool_tasks = [task + (force,) for task in tasks]
+                for source, source_digest, old_edl, records in pool.imap(
+                        _convert_task, pool_tasks):
+                    for record in records:
+                        log.getLogger().handle(record)
+                    if old_edl:
+                        log.warn('Skipping old edl file %s', source)
+                        old_edl_files.append(source)
+                    elif source_digest is not None:
+                        self.manifest.record(source, source_digest)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for source, target, depth in tasks:
+                try:
+                    source_digest = self._convert_one(source, target, depth, force)
+                except files.OldEdlError:
+                    log.warn('Skipping old edl file %s', source)
+                    old_edl_files.append(source)
+                    continue
+                if source_digest is not None:
+                    self.manifest.record(source, source_digest)
+
+        return old_edl_files
+
+    def _check_references(self, edl_file):
+        """ Warn about the references of an EDL file which cannot be
+            resolved, before it is converted.
+
+            The references are read into self.graph unless it holds them
+            already.
+
+        Args:
+            edl_file: EDL file under the module's EDL directory
+        """
+        if edl_file not in self.graph.references:
+            self.graph.add(edl_file)
+        for key in self.graph.dangling([edl_file]).get(edl_file, []):
+            log.warn('%s references missing file %s', edl_file, key)
+
+    def _convert_all(self, origin, destination, force, batch=False, jobs=1,
+                     screens=None, graph=None):
         """Copy each file in origin to destination:
             * if .edl, convert it to .opi
             * ignore .svn directories
+
+            If batch is True all .edl files are converted together once the
+            walk is complete.  Otherwise files are spread over jobs worker
+            processes.
+
+            Unless force is True, files whose inputs are unchanged since the
+            last conversion (as recorded in the manifest in destination) are
+            skipped.
+
+            If screens is given, EDL files not in it are not converted.
+
+            The references of each EDL file are checked before it is
+            converted, using graph if they have already been read.
         """
-        old_edl_files = []
+        tasks = []
+        batch_jobs = []
+        unreachable = 0
         log.info('Converting %s to %s', origin, destination)
         if not os.path.exists(destination):
             raise ValueError('Destination directory {} does not exist'.format(destination))
         if not os.path.exists(origin):
             raise ValueError('Origin directory {} does not exist'.format(origin))
 
+        self.manifest = manifest.Manifest(
+            os.path.join(destination, manifest.MANIFEST_NAME), origin)
+        self.resolvers = [
+            paths.PathResolver(self.file_dict, self.coords.module, use_rel=False),
+            paths.PathResolver(self.path_dict, self.coords.module, use_rel=True)]
+        self.indexes_digest = manifest.index_digest(self.file_dict, self.path_dict)
+        if graph is None:
+            graph = references.ReferenceGraph(self.file_dict, origin)
+        self.graph = graph
+
         # Flatten list, otherwise creating directories while iterating
         # causes an infinite loop.
         walklist = list(os.walk(origin))
@@ -239,17 +461,37 @@ class Module(object):
                     pass
 
             for f in filenames:
+                if f == manifest.MANIFEST_NAME:
+                    continue
                 source = os.path.join(dirpath, f)  # full path for source
                 rel = os.path.relpath(source, origin)  # relative path for target
                 target = os.path.join(destination, rel)  # full path for target
                 eclipse_path = os.path.join(self.coords.module, rel)
                 depth = len(eclipse_path.split(os.sep)) - 1
                 log.debug('The depth for %s in %s is %s', rel, self.coords.module, depth)
-
-                try:
-                    self._convert_one(source, target, depth, force)
-                except files.OldEdlError:
-                    log.warn('Skipping old edl file %s', source)
-                    old_edl_files.append(source)
+                if source.endswith(EDL_EXTENSION):
+                    if screens is not None and os.path.normpath(source) not in screens:
+                        log.debug('Skipping unreachable file %s', source)
+                        unreachable += 1
+                        continue
+
+                if batch and source.endswith(EDL_EXTENSION):
+                    target = opi_target(target)
+                    source_digest = self._digest(source, True)
+                    if self._up_to_date(source, target, source_digest, force):
+                        log.info('Skipping up-to-date file {}'.format(target))
+                        self.manifest.record(source, source_digest)
+                    else:
+                        batch_jobs.append((source, target, depth, source_digest))
+                    continue
+
+                tasks.append((source, target, depth))
+
+        if unreachable:
+            log.info('Skipped %s EDL files not reachable from the launcher', unreachable)
+        old_edl_files = self._convert_files(tasks, force, jobs)
+        if batch_jobs:
+            old_edl_files.extend(self._convert_batch(batch_jobs))
+        self.manifest.save()
 
         return old_edl_files
@@ -0,0 +1,354 @@
+"""
+In-process conversion of simple EDM screens to OPI.
+
+Most screens are built from a handful of EDM classes.  This module
+converts files which use only those classes, and only the properties of
+them listed in WIDGETS, without starting the Java converter:
+
+    activeXTextClass            -> Label
+    activeRectangleClass        -> Rectangle
+    activeXTextDspClass         -> TextInput (if editable) or TextUpdate
+    activeXTextDspClass:noedit  -> TextUpdate
+    relatedDisplayClass         -> ActionButton opening one display
+    shellCmdClass               -> ActionButton running one command
+    activeGroupClass            -> groupingContainer
+
+Only static colours from colors.list are handled.  Anything else (another
+class, another property, a dynamic colour, several displays on one
+button) makes convert() return False so that the file can be given to the
+Java converter instead.
+"""
+import logging as log
+import re
+import xml.etree.ElementTree as ET
+
+import edl
+import render
+
+WIDGET_PREFIX = 'org.csstudio.opibuilder.widgets.'
+DISPLAY_TYPE = 'org.csstudio.opibuilder.Display'
+OPI_VERSION = '1.0'
+
+# Properties every object has and which are handled for all classes
+GEOMETRY = ['major', 'minor', 'release', 'x', 'y', 'w', 'h']
+BUTTON = ['fgColor', 'bgColor', 'topShadowColor', 'botShadowColor', 'font',
+          'buttonLabel']
+
+# EDM class: properties that may appear in an object converted here
+WIDGETS = {
+    'activeXTextClass': ['font', 'fontAlign', 'fgColor', 'bgColor',
+                         'useDisplayBg', 'value', 'autoSize', 'border',
+                         'lineWidth'],
+    'activeRectangleClass': ['lineColor', 'fill', 'fillColor', 'lineWidth',
+                             'lineStyle'],
+    'activeXTextDspClass': ['controlPv', 'format', 'font', 'fontAlign',
+                            'fgColor', 'fgAlarm', 'bgColor', 'bgAlarm',
+                            'useDisplayBg', 'limitsFromDb', 'precision',
+                            'showUnits', 'editable', 'motifWidget',
+                            'smartRefresh', 'fastUpdate', 'autoHeight',
+                            'newPos', 'objType', 'nullColor'],
+    'relatedDisplayClass': BUTTON + ['numPvs', 'numDsps', 'displayFileName',
+                                     'menuLabel', 'symbols', 'replaceSymbols',
+                                     'closeAction', 'propagateMacros', 'noEdit',
+                                     'useFocus'],
+    'shellCmdClass': BUTTON + ['numCmds', 'commandLabel', 'command',
+                               'multipleInstances'],
+    edl.GROUP_CLASS: [],
+}
+WIDGETS['activeXTextDspClass:noedit'] = WIDGETS['activeXTextDspClass']
+
+ALIGNMENT = {'left': '0', 'center': '1', 'right': '2'}
+FORMAT_TYPES = {'default': '0', 'decimal': '1', 'float': '1',
+                'exponential': '2', 'hex': '3', 'string': '4', 'engineer': '7'}
+MACRO_NAME_RE = re.compile(r'^[A-Za-z_][\w.-]*$')
+
+# dictionary of static colour index:(name, (r, g, b)), loaded on first use
+_colours = None
+
+
+class Unsupported(Exception):
+    """ Raised when a file needs the Java converter"""
+    pass
+
+
+def _get_colours():
+    global _colours
+    if _colours is None:
+        _colours, _ = render.read_colours()
+    return _colours
+
+
+def check(display):
+    """ Raise Unsupported unless every object can be converted here."""
+    for obj in display.walk():
+        if obj.cls not in WIDGETS:
+            raise Unsupported('{} objects'.format(obj.cls))
+        unknown = set(obj.props) - set(GEOMETRY + WIDGETS[obj.cls])
+        if unknown:
+            raise Unsupported('{} properties {}'.format(
+                obj.cls, ', '.join(sorted(unknown))))
+
+
+def _unquote(value):
+    """Return the contents of an EDM string, quoted or not."""
+    if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return value.replace('\\"', '"').replace('\\\\', '\\')
+
+
+def _string(obj, name, default=''):
+    value = obj.get(name)
+    return _unquote(' '.join(value)) if value else default
+
+
+def _entries(obj, name):
+    """Return the strings of an indexed multi-line property, in order."""
+    entries = {}
+    for entry in obj.get(name, []):
+        parts = entry.split(None, 1)
+        if len(parts) == 2 and parts[0].isdigit():
+            entries[int(parts[0])] = _unquote(parts[1])
+    return [entries[i] for i in sorted(entries)]
+
+
+def _bool(value):
+    return 'true' if value else 'false'
+
+
+def _add(parent, tag, text=None, **attrib):
+    element = ET.SubElement(parent, tag, attrib)
+    if text is not None:
+        element.text = text
+    return element
+
+
+def _add_colour(parent, tag, obj, name):
+    value = obj.get(name)
+    if not value:
+        return
+    if value[0] == 'index' and len(value) == 2 and value[1].isdigit():
+        try:
+            colour_name, (r, g, b) = _get_colours()[int(value[1])]
+        except KeyError:
+            raise Unsupported('dynamic colour {}'.format(' '.join(value)))
+        attrib = {'name': colour_name}
+    elif value[0] == 'rgb' and len(value) == 4:
+        r, g, b = [int(v) >> 8 for v in value[1:]]
+        attrib = {}
+    else:
+        raise Unsupported('colour {}'.format(' '.join(value)))
+    colour = _add(_add(parent, tag), 'color', **attrib)
+    colour.set('red', str(r))
+    colour.set('green', str(g))
+    colour.set('blue', str(b))
+
+
+def _add_font(parent, obj):
+    """Add the font of obj, given as family-weight-slant-size."""
+    font = _string(obj, 'font')
+    if not font:
+        return
+    parts = font.split('-')
+    try:
+        family, weight, slant, size = parts[0], parts[1], parts[2], float(parts[3])
+    except (IndexError, ValueError):
+        raise Unsupported('font {}'.format(font))
+    style = (1 if weight == 'bold' else 0) + (2 if slant in ('i', 'o') else 0)
+    _add(_add(parent, 'font'), 'fontdata', fontName=family,
+         height=str(int(round(size))), style=str(style))
+
+
+def _add_alignment(parent, obj):
+    align = _string(obj, 'fontAlign', 'left')
+    if align not in ALIGNMENT:
+        raise Unsupported('alignment {}'.format(align))
+    _add(parent, 'horizontal_alignment', ALIGNMENT[align])
+
+
+def _new_widget(parent, obj, widget_type, name, offset):
+    widget = _add(parent, 'widget', typeId=WIDGET_PREFIX + widget_type,
+                  version=OPI_VERSION)
+    _add(widget, 'name', name)
+    _add(widget, 'x', str(obj.get_int('x') - offset[0]))
+    _add(widget, 'y', str(obj.get_int('y') - offset[1]))
+    _add(widget, 'width', str(obj.get_int('w')))
+    _add(widget, 'height', str(obj.get_int('h')))
+    return widget
+
+
+def _label(parent, obj, offset):
+    widget = _new_widget(parent, obj, 'Label', 'EDM Label', offset)
+    _add(widget, 'text', '\n'.join(_unquote(v) for v in obj.get('value', [])))
+    _add_font(widget, obj)
+    _add_alignment(widget, obj)
+    _add_colour(widget, 'foreground_color', obj, 'fgColor')
+    _add_colour(widget, 'background_color', obj, 'bgColor')
+    _add(widget, 'transparent', _bool('useDisplayBg' in obj.props))
+    _add(widget, 'auto_size', _bool('autoSize' in obj.props))
+    if 'border' in obj.props:
+        _add(widget, 'border_style', '1')
+        _add(widget, 'border_width', str(max(obj.get_int('lineWidth', 1), 1)))
+        _add_colour(widget, 'border_color', obj, 'fgColor')
+
+
+def _rectangle(parent, obj, offset):
+    widget = _new_widget(parent, obj, 'Rectangle', 'EDM Rectangle', offset)
+    _add_colour(widget, 'line_color', obj, 'lineColor')
+    _add(widget, 'line_width', str(obj.get_int('lineWidth', 1)))
+    _add(widget, 'line_style', '1' if _string(obj, 'lineStyle') == 'dash' else '0')
+    _add_colour(widget, 'background_color', obj, 'fillColor')
+    _add(widget, 'transparent', _bool('fill' not in obj.props))
+
+
+def _text_display(parent, obj, offset):
+    if obj.cls.endswith(':noedit') or 'editable' not in obj.props:
+        widget = _new_widget(parent, obj, 'TextUpdate', 'EDM Text Update', offset)
+    else:
+        widget = _new_widget(parent, obj, 'TextInput', 'EDM Text Input', offset)
+    _add(widget, 'pv_name', _string(obj, 'controlPv'))
+    _add_font(widget, obj)
+    _add_alignment(widget, obj)
+    _add_colour(widget, 'foreground_color', obj, 'fgColor')
+    _add_colour(widget, 'background_color', obj, 'bgColor')
+    _add(widget, 'forecolor_alarm_sensitive', _bool('fgAlarm' in obj.props))
+    _add(widget, 'backcolor_alarm_sensitive', _bool('bgAlarm' in obj.props))
+    _add(widget, 'transparent', _bool('useDisplayBg' in obj.props))
+    fmt = _string(obj, 'format', 'default')
+    if fmt not in FORMAT_TYPES:
+        raise Unsupported('format {}'.format(fmt))
+    _add(widget, 'format_type', FORMAT_TYPES[fmt])
+    _add(widget, 'precision_from_pv', _bool('limitsFromDb' in obj.props))
+    _add(widget, 'precision', str(obj.get_int('precision', 0)))
+    _add(widget, 'show_units', _bool('showUnits' in obj.props))
+
+
+def _button(parent, obj, offset, name):
+    widget = _new_widget(parent, obj, 'ActionButton', name, offset)
+    _add(widget, 'text', _string(obj, 'buttonLabel'))
+    _add_font(widget, obj)
+    _add_colour(widget, 'foreground_color', obj, 'fgColor')
+    _add_colour(widget, 'background_color', obj, 'bgColor')
+    return _add(widget, 'actions', hook='false', hook_all='false')
+
+
+def _related_display(parent, obj, offset):
+    filenames = _entries(obj, 'displayFileName')
+    if len(filenames) != 1 or obj.get_int('numDsps', 1) != 1:
+        raise Unsupported('related display with {} displays'.format(len(filenames)))
+    if obj.get_int('numPvs') != 0:
+        raise Unsupported('related display writing to PVs')
+    actions = _button(parent, obj, offset, 'EDM related display')
+    action = _add(actions, 'action', type='OPEN_DISPLAY')
+    filename = filenames[0]
+    if filename.endswith('.edl'):
+        filename = filename[:-len('.edl')]
+    _add(action, 'path', filename + '.opi')
+
+    replace_symbols = _entries(obj, 'replaceSymbols')
+    # Macros propagate unless turned off ('propagateMacros 0')
+    propagate = obj.get_int('propagateMacros', 1) != 0
+    macros = _add(action, 'macros')
+    _add(macros, 'include_parent_macros',
+         _bool(propagate and not (replace_symbols and replace_symbols[0] == '1')))
+    symbols = _entries(obj, 'symbols')
+    for pair in symbols[0].split(',') if symbols else []:
+        if not pair.strip():
+            continue
+        name, sep, value = pair.partition('=')
+        name = name.strip()
+        if not sep or not MACRO_NAME_RE.match(name):
+            raise Unsupported('macro {}'.format(pair))
+        _add(macros, name, value.strip())
+
+    close_action = _entries(obj, 'closeAction')
+    _add(action, 'replace', '1' if close_action and close_action[0] == '1' else '0')
+    labels = _entries(obj, 'menuLabel')
+    _add(action, 'description', labels[0] if labels else '')
+
+
+def _shell_command(parent, obj, offset):
+    commands = _entries(obj, 'command')
+    if len(commands) != 1 or obj.get_int('numCmds', 1) != 1:
+        raise Unsupported('shell command with {} commands'.format(len(commands)))
+    actions = _button(parent, obj, offset, 'EDM shell command')
+    action = _add(actions, 'action', type='EXECUTE_CMD')
+    _add(action, 'command', commands[0])
+    _add(action, 'command_directory', '$(opi.dir)')
+    _add(action, 'wait_time', '10')
+    labels = _entries(obj, 'commandLabel')
+    _add(action, 'description', labels[0] if labels else '')
+
+
+def _group(parent, obj, offset):
+    widget = _new_widget(parent, obj, 'groupingContainer', 'EDM Group', offset)
+    _add(widget, 'transparent', 'true')
+    _add(widget, 'show_scrollbar', 'false')
+    _add_widgets(widget, obj.children, (obj.get_int('x'), obj.get_int('y')))
+
+
+WRITERS = {
+    'activeXTextClass': _label,
+    'activeRectangleClass': _rectangle,
+    'activeXTextDspClass': _text_display,
+    'activeXTextDspClass:noedit': _text_display,
+    'relatedDisplayClass': _related_display,
+    'shellCmdClass': _shell_command,
+    edl.GROUP_CLASS: _group,
+}
+
+
+def _add_widgets(parent, objects, offset):
+    """Add widgets for objects, whose positions are relative to offset."""
+    for obj in objects:
+        WRITERS[obj.cls](parent, obj, offset)
+
+
+def to_opi(display):
+    """ Build the OPI document for a parsed EDL file
+
+    Args:
+        display: edl.Display
+
+    Returns:
+        root element of the OPI document
+
+    Raises:
+        Unsupported if the file needs the Java converter
+        edl.EdlError if a property value is invalid
+    """
+    check(display)
+    screen = display.screen
+    if screen is None:
+        raise Unsupported('no screen properties')
+    screen_obj = edl.EdlObject('screen', display.head)
+
+    root = ET.Element('display', typeId=DISPLAY_TYPE, version=OPI_VERSION)
+    _add(root, 'name', _string(screen_obj, 'title'))
+    for tag, name in [('x', 'x'), ('y', 'y'), ('width', 'w'), ('height', 'h')]:
+        _add(root, tag, str(screen_obj.get_int(name)))
+    _add_font(root, screen_obj)
+    _add_colour(root, 'foreground_color', screen_obj, 'fgColor')
+    _add_colour(root, 'background_color', screen_obj, 'bgColor')
+    _add_widgets(root, display.objects, (0, 0))
+    return root
+
+
+def convert(filename, destination):
+    """ Convert an EDL file to OPI if it only uses the widgets handled here
+
+    Args:
+        filename: .edl file
+        destination: .opi file to write
+
+    Returns:
+        True if the file was converted, False if it needs the Java
+        converter
+    """
+    try:
+        root = to_opi(edl.parse_file(filename))
+    except (Unsupported, edl.EdlError) as e:
+        log.debug('Not converting %s in-process: %s', filename, e)
+        return False
+
+    ET.ElementTree(root).write(destination, encoding='utf-8', xml_declaration=True)
+    return True
@@ -0,0 +1,137 @@
+"""
+Index of the files available to a module, as built by paths.index_paths().
+
+A PathIndex is a dict of relative-filename:(module, path-within-module)
+which also keeps its keys in a sorted list, built when first needed, so
+that all keys under a directory can be found by bisection rather than by
+testing every key.  Entries which clash with one already in the index are
+recorded with the directories both came from.  The index pickles as its
+sorted keys, each stored as the part not shared with the key before it,
+and each distinct entry stored once.
+"""
+import bisect
+import collections
+import logging as log
+import os
+
+# key: the clashing relative filename
+# kept, ignored: (entry, directory) of the entry in the index and of the
+# entry which was not added
+Clash = collections.namedtuple('Clash', 'key kept ignored')
+
+
+def _invalidates_keys(method):
+    """Wrap a dict method which changes the keys, to forget sorted keys."""
+    def wrapper(self, *args, **kwargs):
+        self._keys = None
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class PathIndex(dict):
+    """ dict of relative-filename:(module, path-within-module)
+
+    Lookups are those of a dict.  with_prefix() and under() find keys
+    beginning with a prefix in time depending on the number found.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._keys = None
+        # Clashes found while building the index
+        self.clashes = []
+
+    __setitem__ = _invalidates_keys(dict.__setitem__)
+    __delitem__ = _invalidates_keys(dict.__delitem__)
+    clear = _invalidates_keys(dict.clear)
+    pop = _invalidates_keys(dict.pop)
+    popitem = _invalidates_keys(dict.popitem)
+    setdefault = _invalidates_keys(dict.setdefault)
+    update = _invalidates_keys(dict.update)
+
+    def add(self, key, entry, directory, source_of=None):
+        """ Add entry unless key is already indexed, which is a clash if
+            the entry or directory differ from those already held
+
+        Args:
+            key: relative filename
+            entry: (module, path-within-module)
+            directory: directory key was found in
+            source_of: function returning the directory the entry already
+                held for a key came from; directory if not given
+
+        Returns:
+            True if the entry was added
+        """
+        if key not in self:
+            self[key] = entry
+            return True
+        kept = self[key]
+        kept_dir = directory if source_of is None else source_of(key)
+        if (kept, kept_dir) == (entry, directory):
+            # eg x.edl and x.opi side by side: the same file to the index
+            return False
+        clash = Clash(key, (kept, kept_dir), (entry, directory))
+        self.clashes.append(clash)
+        log.warn('clash: %s from %s in %s ignored, using %s from %s',
+                 key, entry, directory, kept, kept_dir)
+        return False
+
+    def sorted_keys(self):
+        """Return all keys in sorted order."""
+        if self._keys is None:
+            self._keys = sorted(self)
+        return self._keys
+
+    def with_prefix(self, prefix):
+        """ Yield the keys beginning with prefix, in sorted order
+
+        Args:
+            prefix: string each key must begin with; not necessarily a
+                whole directory name
+        """
+        keys = self.sorted_keys()
+        for i in xrange(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            yield keys[i]
+
+    def under(self, directory):
+        """Yield the keys of files within directory, in sorted order."""
+        return self.with_prefix(directory.rstrip('/') + '/')
+
+    def __reduce__(self):
+        # Sorted keys are front coded: each is stored as the length of the
+        # prefix it shares with the key before it and the rest of the key.
+        shared = []
+        suffixes = []
+        entries = []
+        entry_ids = {}
+        ids = []
+        previous = ''
+        for key in self.sorted_keys():
+            n = len(os.path.commonprefix([previous, key]))
+            shared.append(n)
+            suffixes.append(key[n:])
+            previous = key
+            entry = self[key]
+            if entry not in entry_ids:
+                entry_ids[entry] = len(entries)
+                entries.append(entry)
+            ids.append(entry_ids[entry])
+        return _restore, (shared, suffixes, entries, ids, self.clashes)
+
+
+def _restore(shared, suffixes, entries, ids, clashes):
+    """Recreate a pickled PathIndex."""
+    keys = []
+    previous = ''
+    for n, suffix in zip(shared, suffixes):
+        previous = previous[:n] + suffix
+        keys.append(previous)
+    index = PathIndex(zip(keys, (entries[i] for i in ids)))
+    index._keys = keys
+    index.clashes = list(clashes)
+    return index
@@ -3,18 +3,43 @@ Utility functions used for replacing paths in EDM files with paths in
 CSS OPI files.
 '''
 
+import cPickle as pickle
+import hashlib
 import os
 import re
 import xml.etree.ElementTree as et
+import files
+import pathindex
 import utils
 import logging as log
 
 from dls_css_utils import utils as css_utils
 
 TAGS_TO_UPDATE = ['path', 'image_file']
-
-
-def _index_dir(root, directory, recurse):
+# Every tag whose text may hold a path, checked before any other work
+# is done on an element.
+_PATH_TAGS = frozenset(TAGS_TO_UPDATE + ['command', 'scriptText'])
+# Regex group the contents of the quotes containing the filename.
+_OPI_FILE_PATTERN = re.compile(
+    r'widget.setPropertyValue *\( *"opi_file" *, *"([^"]*)"')
+
+# Indexes of EDMDATAFILES directories already visited in this process,
+# keyed by (directory, recurse).  Many modules share dependencies, so
+# index each directory once per run.
+_dir_indexes = {}
+# Indexes of lists of directories made by index_paths(), keyed by
+# (tuple of directories, recurse), and the indexes of EDM path made from
+# them by index_path_dirs(), keyed by (tuple of directories, tuple of path
+# dirs).  Shared by every caller asking for the same directories.
+_merged_indexes = {}
+_path_indexes = {}
+
+# Indexes persisted between runs, one file per directory.  An index is
+# reused while the mtimes of all directories it covers are unchanged.
+INDEX_CACHE_DIR = os.path.join(files.TMP_DIR, 'path_index')
+
+
+def _index_dir(root, directory, recurse, mtimes=None):
     '''
     Index directory as described in index_paths().
     Ignore hidden files.
@@ -24,39 +49,129 @@ def _index_dir(root, directory, recurse):
                 dir resides
      - dir:     the directory to index
      - recurse: whether to recursively index subdirectories
+     - mtimes:  if given, a dict filled with the mtime of each
+                directory visited
     is relative to this directory.
+
+    Return a pathindex.PathIndex.
     '''
-    index = {}
+    index = pathindex.PathIndex()
     root = os.path.normpath(root)
-    directory = os.path.normpath(directory)
-    log.debug('Indexing directory %s', directory)
     # path_within_module is always relative to root - the EDMDATAFILE
     # or path variable.
     _, module, _, path_within_module = css_utils.parse_module_name(root)
     if path_within_module is None:
         path_within_module = ''
-    for entry in os.listdir(directory):
-        if entry.startswith('.'):
-            continue
-        else:
-            if os.path.isdir(os.path.join(directory, entry)) and recurse:
-                new_index = _index_dir(root, os.path.join(directory, entry), True)
-                for new_entry in new_index:
-                    if new_entry not in index:
-                        index[new_entry] = new_index[new_entry]
-                    else:
-                        log.warn('clash: %s in %s and %s',
-                                entry, module, index[entry])
+    entry = (module, path_within_module)
+    # Every file is added straight to the one index, rather than each
+    # subdirectory's index being merged into its parent's.
+    to_visit = [os.path.normpath(directory)]
+    while to_visit:
+        directory = to_visit.pop()
+        log.debug('Indexing directory %s', directory)
+        if mtimes is not None:
+            mtimes[directory] = os.stat(directory).st_mtime
+        subdirs = []
+        for name in os.listdir(directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(directory, name)
+            if recurse and os.path.isdir(path):
+                subdirs.append(path)
             else:
                 # Get the path of the file relative to the root.
-                relative_path = os.path.relpath(os.path.join(directory, entry),
-                                                root)
+                relative_path = os.path.relpath(path, root)
                 if relative_path.endswith('edl'):
                     relative_path = relative_path[:-3] + 'opi'
-                index[relative_path] = (module, path_within_module)
+                index.add(relative_path, entry, directory)
+        # Visit subdirectories in listing order
+        to_visit.extend(reversed(subdirs))
     return index
 
 
+def _cache_file(directory, recurse):
+    '''
+    Return the file in INDEX_CACHE_DIR holding the index of directory.
+    '''
+    key = '{}:{}'.format(directory, recurse)
+    return os.path.join(INDEX_CACHE_DIR, hashlib.sha1(key).hexdigest())
+
+
+def _load_index(directory, recurse):
+    '''
+    Return the persisted index of directory, or None if there is none
+    or any directory it covers has changed since it was written.
+    '''
+    try:
+        with open(_cache_file(directory, recurse), 'rb') as f:
+            cached = pickle.load(f)
+    except IOError:
+        return None
+    except Exception as e:
+        log.debug('Ignoring unreadable index of %s: %s', directory, e)
+        return None
+
+    if (cached.get('directory') != directory or
+            not isinstance(cached.get('index'), pathindex.PathIndex)):
+        return None
+    for path, mtime in cached['mtimes'].iteritems():
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return None
+        except OSError:
+            return None
+    return cached['index']
+
+
+def _save_index(directory, recurse, index, mtimes):
+    '''
+    Persist the index of directory along with the directory mtimes
+    used to validate it.  Written via a rename so that concurrent
+    processes never see a partial file.
+    '''
+    cache_file = _cache_file(directory, recurse)
+    cached = {'directory': directory, 'mtimes': mtimes, 'index': index}
+    try:
+        if not os.path.exists(INDEX_CACHE_DIR):
+            os.makedirs(INDEX_CACHE_DIR)
+        tmp_file = '{}.{}'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(cached, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        log.warn('Failed to save index of %s: %s', directory, e)
+
+
+def _cached_index_dir(directory, recurse):
+    '''
+    Index directory as _index_dir(), reusing the result of any previous
+    call in this process, or the index saved by a previous run if the
+    directories it covers have not been modified since.
+    '''
+    directory = os.path.normpath(directory)
+    key = (directory, recurse)
+    if key not in _dir_indexes:
+        index = _load_index(directory, recurse)
+        if index is None:
+            mtimes = {}
+            index = _index_dir(directory, directory, recurse, mtimes)
+            _save_index(directory, recurse, index, mtimes)
+        else:
+            log.debug('Using saved index of %s', directory)
+        _dir_indexes[key] = index
+    return _dir_indexes[key]
+
+
+def clear_index_cache():
+    '''
+    Forget directory indexes held in this process, for example if the
+    filesystem has changed.  Saved indexes are revalidated on next use.
+    '''
+    _dir_indexes.clear()
+    _merged_indexes.clear()
+    _path_indexes.clear()
+
+
 def index_paths(directories, recurse):
     '''
     Index all files available to EDM given the list of paths
@@ -76,6 +191,8 @@ def index_paths(directories, recurse):
 
     Return a dictionary:
         relative-filename: (module, path-within-module)
+    as a pathindex.PathIndex.  The same index is returned by later calls
+    for the same directories, so must not be modified.
 
     Example:
         EDMDATAFILES entry: .../Libera/<version>/data/
@@ -83,25 +200,222 @@ def index_paths(directories, recurse):
         key, value:         'libera/overview.opi': ('Libera', 'data')
 
     '''
-    index = {}
+    key = (tuple(directories), recurse)
+    if key not in _merged_indexes:
+        _merged_indexes[key] = _merge_indexes(directories, recurse)
+    return _merged_indexes[key]
+
+
+def _merge_indexes(directories, recurse):
+    '''
+    Index directories as index_paths(), without reusing a merged index.
+    '''
+    index = pathindex.PathIndex()
+    indexed = []
+
+    def source_of(key):
+        for directory, new_index in indexed:
+            if key in new_index:
+                return directory
 
     for directory in directories:
         try:
-            new_index = _index_dir(directory, directory, recurse)
-            for entry in new_index:
-                if entry not in index:
-                    index[entry] = new_index[entry]
-                else:
-                    log.warn('clash: %s in %s and %s',
-                            entry, new_index[entry], index[entry])
+            new_index = _cached_index_dir(directory, recurse)
         except (OSError, ValueError) as e:
             log.warn('Skipping indexing: %s', e)
             continue
+        for entry in new_index:
+            index.add(entry, new_index[entry], directory, source_of)
+        index.clashes.extend(new_index.clashes)
+        indexed.append((directory, new_index))
 
     log.debug('Indexed OPI paths: %s', index)
     return index
 
 
+def path_index(file_index, path_dirs):
+    '''
+    Create an index for locating executables originally on EDM path.
+
+    Because the EDM path variable is treated differently to EDMDATAFILES,
+    this index needs the filename as the key.  Only the keys of file_index
+    beginning with each path dir are visited.  If two dirs give a file of
+    the same name, the first dir takes precedence, as on EDM path.
+
+    Arguments:
+     - file_index: index of files as from index_paths(); any dict
+     - path_dirs: a list of dirs on EDM path relative to opi dir
+
+    Return a pathindex.PathIndex:
+        filename: (module, path-relative-to-opi-dir)
+    '''
+    if not isinstance(file_index, pathindex.PathIndex):
+        file_index = pathindex.PathIndex(file_index)
+    index = pathindex.PathIndex()
+    for path in path_dirs:
+        path = path.strip(os.path.sep)
+        for old_key in file_index.with_prefix(path):
+            new_key = os.path.relpath(old_key, path)
+            if new_key not in index:
+                mod, _ = file_index[old_key]
+                index[new_key] = (mod, path)
+    return index
+
+
+def index_path_dirs(directories, path_dirs):
+    '''
+    Return path_index() of index_paths(directories, True), made once per
+    process for the same directories and path dirs, so must not be
+    modified.
+    '''
+    key = (tuple(directories), tuple(path_dirs))
+    if key not in _path_indexes:
+        _path_indexes[key] = path_index(index_paths(directories, True), path_dirs)
+    return _path_indexes[key]
+
+
+class PathResolver(object):
+    '''
+    Corrects paths in the OPI files of one module against one file index,
+    as update_opi_path() does, remembering each result.
+
+    Symbol files are converted to PNG files with different names, so a
+    PNG file whose symbol file is in the index is located with the
+    symbol's entry.  These are kept in a table of the resolver rather than
+    added to the index, so the index can be shared.
+    '''
+
+    def __init__(self, file_index, module, use_rel):
+        '''
+        Arguments:
+         - file_index: dict: relative-filename -> (module, path-within-module)
+         - module: module being converted
+         - use_rel: whether to recontruct the path including path-within-module
+                    or to exclude path-within-module
+        '''
+        self.file_index = file_index
+        self.module = module
+        self.use_rel = use_rel
+        # PNG index key -> index entry of the symbol file it was made from
+        self._png_entries = {}
+        # (filename, depth) -> corrected path
+        self._resolved = {}
+
+    def _lookup(self, index_key):
+        if index_key.endswith('png'):
+            if index_key not in self._png_entries:
+                # Remove everything after the last -
+                stub = '-'.join(p for p in index_key.split('-')[:-1])
+                self._png_entries[index_key] = self.file_index.get(stub + '.opi')
+                log.debug("Updated file_index for %s", index_key)
+            pair = self._png_entries[index_key]
+            if pair is not None:
+                return pair
+        return self.file_index.get(index_key)
+
+    def resolve(self, filename, depth):
+        '''
+        Return the corrected path of filename in a file at the given
+        depth.  See update_opi_path().
+        '''
+        try:
+            return self._resolved[(filename, depth)]
+        except KeyError:
+            pass
+
+        # The keys in the dict file_index are the filenames.
+        # Remove any leading './' for looking in the index.
+        index_key = filename[2:] if filename.startswith('./') else filename
+        pair = self._lookup(index_key)
+        if pair is not None:
+            (file_module, path_in_module) = pair
+            # Path in module is not relevant if Eclipse links are directly to
+            # the opi directory.
+            path_in_module = path_in_module if self.use_rel else ''
+            # If the file is in the same module, the relative path should
+            # not exit and return into the same module:
+            # ../module/display.opi  # WRONG
+            # ./display.opi  # RIGHT
+            down_depth = depth
+            if file_module == self.module:
+                file_module = ''
+                pieces_in_module_name = len(self.module.strip(os.path.sep).split(os.path.sep))
+                down_depth -= pieces_in_module_name
+            log.debug('Correcting filename %s depth %s', filename, depth)
+            down = os.sep.join(['..'] * down_depth)
+            if down == '':
+                down = './'
+            rel = os.path.join(down, file_module, path_in_module, index_key)
+        else:
+            log.debug('Not correcting %s', filename)
+
+            rel = filename
+
+        log.info('Updated path is %s', rel)
+        self._resolved[(filename, depth)] = rel
+        return rel
+
+    def _update_script(self, script_text, depth):
+        if 'opi_file' not in script_text:
+            return script_text
+
+        def replace(m):
+            new_path = self.resolve(m.group(1), depth)
+            log.debug("Updated path in script: %s" % new_path)
+            start, end = m.span(1)
+            return (m.string[m.start():start] + new_path +
+                    m.string[end:m.end()])
+
+        return _OPI_FILE_PATTERN.sub(replace, script_text)
+
+    def update_node(self, node, depth):
+        """
+        Update any path held by node itself, not its children.
+        """
+        if not node.text:
+            return
+        if node.tag in TAGS_TO_UPDATE:
+            node.text = self.resolve(node.text, depth)
+        elif node.tag == 'command':
+            cmd_parts = node.text.split()
+            if cmd_parts:
+                updated_cmd = self.resolve(cmd_parts[0], depth)
+                node.text = ' '.join([updated_cmd] + cmd_parts[1:])
+        elif node.tag == 'scriptText':
+            node.text = self._update_script(node.text, depth)
+
+    def update_tree(self, root, depth):
+        '''
+        Update all paths in an already parsed OPI tree.
+        '''
+        update_tree(root, depth, [self])
+
+
+def update_tree(root, depth, resolvers):
+    '''
+    Update all paths in an already parsed OPI tree with several
+    PathResolvers in one pass over the tree.
+
+    Resolvers take effect in the order given: each one corrects the path
+    left by those before it, so the result is the same as updating the
+    whole tree with each resolver in turn.
+
+    Arguments:
+     - root: root element of the OPI tree
+     - depth: depth of the OPI file, see update_opi_path()
+     - resolvers: list of PathResolvers
+    '''
+    # Walk with an explicit stack: ElementTree's iter() nests a generator
+    # per level, so is as limited by recursion depth as a recursive walk.
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.tag in _PATH_TAGS:
+            for resolver in resolvers:
+                resolver.update_node(node, depth)
+        stack.extend(reversed(node))
+
+
 def update_opi_path(filename, depth, file_index, module, use_rel):
     '''
     Return the corrected path according to the contents of the
@@ -110,6 +424,8 @@ def update_opi_path(filename, depth, file_index, module, use_rel):
     Note that if the 'module' of a file is nested directories, we
     only need to put ../<lastdir>/relative/path
 
+    To correct many paths against the same index use a PathResolver.
+
     Arguments:
      - filename: name of file to find in the index
      - depth: name of file to find in the index
@@ -118,76 +434,14 @@ def update_opi_path(filename, depth, file_index, module, use_rel):
      - use_rel: whether to recontruct the path including path-within-module
                 or to exclude path-within-module
     '''
-    # The keys in the dict file_index are the filenames.
-    # Remove any leading './' for looking in the index.
-    index_key = filename[2:] if filename.startswith('./') else filename
-    # Symbol files are converted to pngs with different names
-    # We have to update the new filenames, but the old ones are
-    # in the index.
-    if index_key.endswith('png'):
-        # Remove everything after the last -
-        stub = '-'.join(p for p in index_key.split('-')[:-1])
-        original_name = stub + '.opi'
-        if original_name in file_index:
-            file_index[index_key] = file_index[original_name]
-        log.debug("Updated file_index for %s", index_key)
-
-    pair = file_index.get(index_key)
-    if pair is not None:
-        (file_module, path_in_module) = pair
-        # Path in module is not relevant if Eclipse links are directly to
-        # the opi directory.
-        path_in_module = path_in_module if use_rel else ''
-        # If the file is in the same module, the relative path should
-        # not exit and return into the same module:
-        # ../module/display.opi  # WRONG
-        # ./display.opi  # RIGHT
-        if file_module == module:
-            file_module = ''
-            pieces_in_module_name = len(module.strip(os.path.sep).split(os.path.sep))
-            depth -= pieces_in_module_name
-        log.debug('Correcting filename %s depth %s', filename, depth)
-        down = os.sep.join(['..'] * depth)
-        if down == '':
-            down = './'
-        rel = os.path.join(down, file_module, path_in_module, index_key)
-    else:
-        log.debug('Not correcting %s', filename)
-
-        rel = filename
-
-    log.info('Updated path is %s', rel)
-    return rel
-
-
-def _update_script(script_text, depth, file_index, module, use_rel):
-    if 'opi_file' in script_text:
-        # Regex group the contents of the quotes containing the filename.
-        pattern = 'widget.setPropertyValue *\( *"opi_file" *, *"(.*)"'
-        p = re.compile(pattern)
-        m = p.search(script_text)
-        old_path = m.group(1)
-        new_path = update_opi_path(old_path, depth, file_index, module, use_rel)
-        log.debug("Updated path in script: %s" % new_path)
-        script_text = script_text.replace(m.group(1), new_path)
-
-    return script_text
-
-
-def _update_paths(node, depth, file_index, module, use_rel):
-    """
-    Recursively update all paths in the opi file to project-relative ones.
-    """
-    if node.tag in TAGS_TO_UPDATE:
-        node.text = update_opi_path(node.text, depth, file_index, module, use_rel)
-    if node.tag == 'command':
-        cmd_parts = node.text.split()
-        updated_cmd = update_opi_path(cmd_parts[0], depth, file_index, module, use_rel)
-        node.text = ' '.join([updated_cmd] + cmd_parts[1:])
-    if node.tag == 'scriptText':
-        node.text = _update_script(node.text, depth, file_index, module, use_rel)
-    for child in node:
-        _update_paths(child, depth, file_index, module, use_rel)
+    return PathResolver(file_index, module, use_rel).resolve(filename, depth)
+
+
+def update_opi_tree(root, depth, file_index, module, use_rel=True):
+    '''
+    Update all paths in an already parsed OPI tree.  See update_opi_path().
+    '''
+    PathResolver(file_index, module, use_rel).update_tree(root, depth)
 
 
 def update_opi_file(path, depth, file_index, module, use_rel=True):
@@ -195,7 +449,7 @@ def update_opi_file(path, depth, file_index, module, use_rel=True):
     tree = et.parse(path)
     root = tree.getroot()
 
-    _update_paths(root, depth, file_index, module, use_rel)
+    update_opi_tree(root, depth, file_index, module, use_rel)
 
     # write the new tree out to the same file
     utils.make_writeable(path)
@@ -0,0 +1,52 @@
+"""
+Post-processing pipeline for converted OPI files.
+
+Each post-process step is a transform: a callable which takes the root
+element of a parsed OPI file and modifies the tree in place.  A Pipeline
+parses the file once, applies every registered transform in order and
+writes the file once, rather than each step making its own round trip
+through the XML parser and serializer.
+"""
+import logging as log
+import xml.etree.ElementTree as et
+
+import utils
+
+
+class Pipeline(object):
+    """An ordered list of transforms applied to one OPI file."""
+
+    def __init__(self, transforms=None):
+        self._transforms = list(transforms) if transforms is not None else []
+
+    def register(self, transform):
+        """Add a transform to the end of the pipeline.
+
+        Args:
+            transform: callable taking the root element of an OPI tree
+        """
+        self._transforms.append(transform)
+
+    def __len__(self):
+        return len(self._transforms)
+
+    def apply(self, filepath):
+        """Parse filepath, apply all transforms and write it back.
+
+        Returns:
+            True if the file was processed, False if it could not be parsed
+        """
+        try:
+            tree = et.parse(filepath)
+        except et.ParseError:
+            log.warn("Skipping %s, XML invalid", filepath)
+            return False
+
+        root = tree.getroot()
+        for transform in self._transforms:
+            transform(root)
+
+        # write the new tree out to the same file
+        utils.make_writeable(filepath)
+        tree.write(filepath, encoding='utf-8', xml_declaration=True)
+        return True
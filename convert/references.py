@@ -0,0 +1,287 @@
+"""
+Files referenced by EDL files, found without converting them.
+
+Related displays, embedded windows, symbols and images name other files
+relative to EDMDATAFILES.  find_references() reads them straight from the
+source .edl file, and ReferenceGraph links the EDL files of a module by
+them, so that references which cannot be resolved with the module's file
+index can be reported, and the screens reachable from a set of entry
+points found, before anything is converted.
+
+Names are given as keys of the file index (see paths.index_paths()), so
+that references to displays end in .opi.
+"""
+import logging as log
+import os
+import re
+
+import edl
+
+EDL_EXTENSION = '.edl'
+OPI_EXTENSION = '.opi'
+MACRO_RE = re.compile(r'\$\([^)]*\)|\$\{[^}]*\}')
+
+# EDM class: properties naming referenced files
+DISPLAY_REFERENCES = {
+    'relatedDisplayClass': ['displayFileName'],
+    'activePipClass': ['file', 'displayFileName'],
+    'activeSymbolClass': ['file'],
+}
+IMAGE_REFERENCES = {
+    'activePngClass': ['file'],
+    'cfcf6c8a_dc3a_11d2_a2e3_ebf1fe7f6b33': ['file'],  # EDM image (gif)
+}
+
+
+def index_key(name, display):
+    """ Return the file index key of a name found in an EDL file
+
+    Args:
+        name: file name as written in the EDL file
+        display: True if name is of an EDM display, which may be given
+            without its .edl extension
+    """
+    if name.startswith('./'):
+        name = name[2:]
+    if display:
+        if name.endswith(EDL_EXTENSION):
+            name = name[:-len(EDL_EXTENSION)]
+        name += OPI_EXTENSION
+    return name
+
+
+def _names(obj, props):
+    """Return the file names given by props of obj, single line or indexed
+    multi-line ('<index> "<name>"' entries).
+    """
+    names = []
+    for kind, name, line in edl.tokenize(obj.lines):
+        if name in props and kind in (edl.PROPERTY, edl.ENTRY):
+            parts = line.split(None, 1)
+            if len(parts) == 2:
+                value = parts[1].strip().strip('"')
+                if value:
+                    names.append(value)
+    return names
+
+
+def find_references(lines):
+    """ Find the files referenced by an EDL file
+
+    Args:
+        lines: iterable of lines of the file
+
+    Returns:
+        list of file index keys, in file order without repeats
+    """
+    keys = []
+    for _, obj in edl.iter_objects(lines):
+        for classes, display in [(DISPLAY_REFERENCES, True), (IMAGE_REFERENCES, False)]:
+            if obj.cls in classes:
+                for name in _names(obj, classes[obj.cls]):
+                    key = index_key(name, display)
+                    if key not in keys:
+                        keys.append(key)
+    return keys
+
+
+def read_references(edl_file):
+    """Return the references of the EDL file edl_file, as find_references()."""
+    with open(edl_file) as f:
+        return find_references(f)
+
+
+def is_dynamic(key):
+    """Return True if key contains a macro and so cannot be resolved yet."""
+    return '$(' in key or '${' in key
+
+
+def dynamic_pattern(key):
+    """ Return what a key containing macros could stand for
+
+    Returns:
+        (compiled regex matching the keys key could expand to, the text of
+        key before its first macro)
+    """
+    pieces = []
+    prefix = None
+    end = 0
+    for m in MACRO_RE.finditer(key):
+        if prefix is None:
+            prefix = key[:m.start()]
+        pieces.append(re.escape(key[end:m.start()]))
+        pieces.append('.*')
+        end = m.end()
+    pieces.append(re.escape(key[end:]))
+    return re.compile(''.join(pieces) + '$'), prefix or ''
+
+
+class ReferenceGraph(object):
+    """ References between the EDL files of a module
+
+    Each EDL file under root has the file index key of its path relative
+    to root, so references between them can be followed without the
+    module having been converted.
+    """
+
+    def __init__(self, file_index, root):
+        """
+        Args:
+            file_index: dict of file index key:(module, path-within-module)
+                for all files available to the module
+            root: EDMDATAFILES directory holding the module's EDL files
+        """
+        self.file_index = file_index
+        self.root = root
+        # EDL file: list of referenced keys
+        self.references = {}
+        # key: EDL file under root
+        self.sources = {}
+
+    def key(self, edl_file):
+        """Return the file index key of an EDL file under root."""
+        return index_key(os.path.relpath(edl_file, self.root), True)
+
+    def add(self, edl_file):
+        """Read the references of edl_file into the graph."""
+        try:
+            self.references[edl_file] = read_references(edl_file)
+        except (IOError, edl.EdlError) as e:
+            log.warn('Cannot read references of %s: %s', edl_file, e)
+            self.references[edl_file] = []
+        self.sources[self.key(edl_file)] = edl_file
+
+    def resolve(self, key):
+        """Return (module, path-within-module) of key, or None."""
+        return self.file_index.get(key)
+
+    def matching(self, key):
+        """ Return the keys of files in the graph or the file index which a
+            key containing macros could stand for, sorted
+        """
+        pattern, prefix = dynamic_pattern(key)
+        if hasattr(self.file_index, 'with_prefix'):
+            indexed = self.file_index.with_prefix(prefix)
+        else:
+            indexed = (k for k in self.file_index if k.startswith(prefix))
+        candidates = set(indexed)
+        candidates.update(k for k in self.sources if k.startswith(prefix))
+        return sorted(k for k in candidates if pattern.match(k))
+
+    def dangling(self, edl_files=None):
+        """ Return the references which are not in the file index
+
+        References containing macros are not included.
+
+        Args:
+            edl_files: if given, the only EDL files whose references are
+                returned
+
+        Returns:
+            dict of EDL file:list of keys
+        """
+        if edl_files is None:
+            edl_files = self.references
+        missing = {}
+        for edl_file in edl_files:
+            keys = self.references.get(edl_file, [])
+            unresolved = [k for k in keys
+                          if not is_dynamic(k) and k not in self.file_index
+                          and k not in self.sources]
+            if unresolved:
+                missing[edl_file] = unresolved
+        return missing
+
+    def edges(self, edl_file):
+        """Return the EDL files in the graph which edl_file references."""
+        return [self.sources[k] for k in self.references.get(edl_file, [])
+                if k in self.sources]
+
+    def reachable(self, edl_files):
+        """ Return the EDL files in the graph reachable from edl_files
+
+        Args:
+            edl_files: files to start from, included in the result if they
+                are in the graph
+
+        Returns:
+            set of EDL files
+        """
+        seen = set()
+        stack = [f for f in edl_files if f in self.references]
+        while stack:
+            edl_file = stack.pop()
+            if edl_file in seen:
+                continue
+            seen.add(edl_file)
+            stack.extend(f for f in self.edges(edl_file) if f not in seen)
+        return seen
+
+
+def reachable_files(graphs, module_roots, starts):
+    """ Find the EDL files reachable from starts, following references
+        within and between modules
+
+    A reference containing macros is taken to reach every file it could
+    stand for.
+
+    Args:
+        graphs: dict of module name:ReferenceGraph of its EDL files
+        module_roots: dict of module name:root directory of the module,
+            to which the paths in its file index entries are relative
+        starts: EDL files to start from
+
+    Returns:
+        set of EDL files in graphs
+    """
+    owners = {}
+    for graph in graphs.itervalues():
+        for edl_file in graph.references:
+            owners[edl_file] = graph
+
+    seen = set()
+    stack = [os.path.normpath(f) for f in starts]
+    while stack:
+        edl_file = stack.pop()
+        if edl_file in seen or edl_file not in owners:
+            continue
+        seen.add(edl_file)
+        graph = owners[edl_file]
+        for reference in graph.references[edl_file]:
+            if is_dynamic(reference):
+                # Follow every file the reference could stand for
+                keys = graph.matching(reference)
+                if not keys:
+                    log.warn('%s: no file matches reference %s',
+                             edl_file, reference)
+            else:
+                keys = [reference]
+            for key in keys:
+                if key in graph.sources:
+                    stack.append(graph.sources[key])
+                    continue
+                location = graph.resolve(key)
+                if (location is not None and location[0] in module_roots
+                        and key.endswith(OPI_EXTENSION)):
+                    module, path_in_module = location
+                    stack.append(os.path.normpath(os.path.join(
+                        module_roots[module], path_in_module,
+                        key[:-len(OPI_EXTENSION)] + EDL_EXTENSION)))
+    return seen
+
+
+def build_graph(edl_files, file_index, root):
+    """ Read the references of edl_files
+
+    Args:
+        edl_files: EDL files under root
+        file_index: file index of the module, as for ReferenceGraph
+        root: EDMDATAFILES directory holding edl_files
+
+    Returns:
+        ReferenceGraph
+    """
+    graph = ReferenceGraph(file_index, root)
+    for edl_file in edl_files:
+        graph.add(edl_file)
+    return graph
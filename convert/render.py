@@ -0,0 +1,358 @@
+"""
+Headless rendering of EDM symbol files to PNG.
+
+res/auto-symb.sh displays each compressed symbol file in EDM and takes a
+screenshot, which needs an X display, grabs focus and takes at least a
+second per symbol.  The symbol groups used with the symbol widget are
+almost always built from a handful of static drawing primitives, so this
+module draws those directly:
+
+    activeRectangleClass, activeLineClass, activeCircleClass,
+    activeArcClass (and activeGroupClass containing them)
+
+Colours are read from res/colors.list.  The display background is left
+transparent, as auto-symb.sh does by painting it a key colour and
+removing that.  Any other object raises RenderError so that the caller
+can fall back to the screenshot script.
+"""
+import logging as log
+import math
+import re
+import struct
+import zlib
+
+import edl
+
+COLORS_FILE = 'res/colors.list'
+
+GROUP = edl.GROUP_CLASS
+RECTANGLE = 'activeRectangleClass'
+LINE = 'activeLineClass'
+CIRCLE = 'activeCircleClass'
+ARC = 'activeArcClass'
+DRAWN = [RECTANGLE, LINE, CIRCLE, ARC]
+
+# Segments used to approximate a full ellipse
+ELLIPSE_SEGMENTS = 72
+
+STATIC_RE = re.compile(r'^static\s+(\d+)\s+"([^"]*)"\s*\{\s*(\d+)\s+(\d+)\s+(\d+)\s*\}')
+RULE_RE = re.compile(r'^rule\s+(\d+)\s+\S+\s*\{')
+RULE_ENTRY_RE = re.compile(r'^(.*):\s*(?:"([^"]*)"|(\S+))\s*$')
+
+TRANSPARENT = (0, 0, 0, 0)
+
+# dictionary of colour index:(r, g, b), loaded on first use
+_colours = None
+
+
+class RenderError(Exception):
+    """ Raised when a symbol file cannot be drawn by this module"""
+    pass
+
+
+def read_colours(filepath=COLORS_FILE):
+    """ Parse an EDM colors.list file
+
+    Args:
+        filepath: file to load
+
+    Returns:
+        (statics, rules) where statics is a dict of colour
+        index:(name, (r, g, b)) with 8-bit components and rules a dict of
+        rule colour index:name or index of the colour of its default case
+        (or first case if there is no default)
+    """
+    statics = {}
+    rules = {}
+    rule_index = None
+    with open(filepath) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if rule_index is not None:
+                if line == '}':
+                    rule_index = None
+                    continue
+                match = RULE_ENTRY_RE.match(line)
+                if match:
+                    condition, quoted, bare = match.groups()
+                    colour = quoted if quoted is not None else bare
+                    if rule_index not in rules or condition.strip() == 'default':
+                        rules[rule_index] = colour
+                continue
+
+            match = STATIC_RE.match(line)
+            if match:
+                index, name, r, g, b = match.groups()
+                rgb = (int(r) >> 8, int(g) >> 8, int(b) >> 8)
+                statics[int(index)] = (name, rgb)
+                continue
+            match = RULE_RE.match(line)
+            if match:
+                rule_index = int(match.group(1))
+
+    return statics, rules
+
+
+def load_colours(filepath=COLORS_FILE):
+    """ Load the colours of an EDM colors.list file for drawing
+
+        Rule colours are given the colour of their default case (or first
+        case if there is no default), as displayed with no PV connected.
+
+    Args:
+        filepath: file to load
+
+    Returns:
+        dict of colour index:(r, g, b) with 8-bit components
+    """
+    statics, rules = read_colours(filepath)
+    by_index = dict((index, rgb) for index, (_, rgb) in statics.iteritems())
+    by_name = dict(statics.itervalues())
+
+    for index, colour in rules.items():
+        if colour in by_name:
+            by_index[index] = by_name[colour]
+        elif colour.isdigit() and int(colour) in by_index:
+            by_index[index] = by_index[int(colour)]
+
+    return by_index
+
+
+def _get_colours():
+    global _colours
+    if _colours is None:
+        _colours = load_colours()
+    return _colours
+
+
+class Canvas(object):
+    """An RGBA image drawn with X11-like primitives."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height * 4)
+
+    def set_pixel(self, x, y, colour):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 4
+            self.pixels[i:i + 4] = colour
+
+    def get_pixel(self, x, y):
+        i = (y * self.width + x) * 4
+        return tuple(self.pixels[i:i + 4])
+
+    def fill_rect(self, x, y, w, h, colour):
+        for row in range(max(y, 0), min(y + h, self.height)):
+            for col in range(max(x, 0), min(x + w, self.width)):
+                self.set_pixel(col, row, colour)
+
+    def _stamp(self, x, y, colour, width):
+        if width <= 1:
+            self.set_pixel(x, y, colour)
+        else:
+            offset = (width - 1) // 2
+            self.fill_rect(x - offset, y - offset, width, width, colour)
+
+    def line(self, x0, y0, x1, y1, colour, width=1):
+        """Draw a line between pixel centres (Bresenham)."""
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self._stamp(x0, y0, colour, width)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def polyline(self, points, colour, width=1, closed=False):
+        points = [(int(round(x)), int(round(y))) for x, y in points]
+        if closed and len(points) > 2:
+            points.append(points[0])
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            self.line(x0, y0, x1, y1, colour, width)
+        if len(points) == 1:
+            self._stamp(points[0][0], points[0][1], colour, width)
+
+    def fill_polygon(self, points, colour):
+        """Fill a polygon using the even-odd rule at pixel centres."""
+        if len(points) < 3:
+            return
+        edges = list(zip(points, points[1:] + points[:1]))
+        top = max(int(math.floor(min(y for _, y in points))), 0)
+        bottom = min(int(math.ceil(max(y for _, y in points))), self.height - 1)
+        for row in range(top, bottom + 1):
+            yc = row + 0.5
+            crossings = []
+            for (x0, y0), (x1, y1) in edges:
+                if (y0 <= yc < y1) or (y1 <= yc < y0):
+                    crossings.append(x0 + (yc - y0) * (x1 - x0) / float(y1 - y0))
+            crossings.sort()
+            for start, end in zip(crossings[::2], crossings[1::2]):
+                first = int(math.ceil(start - 0.5))
+                last = int(math.floor(end - 0.5))
+                for col in range(max(first, 0), min(last, self.width - 1) + 1):
+                    self.set_pixel(col, row, colour)
+
+    def png(self):
+        """Return the image encoded as PNG."""
+        stride = self.width * 4
+        raw = bytearray()
+        for row in range(self.height):
+            # Filter type 0 (none) for each scanline
+            raw.append(0)
+            raw.extend(self.pixels[row * stride:(row + 1) * stride])
+
+        def chunk(tag, data):
+            body = tag + data
+            return (struct.pack('>I', len(data)) + body +
+                    struct.pack('>I', zlib.crc32(body) & 0xffffffff))
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 6, 0, 0, 0)
+        return ('\x89PNG\r\n\x1a\n' + chunk('IHDR', header) +
+                chunk('IDAT', zlib.compress(bytes(raw), 9)) + chunk('IEND', ''))
+
+
+def _int(props, key, default=0):
+    try:
+        return int(props[key][0])
+    except (KeyError, IndexError):
+        return default
+    except ValueError:
+        raise RenderError('Invalid {} value: {}'.format(key, props[key]))
+
+
+def _colour(props, key, colours):
+    """Return the RGBA colour given by property key, black if not set."""
+    value = props.get(key)
+    if not value:
+        return (0, 0, 0, 255)
+    if value[0] == 'index' and len(value) > 1:
+        try:
+            r, g, b = colours[int(value[1])]
+        except (KeyError, ValueError):
+            raise RenderError('Unknown colour {}'.format(' '.join(value)))
+    elif value[0] == 'rgb' and len(value) > 3:
+        r, g, b = [int(v) >> 8 for v in value[1:4]]
+    else:
+        raise RenderError('Cannot interpret colour {}'.format(' '.join(value)))
+    return (r, g, b, 255)
+
+
+def _points(props, key):
+    """Return the values of an xPoints or yPoints block."""
+    return [int(entry.split()[-1]) for entry in props.get(key, [])]
+
+
+def _ellipse_points(x, y, w, h, start=0, total=360):
+    """Points around an ellipse inscribed in (x, y, w, h).
+
+    Angles are in degrees, anticlockwise from three o'clock as for X11.
+    """
+    cx, cy = x + w / 2.0, y + h / 2.0
+    rx, ry = w / 2.0, h / 2.0
+    steps = max(int(ELLIPSE_SEGMENTS * abs(total) / 360.0), 1)
+    points = []
+    for i in range(steps + 1):
+        angle = math.radians(start + total * i / float(steps))
+        points.append((cx + rx * math.cos(angle), cy - ry * math.sin(angle)))
+    return points
+
+
+def _draw(canvas, cls, props, colours):
+    if 'invisible' in props:
+        return
+    line_colour = _colour(props, 'lineColor', colours)
+    fill = 'fill' in props
+    fill_colour = _colour(props, 'fillColor', colours) if fill else None
+    line_width = max(_int(props, 'lineWidth', 1), 1)
+    x, y = _int(props, 'x'), _int(props, 'y')
+    w, h = _int(props, 'w'), _int(props, 'h')
+
+    if cls == RECTANGLE:
+        if fill:
+            canvas.fill_rect(x, y, w, h, fill_colour)
+        # X11 outlines cover w + 1 by h + 1 pixels
+        canvas.polyline([(x, y), (x + w, y), (x + w, y + h), (x, y + h)],
+                        line_colour, line_width, closed=True)
+    elif cls == LINE:
+        points = zip(_points(props, 'xPoints'), _points(props, 'yPoints'))
+        closed = 'closePolygon' in props
+        if fill and closed:
+            canvas.fill_polygon([(px + 0.5, py + 0.5) for px, py in points],
+                                fill_colour)
+        canvas.polyline(points, line_colour, line_width, closed)
+    elif cls == CIRCLE:
+        points = _ellipse_points(x, y, w, h)
+        if fill:
+            canvas.fill_polygon(points, fill_colour)
+        canvas.polyline(points, line_colour, line_width, closed=True)
+    elif cls == ARC:
+        start = _int(props, 'startAngle', 0)
+        total = _int(props, 'totalAngle', 180)
+        points = _ellipse_points(x, y, w, h, start, total)
+        if fill:
+            outline = list(points)
+            if props.get('fillMode', ['"chord"'])[0].strip('"') == 'pie':
+                outline.append((x + w / 2.0, y + h / 2.0))
+            canvas.fill_polygon(outline, fill_colour)
+        canvas.polyline(points, line_colour, line_width)
+
+
+def render(lines, colours=None):
+    """ Draw the objects of an EDM symbol file
+
+    Args:
+        lines: lines of the file
+        colours: dict of colour index:(r, g, b), default from COLORS_FILE
+
+    Returns:
+        Canvas the size of the EDM display
+
+    Raises:
+        RenderError if the file contains an object that cannot be drawn
+    """
+    if colours is None:
+        colours = _get_colours()
+    try:
+        display = edl.parse(lines)
+    except edl.EdlError as e:
+        raise RenderError(str(e))
+    screen = display.screen
+    if screen is None:
+        raise RenderError('No screen properties found')
+    width, height = _int(screen, 'w'), _int(screen, 'h')
+    if width <= 0 or height <= 0:
+        raise RenderError('Invalid display size {}x{}'.format(width, height))
+
+    objects = list(display.walk())
+    unsupported = set(obj.cls for obj in objects) - set(DRAWN + [GROUP])
+    if unsupported:
+        raise RenderError('Cannot draw {}'.format(', '.join(sorted(unsupported))))
+
+    canvas = Canvas(width, height)
+    for obj in objects:
+        if obj.cls != GROUP:
+            _draw(canvas, obj.cls, obj.props, colours)
+    return canvas
+
+
+def render_file(edl_file, png_file):
+    """ Render an EDM symbol file to a PNG file
+
+    Raises:
+        RenderError if the file contains an object that cannot be drawn
+    """
+    log.debug('Rendering %s to %s', edl_file, png_file)
+    with open(edl_file) as f:
+        canvas = render(f)
+    with open(png_file, 'wb') as f:
+        f.write(canvas.png())
@@ -8,6 +8,7 @@ import logging as log
 import os
 import xml.etree.ElementTree as ET
 
+import catalogue
 import utils
 
 
@@ -40,17 +41,21 @@ def simplify_rules(widget):
             rule_pvs[0].text = '$(pv_name)'
 
 
+def transform(root):
+    for widget in root.findall(".//widget"):
+        # Some widgets do not have a PV Name field.
+        if widget.attrib['typeId'] not in WIDGETS_WITHOUT_CONTROL_PV:
+            if widget.find('./rules') is not None:
+                simplify_rules(widget)
+
+
 def parse(filepath):
     try:
         if os.path.exists(filepath) or os.access(filepath, os.R_OK):
             tree = ET.parse(filepath)
             root = tree.getroot()
 
-            for widget in root.findall(".//widget"):
-                # Some widgets do not have a PV Name field.
-                if widget.attrib['typeId'] not in WIDGETS_WITHOUT_CONTROL_PV:
-                    if widget.find('./rules') is not None:
-                        simplify_rules(widget)
+            transform(root)
 
             # write the new tree out to the same file
             utils.make_writeable(filepath)
@@ -62,7 +67,7 @@ def parse(filepath):
 
 
 def build_filelist(basepath):
-    """ Find all OPI files.
+    """ Find all OPI files which may need rule changes.
 
         Arguments:
             basepath - root of search
@@ -70,4 +75,5 @@ def build_filelist(basepath):
             iterator over relative filepaths
     """
     log.info("Building rules list.")
-    return utils.find_opi_files(basepath)
+    opis = catalogue.scan(basepath, catalogue.CATALOGUE_FILE)
+    return opis.files(catalogue.RULES)
@@ -0,0 +1,120 @@
+"""
+A persistent converter JVM.
+
+Starting java and reloading converter.jar, colors.list and symbols.conf for
+every .edl file dominates the conversion time of large modules.  The
+ConverterServer instead keeps one JVM running the ConverterServer class
+(compiled from res/ConverterServer.java by files.build_server()) and sends
+it one request per file over a pipe:
+
+    PING                        -> PONG
+    <source>\t<destination>     -> OK | FAIL <reason>
+
+The JVM is started on first use and pinged once to check that it came up.
+It is restarted before a request if it has exited; a request which gets no
+reply means it died (for example if the converter calls System.exit()).
+"""
+import logging as log
+import subprocess
+
+PING = 'PING'
+PONG = 'PONG'
+OK = 'OK'
+
+# Return codes mirroring those of a one-shot 'java' process.
+SUCCESS_CODE = 0
+FAILURE_CODE = 1
+CRASH_CODE = -1
+
+
+class ServerError(Exception):
+    pass
+
+
+class ConverterServer(object):
+    """Converts EDL files using one long-lived converter process."""
+
+    def __init__(self, command):
+        """
+        Args:
+            command: list of arguments used to start the server process
+        """
+        self._command = command
+        self._process = None
+
+    def _start(self):
+        log.info('Starting converter server: %s', ' '.join(self._command))
+        self._process = subprocess.Popen(self._command,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         close_fds=True)
+        if not self._ping():
+            self.stop()
+            raise ServerError('Converter server failed to start')
+
+    def _request(self, line):
+        """Send one request line.
+
+        Returns:
+            the stripped reply, or None if the process has died
+        """
+        try:
+            self._process.stdin.write(line + '\n')
+            self._process.stdin.flush()
+            reply = self._process.stdout.readline()
+        except (IOError, OSError) as e:
+            log.debug('Lost connection to converter server: %s', e)
+            return None
+        return reply.strip() if reply else None
+
+    def _ping(self):
+        return self._request(PING) == PONG
+
+    def is_alive(self):
+        """Return True if the server process is running and responding."""
+        return (self._process is not None and
+                self._process.poll() is None and
+                self._ping())
+
+    def _ensure_running(self):
+        if self._process is None:
+            self._start()
+        elif self._process.poll() is not None:
+            log.warn('Converter server has exited; restarting.')
+            self.stop()
+            self._start()
+
+    def convert(self, filename, destination):
+        """Convert one file.
+
+        Args:
+            filename: .edl file to convert
+            destination: .opi file to create
+
+        Returns:
+            0 on success, non-zero otherwise (as for subprocess.call)
+        """
+        self._ensure_running()
+        reply = self._request('{}\t{}'.format(filename, destination))
+        if reply is None:
+            log.warn('Converter server died converting %s.', filename)
+            self.stop()
+            return CRASH_CODE
+        elif reply == OK:
+            return SUCCESS_CODE
+        else:
+            log.debug('Converter server reply for %s: %s', filename, reply)
+            return FAILURE_CODE
+
+    def stop(self):
+        """Shut down the server process if it is running."""
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+        if self._process.poll() is None:
+            self._process.terminate()
+        self._process.wait()
+        self._process = None
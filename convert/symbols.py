@@ -1,9 +1,7 @@
 import sys
 import logging as log
 
-GROUP_HEADER = 'object activeGroupClass'
-GROUP_START = 'beginGroup'
-GROUP_END = 'endGroup'
+import edl
 
 
 class SymbolError(Exception):
@@ -11,81 +9,27 @@ class SymbolError(Exception):
     pass
 
 
-def find_groups(filename):
-    groups = []
-    current_group = []
-    with open(filename) as f:
-
-        in_group = False
-
-        for line in f:
-            if line.strip() == GROUP_HEADER:
-                in_group = True
-            elif line.strip() == GROUP_END:
-                in_group = False
-                groups.append(current_group)
-                current_group = []
-
-            if in_group:
-                current_group.append(line)
-
-    return groups
+def find_groups(display):
+    """Return the top level groups of a parsed EDL file, one per symbol state."""
+    return [obj for obj in display.objects if obj.cls == edl.GROUP_CLASS]
 
 
 def locate_group(group):
-    for line in group:
-        if line.startswith('x'):
-            x = int(line.split()[1])
-        elif line.startswith('y'):
-            y = int(line.split()[1])
-        elif line.startswith('w'):
-            w = int(line.split()[1])
-        elif line.startswith('h'):
-            h = int(line.split()[1])
-        elif line.strip() == GROUP_START:
-            break
-    for line in group:
-        if line.startswith('y'):
-            y = int(line.split()[1])
-            break
+    try:
+        x, y = group.get_int('x'), group.get_int('y')
+        w, h = group.get_int('w'), group.get_int('h')
+    except edl.EdlError as e:
+        raise SymbolError(str(e))
     return x, y, w+1, h+1  # Account for border width
 
-def move_group(group, x_move, y_move):
-    new_group = []
-    in_x = False
-    in_y = False
-    for line in group:
-        if line.startswith('x '):
-            new_val = int(line.split()[1]) + x_move
-            new_group.append('x %s\n' % new_val)
-        elif line.startswith('y '):
-            new_val = int(line.split()[1]) + y_move
-            new_group.append('y %s\n' % new_val)
-        elif line.startswith('xPoints'):
-            in_x = True
-            new_group.append(line)
-        elif in_x:
-            if line.strip().endswith('}'):
-                in_x = False
-                new_group.append(line)
-            else:
-                val = line.split()[1]
-                new_val = int(val) + x_move
-                new_group.append(line.replace(val, str(new_val)))
-        elif line.startswith('yPoints'):
-            in_y = True
-            new_group.append(line)
-        elif in_y:
-            if line.strip().endswith('}'):
-                in_y = False
-                new_group.append(line)
-            else:
-                val = line.split()[1]
-                new_val = int(val) + y_move
-                new_group.append(line.replace(val, str(new_val)))
-        else:
-            new_group.append(line)
-    return new_group
+
+def resize_screen(lines, width, height):
+    """Yield the screen property lines with the display size replaced."""
+    sizes = {'w': width, 'h': height}
+    for kind, name, line in edl.tokenize(lines):
+        if kind == edl.PROPERTY and name in sizes:
+            line = '%s %s\n' % (name, sizes.pop(name))
+        yield line
 
 
 def new_name(filename, width):
@@ -98,18 +42,21 @@ def new_name(filename, width):
 
 def compress(filename):
     log.info('Parsing %s', filename)
-    groups = find_groups(filename)
+    try:
+        display = edl.parse_file(filename)
+    except edl.EdlError as e:
+        raise SymbolError(str(e))
+    groups = find_groups(display)
     if len(groups) == 0:
         raise SymbolError('No groups found in symbols file')
 
     log.info('Found %s symbols.', len(groups))
-    x, y, width, height = locate_group(groups[0])
+    locations = [locate_group(group) for group in groups]
+    x, y, width, height = locations[0]
     log.debug("Width %s; height %s", width, height)
 
-
     # Get maximum height and width
-    for group in groups:
-        x, y, w, h = locate_group(group)
+    for x, y, w, h in locations:
         log.debug("Width %s; height %s", w, h)
         if w != width:
             log.warn('Symbol widths not consistent')
@@ -118,60 +65,28 @@ def compress(filename):
             log.warn('Symbol heights not consistent')
             height = max(h, height)
 
-
     # We'll later resize to the exact size
     total_height = height
     total_width = width * len(groups)
-    # Move each group's top left to width*i, 0
-    start_x = 0
-    moved_groups = []
-    for group in groups:
-        x, y, w, h = locate_group(group)
-        moved_groups.append(move_group(group, start_x - x, 0 - y))
-        start_x += width
-
-    # Create new file by passing through every line
-    i = 0
-    new_file = []
-    changed_height = False
-    changed_width = False
-
-    with open(filename) as f:
-        in_group = False
-        new_file = []
-
-        for line in f:
-            # Replace first instance of height with revised version
-            if not changed_height and line.split()[0] == 'h':
-                new_file.append('h %s\n' % total_height)
-                changed_height = True
-                continue
-            # Replace first instance of width with revised version
-            if not changed_width and line.split()[0] == 'w':
-                new_file.append('w %s\n' % total_width)
-                changed_width = True
-                continue
-            # if in a group, replace it with the moved group
-            if line.strip() == GROUP_HEADER:
-                in_group = True
-                new_file.extend(moved_groups[i])
-                i += 1
-            elif line.strip() == GROUP_END:
-                in_group = False
-
-            if not in_group:
-                new_file.append(line)
-
-    log.info('New file length: %s', len(new_file))
 
     new_filename = new_name(filename, width)
-    # Write out the new file
+    # Write out the new file, passing through everything except the
+    # display size and the symbol groups
     with open(new_filename, 'w') as f:
-        for line in new_file:
-            f.write(line)
+        f.writelines(resize_screen(display.head, total_width, total_height))
+        # Move each group's top left to width*i, 0
+        start_x = 0
+        for obj in display.objects:
+            if obj.cls == edl.GROUP_CLASS:
+                x, y, w, h = locate_group(obj)
+                f.writelines(obj.moved(start_x - x, 0 - y))
+                start_x += width
+            else:
+                f.writelines(obj.iter_lines())
+        f.writelines(display.tail)
 
     log.info('Wrote new EDM symbol to %s', new_filename)
-
+    return new_filename
 
 
 if __name__ == '__main__':
@@ -104,11 +104,30 @@ def grep(filename, string):
     return False
 
 
-def find_opi_files(basepath):
-    files = []
-    for dirpath, dirnames, filenames in os.walk(basepath):
-        for filename in filenames:
-            if filename.endswith(".opi"):
-                files.append(os.path.join(dirpath, filename))
-
-    return files
+def source_file(module):
+    """Return the .py file from which module was loaded."""
+    filepath = module.__file__
+    if filepath.endswith('.pyc') or filepath.endswith('.pyo'):
+        filepath = filepath[:-1]
+    return filepath
+
+
+class RecordBuffer(log.Handler):
+    """
+    Logging handler which keeps records so that a worker process can send
+    them to its parent, to be emitted there in a sensible order.
+    """
+
+    def __init__(self):
+        log.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # Records are sent to another process, so reduce them to plain
+        # strings.
+        record.msg = record.getMessage()
+        if record.exc_info:
+            record.msg += '\n' + log.Formatter().formatException(record.exc_info)
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
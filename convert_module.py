@@ -4,16 +4,25 @@ import pkg_resources
 pkg_resources.require('dls_css_utils')
 
 import logging as log
+import multiprocessing
 import os
 import sys
 
-from convert import arguments, files, module, paths, configuration, utils
+from convert import arguments, dependencies, files, launcher, module, paths, references, configuration, utils
 from dls_css_utils import coordinates, run_script, config, utils as css_utils
 
 LOG_FORMAT = '%(levelname)s:%(pathname)s: %(message)s'
 LOG_LEVEL = log.INFO
 log.basicConfig(format=LOG_FORMAT, level=LOG_LEVEL)
 
+# Outcome of converting one module
+CONVERTED = 'converted'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# State of a worker process converting whole modules
+_worker_state = None
+
 
 def get_modules(args, gen_cfg, area):
     """Return either one or all modules for specified area.
@@ -51,35 +60,21 @@ def get_modules(args, gen_cfg, area):
     return modules
 
 
-def file_dict_to_path_dict(file_dict, path_dirs):
-    """Create a dict for locating executables originally on EDM path.
-
-    Because the EDM path variable is treated differently to EDMDATAFILES,
-    this dict needs the filename as the key.
+def module_dirs(mod, gen_cfg):
+    """Find the directories used to locate files referenced by a module.
 
     Args:
-        file_dict: used for indexing opi files
-        path_dirs: a list of dirs on EDM path relative to opi dir
+        mod: module (object) to convert
+        gen_cfg: parsed module configuration
 
     Returns:
-        path_dict: filename: (module, path-relative-to-opi-dir)
+        (edl_dirs, path_dirs, extra_depends) for the module and all of its
+        dependencies
     """
-    path_dict = {}
-    for old_key, old_value in file_dict.items():
-        for path in path_dirs:
-            path = path.strip(os.path.sep)
-            if old_key.startswith(path):
-                mod, _ = old_value
-                new_key = os.path.relpath(old_key, path)
-                path_dict[new_key] = (mod, path)
-    return path_dict
-
-
-def convert_module(mod, gen_cfg, force):
     extra_depends = []
     dependencies = mod.get_dependencies()
     edl_dirs = [mod.get_edl_path()]
-    path_dirs = mod.get_path_dirs()
+    path_dirs = list(mod.get_path_dirs())
     for dep, dep_coords in dependencies.items():
         dep_cfg = gen_cfg.get_mod_cfg(dep)
         dep_edl_path = os.path.join(gen_cfg.mirror_root,
@@ -97,17 +92,40 @@ def convert_module(mod, gen_cfg, force):
         updated_mod_deps = coordinates.update_version_from_files(mod_deps, mod.coords.root)
         extra_depends.append(updated_mod_deps)
 
+    return edl_dirs, path_dirs, extra_depends
+
+
+def convert_module(mod, gen_cfg, force, batch=False, jobs=1, dirs=None, screens=None,
+                   graph=None):
+    """Convert one module.
+
+    Args:
+        dirs: result of module_dirs() if already known
+        screens: if given, set of the only EDL files to convert
+        graph: references.ReferenceGraph of the module's EDL files, if
+            already read by reachable_screens()
+
+    Returns:
+        (status, list of old-style EDL files which were not converted)
+    """
+    if dirs is None:
+        dirs = module_dirs(mod, gen_cfg)
+    edl_dirs, path_dirs, extra_depends = dirs
+
     mod.file_dict = paths.index_paths(edl_dirs, True)
     # path_dict is a reshaped subset of file_dict
-    mod.path_dict = file_dict_to_path_dict(mod.file_dict, path_dirs)
+    mod.path_dict = paths.index_path_dirs(edl_dirs, path_dirs)
     try:
-        mod.convert(force)
+        old_edl_files = mod.convert(force, batch, jobs, screens, graph)
         run_script.generate(mod.coords, gen_cfg.mirror_root,
                             opi_dir=mod.opi_dir, converter_config=gen_cfg,
                             extra_depends=extra_depends)
     except ValueError as e:
         log.warn('Conversion of %s failed:', mod)
         log.warn('%s', e)
+        return FAILED, []
+
+    return CONVERTED, old_edl_files
 
 
 def already_converted(mod):
@@ -127,29 +145,209 @@ def already_converted(mod):
     return converted
 
 
-def prepare_conversion(mod, gen_cfg, force):
-    """Convert files in one module.
+def needs_conversion(mod, gen_cfg, force):
+    """Determine whether a module should be converted, logging why not.
 
     Args:
         mod: module (object) to convert
         gen_cfg: parsed module configuration
         force: force conversion
     """
-    log.info('Preparing conversion of module %s', mod)
     mod_cfg = gen_cfg.get_mod_cfg(mod.coords.module)
 
     if not force and already_converted(mod):
         log.info('Skipping conversion, module %s already converted.', mod)
-    elif mod_cfg.has_opi:
-        convert_module(mod, gen_cfg, force)
-    else:
+    elif not mod_cfg.has_opi:
         log.info('Skipping conversion, no OPIs in module %s', mod)
+    else:
+        return True
+    return False
+
+
+def prepare_conversion(mod, gen_cfg, force, batch=False, jobs=1):
+    """Convert files in one module.
+
+    Args:
+        mod: module (object) to convert
+        gen_cfg: parsed module configuration
+        force: force conversion
+        batch: convert all EDL files in one converter invocation
+        jobs: number of processes converting files
+
+    Returns:
+        (status, list of old-style EDL files which were not converted)
+    """
+    log.info('Preparing conversion of module %s', mod)
+    if needs_conversion(mod, gen_cfg, force):
+        return convert_module(mod, gen_cfg, force, batch, jobs)
+    return SKIPPED, []
+
+
+def _init_worker(*state):
+    """Prepare a worker process to convert modules."""
+    global _worker_state
+    _worker_state = state
+    log.getLogger().handlers = [utils.RecordBuffer()]
+    files.reset_server_after_fork()
+
+
+def _convert_module_task(index):
+    """Convert the module at index in a worker process.
+
+    Returns:
+        (index, status, old-style EDL files, log records)
+    """
+    modules, plans, gen_cfg, force, batch, screens, graphs = _worker_state
+    buf = log.getLogger().handlers[0]
+    buf.records = []
+    if index in plans:
+        status, old_edl_files = convert_module(modules[index], gen_cfg, force,
+                                               batch, 1, plans[index], screens,
+                                               graphs.get(index))
+    else:
+        status, old_edl_files = SKIPPED, []
+    return index, status, old_edl_files, buf.records
+
+
+def reachable_screens(modules, plans, entry_points):
+    """Find the EDL files reachable from launcher entry points.
+
+    References are followed within each module and into the other modules
+    being converted.
+
+    Args:
+        modules: list of modules (objects)
+        plans: dict {index of module to convert: result of module_dirs()}
+        entry_points: dict {module name: set of EDL files relative to the
+            module root}, as from launcher.entry_points()
+
+    Returns:
+        (set of EDL files, dict {index of module: references.ReferenceGraph
+        of its EDL files}) so that the graphs can be reused in conversion
+    """
+    graphs = {}
+    module_graphs = {}
+    module_roots = {}
+    starts = []
+    for index, (edl_dirs, _, _) in plans.items():
+        mod = modules[index]
+        name = mod.coords.module
+        origin = mod.get_edl_path()
+        edl_files = [os.path.join(dirpath, f)
+                     for dirpath, _, filenames in os.walk(origin)
+                     if '.svn' not in dirpath
+                     for f in filenames if f.endswith(module.EDL_EXTENSION)]
+        graphs[name] = module_graphs[index] = references.build_graph(
+            edl_files, paths.index_paths(edl_dirs, True), origin)
+        module_roots[name] = mod.conversion_root
+        starts.extend(os.path.join(mod.conversion_root, p)
+                      for p in entry_points.get(name, []))
+
+    screens = references.reachable_files(graphs, module_roots, starts)
+    log.info('%s EDL files are reachable from %s launcher entry points',
+             len(screens), len(starts))
+    return screens, module_graphs
+
+
+def convert_modules(modules, gen_cfg, force, batch=False, jobs=1, module_jobs=1,
+                    entry_points=None):
+    """Convert several modules, up to module_jobs of them at once.
+
+    Modules write to disjoint trees in the mirror filesystem, so can be
+    converted independently.  Dependencies are resolved and every EDM data
+    directory indexed once in this process before the workers are started,
+    so common dependencies are not indexed again by each worker.
+
+    Log output of each module is emitted in one block once that module
+    has been converted.
+
+    If entry_points is given (see reachable_screens()), only EDL files
+    reachable from them are converted.
+
+    Returns:
+        list of (module, status, old-style EDL files) in the order of modules
+    """
+    if entry_points is None and (module_jobs <= 1 or len(modules) <= 1):
+        return [(mod,) + prepare_conversion(mod, gen_cfg, force, batch, jobs)
+                for mod in modules]
+
+    if jobs > 1:
+        log.warn('Converting %s modules at once; converting files serially.',
+                 module_jobs)
+
+    plans = {}
+    for index, mod in enumerate(modules):
+        log.info('Preparing conversion of module %s', mod)
+        if needs_conversion(mod, gen_cfg, force):
+            plans[index] = module_dirs(mod, gen_cfg)
+
+    edl_dirs = set()
+    for mod_edl_dirs, _, _ in plans.values():
+        edl_dirs.update(mod_edl_dirs)
+    log.info('Indexing %s EDM data directories', len(edl_dirs))
+    paths.index_paths(sorted(edl_dirs), True)
+
+    screens = None
+    graphs = {}
+    if entry_points is not None:
+        screens, graphs = reachable_screens(modules, plans, entry_points)
+
+    if module_jobs <= 1 or len(modules) <= 1:
+        results = []
+        for index, mod in enumerate(modules):
+            if index in plans:
+                results.append((mod,) + convert_module(
+                    mod, gen_cfg, force, batch, jobs, plans[index], screens,
+                    graphs.get(index)))
+            else:
+                results.append((mod, SKIPPED, []))
+        return results
+
+    results = [None] * len(modules)
+    pool = multiprocessing.Pool(module_jobs, _init_worker,
+                                (modules, plans, gen_cfg, force, batch, screens,
+                                 graphs))
+    try:
+        for index, status, old_edl_files, records in pool.imap_unordered(
+                _convert_module_task, range(len(modules))):
+            for record in records:
+                log.getLogger().handle(record)
+            results[index] = (modules[index], status, old_edl_files)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return results
+
+
+def summarise(results):
+    """Log the outcome of converting each module.
+
+    Args:
+        results: list of (module, status, old-style EDL files)
+    """
+    by_status = {CONVERTED: [], SKIPPED: [], FAILED: []}
+    for mod, status, _ in results:
+        by_status[status].append(mod)
+    old_edl_files = [f for _, _, old in results for f in old]
+
+    log.info('Conversion summary: %s converted, %s skipped, %s failed.',
+             len(by_status[CONVERTED]), len(by_status[SKIPPED]),
+             len(by_status[FAILED]))
+    for mod in by_status[FAILED]:
+        log.warn('Failed: %s', mod)
+    if old_edl_files:
+        log.warn('%s old-style EDL files were not converted:', len(old_edl_files))
+        for f in old_edl_files:
+            log.warn('    %s', f)
 
 
 def start_conversion():
     args = arguments.parse_arguments()
     gen_cfg = configuration.GeneralConfig(args.general_config, args.module_config)
     area = css_utils.AREA_IOC if args.ioc else css_utils.AREA_SUPPORT
+    if args.no_dependency_cache:
+        dependencies.disable_disk_cache()
 
     if not os.path.exists(files.JAVA):
         log.fatal('Cannot find java executable {}'.format(files.JAVA))
@@ -165,12 +363,40 @@ def start_conversion():
         log.fatal('Failed to load modules: %s', e)
         sys.exit()
 
+    if args.jobs < 1 or args.module_jobs < 1:
+        log.fatal('Number of jobs must be at least 1')
+        sys.exit()
+
+    if args.server or args.batch:
+        if not os.path.exists(files.SERVER_SOURCE):
+            log.fatal('Cannot find converter server {}'.format(files.SERVER_SOURCE))
+            sys.exit()
+        if not files.build_server():
+            log.fatal('Cannot compile converter server {}'.format(files.SERVER_SOURCE))
+            sys.exit()
+    if args.server:
+        files.start_server()
+    if args.native:
+        files.use_native()
+
+    entry_points = None
+    if args.reachable_only:
+        try:
+            lxml = launcher.LauncherXml(gen_cfg.apps_xml, gen_cfg.new_apps_xml)
+        except IOError as e:
+            log.fatal('Cannot read launcher applications: %s', e)
+            sys.exit()
+        entry_points = launcher.entry_points(lxml.get_cmds())
+
     try:
-        for mod in modules:
-            prepare_conversion(mod, gen_cfg, args.force)
+        results = convert_modules(modules, gen_cfg, args.force, args.batch,
+                                  args.jobs, args.module_jobs, entry_points)
+        summarise(results)
     except config.ConfigError as e:
         log.fatal('Incorrect configuration: %s', e)
         log.fatal('System will exit.')
+    finally:
+        files.stop_server()
 
 if __name__ == '__main__':
     start_conversion()
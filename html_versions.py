@@ -14,8 +14,8 @@ import os
 import subprocess
 import shutil
 
-from convert import configuration, launcher, spoof, utils
-from dls_css_utils import coordinates, dependency, utils as css_utils
+from convert import configuration, dependencies, launcher, spoof, utils
+from dls_css_utils import coordinates, utils as css_utils
 
 LOG_FORMAT = '%(levelname)s:  %(message)s'
 LOG_LEVEL = log.WARNING
@@ -122,8 +122,7 @@ def handle_one_module(module_name, module_cfg, launcher_version, cfg_ioc_version
         vcoords = coordinates.update_version(coords, latest_release)
 
     log.debug('Dependencies of {} plus {}'.format(vcoords, module_cfg.extra_deps))
-    dp = dependency.DependencyParser.from_coord(vcoords, additional_depends=module_cfg.extra_deps)
-    deps = dp.find_dependencies()
+    deps = dependencies.find_dependencies(vcoords, additional_depends=module_cfg.extra_deps)
     log.debug('{}: {}, {}'.format(module_name, latest_release, config_version))
 
     # Sort dependencies by module name so that they render in order.
@@ -21,7 +21,7 @@ LOG_FORMAT = '%(levelname)s:  %(message)s'
 LOG_LEVEL = log.DEBUG
 log.basicConfig(format=LOG_FORMAT, level=LOG_LEVEL)
 
-from convert import mmux
+from convert import catalogue, mmux
 
 
 def perform_postprocess():
@@ -37,7 +37,8 @@ def perform_postprocess():
         print 'Usage: ', sys.argv[0], '<search-path>'
         sys.exit()
 
-    for filepath in mmux.build_filelist(search_path):
+    opis = catalogue.scan(search_path, catalogue.CATALOGUE_FILE)
+    for filepath in opis.files(catalogue.MENU_MUX):
         try:
             log.info('Parsing file %s', filepath)
             mmux.parse(filepath)
@@ -11,12 +11,17 @@ steps are complete.
 import pkg_resources
 pkg_resources.require('dls_css_utils')
 
+import argparse
+import collections
 import logging as log
+import multiprocessing
 import os
 import re
+import shutil
+import tempfile
 import xml.etree.ElementTree as et
 
-from convert import configuration, files, module, paths, utils
+from convert import catalogue, configuration, files, module, paths, render, utils
 from dls_css_utils import coordinates, utils as css_utils
 
 LOG_FORMAT = '%(levelname)s:%(pathname)s: %(message)s'
@@ -26,6 +31,9 @@ log.basicConfig(format=LOG_FORMAT, level=LOG_LEVEL)
 
 SYMBOL_ID = 'org.csstudio.opibuilder.widgets.edm.symbolwidget'
 
+# Configuration of a worker process drawing symbols
+_worker_cfg = None
+
 
 def get_edl_dirs(mod, gen_cfg):
     """ Find list of edl directories in all dependencies for the passed module
@@ -91,8 +99,37 @@ def edit_symbol_node(node, filename):
     node.remove(node.find('opi_file'))
 
 
-def update_symbols(filepath, depth, file_dict, gen_cfg):
-    symbol_files = {}
+def find_symbols(filepath, file_dict):
+    """ Find the symbols used by EDM symbol widgets in an OPI file
+
+    Args:
+        filepath: OPI file
+        file_dict: index of files available to the OPI's module
+
+    Returns:
+        set of (symbol_file, module) pairs
+    """
+    symbols = set()
+    tree = et.parse(filepath)
+    for widget in tree.getroot().findall(".//widget[name='EDM Symbol']"):
+        symbol_file = widget.find('opi_file').text
+        try:
+            smodule, _ = file_dict[symbol_file]
+        except KeyError:
+            continue
+        symbols.add((symbol_file, smodule))
+    return symbols
+
+
+def update_symbols(filepath, depth, file_dict, png_files):
+    """ Replace EDM symbol widgets in an OPI file with DLS symbol widgets
+
+    Args:
+        filepath: OPI file
+        depth: depth of the OPI's module
+        file_dict: index of files available to the OPI's module
+        png_files: dict of (symbol_file, module):png filename or None
+    """
     log.info('Updating symbols in %s depth %s', filepath, depth)
     tree = et.parse(filepath)
     root = tree.getroot()
@@ -103,13 +140,8 @@ def update_symbols(filepath, depth, file_dict, gen_cfg):
         except KeyError:
             continue
 
-        if (symbol_file, smodule) in symbol_files:
-            png_file = symbol_files[(symbol_file, smodule)]
-        else:
-            mod_cfg = gen_cfg.get_mod_cfg(smodule)
-            png_file = process_symbol(symbol_file, smodule, mod_cfg,
-                                      gen_cfg.mirror_root, gen_cfg.prod_root)
-            symbol_files[(symbol_file, smodule)] = png_file
+        png_file = png_files.get((symbol_file, smodule))
+        if png_file is not None:
             file_dict[png_file] = (smodule, '')
 
         log.debug('Module for %s is %s', symbol_file, smodule)
@@ -123,27 +155,20 @@ def update_symbols(filepath, depth, file_dict, gen_cfg):
 
 def build_filelist(basepath):
     """
-    Grep on the basepath to find all files that contain an EDM
-    symbol widget.
-        control
+    Find all files under basepath that contain an EDM symbol widget.
 
     Arguments:
         basepath - root of search
     Returns:
-        iterator over relative filepaths
+        list of filepaths
     """
     log.info("Building list of files containing EDM symbols in %s", basepath)
-    symbol_files = []
-    for dir_path, _, filenames in os.walk(basepath):
-        for filename in filenames:
-            filepath = os.path.join(dir_path, filename)
-            if filename.endswith(".opi") and utils.grep(filepath, "EDM Symbol"):
-                symbol_files.append(filepath)
+    opis = catalogue.scan(basepath, catalogue.CATALOGUE_FILE)
+    return opis.files(catalogue.EDM_SYMBOL)
 
-    return symbol_files
 
-
-def process_symbol(filename, mod, mod_cfg, mirror_root, prod_root):
+def process_symbol(filename, mod, mod_cfg, mirror_root, prod_root,
+                   scratch_dir=files.SYMBOLS_DIR, use_script=True):
     """ Process one symbol file and convert to PNG.
 
     Args:
@@ -152,6 +177,7 @@ def process_symbol(filename, mod, mod_cfg, mirror_root, prod_root):
         mod_cfg: configuration.ModuleConfig object for module
         mirror_root: root of mirror filesystem
         prod_root: root of prod filesystem
+        scratch_dir, use_script: as for files.convert_symbol
     Returns:
         PNG filename if successful, None if any error occurred
     """
@@ -177,18 +203,120 @@ def process_symbol(filename, mod, mod_cfg, mirror_root, prod_root):
         return
 
     if os.path.exists(full_path):
-        return files.convert_symbol(full_path, [destination])
+        return files.convert_symbol(full_path, [destination], scratch_dir, use_script)
     else:
         log.warn('Symbol %s does not exist', full_path)
 
 
-def start():
+def _init_worker(gen_cfg):
+    """Prepare a worker process to draw symbols."""
+    global _worker_cfg
+    _worker_cfg = gen_cfg
+    log.getLogger().handlers = [utils.RecordBuffer()]
+
+
+def _draw_symbol(key):
+    """ Convert one symbol in a worker process, without running EDM.
+
+    Args:
+        key: (symbol_file, module)
+
+    Returns:
+        (key, PNG filename or None, True if the symbol needs EDM to convert
+         it, log records)
+    """
+    symbol_file, smodule = key
+    buf = log.getLogger().handlers[0]
+    buf.records = []
+    png_file = None
+    needs_edm = False
+    scratch_dir = tempfile.mkdtemp(prefix='symbol-', dir=files.TMP_DIR)
+    try:
+        png_file = process_symbol(symbol_file, smodule,
+                                  _worker_cfg.get_mod_cfg(smodule),
+                                  _worker_cfg.mirror_root, _worker_cfg.prod_root,
+                                  scratch_dir, use_script=False)
+    except render.RenderError as e:
+        log.info('Cannot draw %s (%s); deferring to EDM', symbol_file, e)
+        needs_edm = True
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return key, png_file, needs_edm, buf.records
+
+
+def convert_symbols(keys, gen_cfg, jobs):
+    """ Convert symbols to PNG files.
+
+        If jobs is greater than one, symbols which can be drawn directly
+        are converted by jobs worker processes and those needing EDM are
+        then converted one at a time.
+
+    Args:
+        keys: iterable of (symbol_file, module)
+        gen_cfg: GeneralConfig object
+        jobs: number of worker processes
+
+    Returns:
+        dict of (symbol_file, module):PNG filename or None
+    """
+    keys = sorted(keys)
+    png_files = {}
+    if jobs > 1 and len(keys) > 1:
+        needs_edm = []
+        if not os.path.exists(files.TMP_DIR):
+            os.makedirs(files.TMP_DIR)
+        log.info('Drawing %s symbols with %s processes', len(keys), jobs)
+        pool = multiprocessing.Pool(jobs, _init_worker, (gen_cfg,))
+        try:
+            for key, png_file, edm, records in pool.imap(_draw_symbol, keys):
+                for record in records:
+                    log.getLogger().handle(record)
+                if edm:
+                    needs_edm.append(key)
+                else:
+                    png_files[key] = png_file
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        needs_edm = keys
+
+    for symbol_file, smodule in needs_edm:
+        mod_cfg = gen_cfg.get_mod_cfg(smodule)
+        png_files[(symbol_file, smodule)] = process_symbol(
+            symbol_file, smodule, mod_cfg, gen_cfg.mirror_root, gen_cfg.prod_root)
+
+    return png_files
+
+
+def group_by_module(opi_paths):
+    """ Group OPI files by the module containing them
+
+    Args:
+        opi_paths: list of OPI files in the mirror filesystem
+
+    Returns:
+        OrderedDict of (module name, version):list of OPI files
+    """
+    by_module = collections.OrderedDict()
+    for opi_path in opi_paths:
+        _, mod_name, version, _ = css_utils.parse_module_name(opi_path)
+        by_module.setdefault((mod_name, version), []).append(opi_path)
+    return by_module
+
+
+def start(jobs=1):
     cfg = configuration.GeneralConfig()
     symbol_opis = build_filelist(cfg.mirror_root)
     log.debug('Found symbol opis: {}'.format(symbol_opis))
 
-    for opi_path in symbol_opis:
-        _, mod_name, version, rel_path = css_utils.parse_module_name(opi_path)
+    # Find every symbol used before converting any, so that each is
+    # converted once and the conversions can run in parallel.  Each
+    # module's dependencies are resolved and indexed once for all of
+    # its OPIs.
+    to_update = []
+    symbols = set()
+    for (mod_name, version), opi_paths in group_by_module(symbol_opis).items():
         module_cfg = cfg.get_mod_cfg(mod_name)
         area = module_cfg.area
 
@@ -198,12 +326,26 @@ def start():
         try:
             mod = module.Module(coords, module_cfg, cfg.mirror_root)
             edl_dirs = get_edl_dirs(mod, cfg)
-
-            file_dict = paths.index_paths(edl_dirs, True)
-            update_symbols(opi_path, depth, file_dict, cfg)
+            # update_symbols() adds png files to its copy of the index
+            file_dict = dict(paths.index_paths(edl_dirs, True))
+            for opi_path in opi_paths:
+                symbols.update(find_symbols(opi_path, file_dict))
+            to_update.append((opi_paths, depth, file_dict))
         except ValueError as e:
             log.warn('Error updating symbols in %s: %s', mod_name, e)
 
+    png_files = convert_symbols(symbols, cfg, jobs)
+
+    for opi_paths, depth, file_dict in to_update:
+        for opi_path in opi_paths:
+            try:
+                update_symbols(opi_path, depth, file_dict, png_files)
+            except ValueError as e:
+                log.warn('Error updating symbols in %s: %s', opi_path, e)
+
 
 if __name__ == '__main__':
-    start()
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-j', '--jobs', help='Number of processes drawing symbols',
+                    metavar='<jobs>', type=int, default=multiprocessing.cpu_count())
+    start(ap.parse_args().jobs)
@@ -0,0 +1,114 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.FileReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+
+/**
+ * Long-lived wrapper around the EdmConverter main class so that one JVM
+ * can convert many EDL files.
+ *
+ * Compiled once by files.build_server():
+ *
+ *     javac -cp converter.jar -d tmp/classes res/ConverterServer.java
+ *
+ * Server mode, used by convert/server.py:
+ *
+ *     java -cp converter.jar:tmp/classes ConverterServer <main-class>
+ *
+ * Requests are read one per line from stdin:
+ *
+ *     PING                        -> PONG
+ *     <source>\t<destination>     -> OK | FAIL <reason>
+ *
+ * Batch mode, used by files.convert_edl_batch():
+ *
+ *     java -cp converter.jar:tmp/classes ConverterServer <main-class> <manifest>
+ *
+ * Each line of the manifest is <source>\t<destination>; one result line is
+ * printed per entry:
+ *
+ *     OK\t<source> | FAIL\t<source>\t<reason>
+ *
+ * Anything printed by the converter itself is redirected to stderr so that
+ * stdout only carries replies.
+ */
+public class ConverterServer {
+
+    public static void main(String[] args) throws Exception {
+        if (args.length < 1 || args.length > 2) {
+            System.err.println("Usage: ConverterServer <main-class> [<manifest>]");
+            System.exit(2);
+        }
+        PrintStream replies = new PrintStream(
+                new FileOutputStream(FileDescriptor.out), true);
+        System.setOut(System.err);
+
+        Method convert = Class.forName(args[0]).getMethod("main", String[].class);
+        if (args.length == 2) {
+            batch(convert, new BufferedReader(new FileReader(args[1])), replies);
+        } else {
+            serve(convert, new BufferedReader(new InputStreamReader(System.in)),
+                  replies);
+        }
+    }
+
+    private static void serve(Method convert, BufferedReader requests,
+                              PrintStream replies) throws Exception {
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.equals("PING")) {
+                replies.println("PONG");
+                continue;
+            }
+            String[] pair = line.split("\t");
+            if (pair.length != 2) {
+                replies.println("FAIL malformed request");
+                continue;
+            }
+            String error = convertOne(convert, pair);
+            replies.println(error == null ? "OK" : "FAIL " + error);
+        }
+    }
+
+    private static void batch(Method convert, BufferedReader manifest,
+                              PrintStream replies) throws Exception {
+        String line;
+        while ((line = manifest.readLine()) != null) {
+            String[] pair = line.split("\t");
+            if (pair.length != 2) {
+                replies.println("FAIL\t" + line + "\tmalformed manifest entry");
+                continue;
+            }
+            String error = convertOne(convert, pair);
+            if (error == null) {
+                replies.println("OK\t" + pair[0]);
+            } else {
+                replies.println("FAIL\t" + pair[0] + "\t" + error);
+            }
+        }
+        manifest.close();
+    }
+
+    /**
+     * Convert one source/destination pair, returning null on success or a
+     * description of the error.
+     */
+    private static String convertOne(Method convert, String[] pair) {
+        try {
+            convert.invoke(null, (Object) pair);
+            return null;
+        } catch (InvocationTargetException e) {
+            return describe(e.getCause());
+        } catch (Throwable t) {
+            return describe(t);
+        }
+    }
+
+    private static String describe(Throwable t) {
+        return String.valueOf(t).replace('\n', ' ');
+    }
+}
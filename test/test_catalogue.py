@@ -0,0 +1,73 @@
+import pkg_resources
+pkg_resources.require('dls_css_utils')
+pkg_resources.require('mock')
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+from convert import catalogue
+
+
+SYMBOL_OPI = '<display><widget typeId="org.csstudio.opibuilder.widgets.edm.symbolwidget">' \
+             '<name>EDM Symbol</name></widget></display>'
+MMUX_RULES_OPI = '<display><widget typeId="org.csstudio.opibuilder.widgets.edm.menumux">' \
+                 '<rules><rule name="r" prop_id="visible" out_exp="false"/></rules>' \
+                 '</widget></display>'
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_file = os.path.join(self.tmp_dir, 'cache', 'catalogue.pickle')
+        self.symbol = self._write('a/symbol.opi', SYMBOL_OPI)
+        self.mmux = self._write('b/c/mmux.opi', MMUX_RULES_OPI)
+        self._write('b/notes.txt', SYMBOL_OPI)
+
+    def _write(self, name, contents):
+        filepath = os.path.join(self.tmp_dir, 'opi', name)
+        if not os.path.exists(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, 'w') as f:
+            f.write(contents)
+        return filepath
+
+    def test_scan_tags_each_opi_file(self):
+        opis = catalogue.scan(os.path.join(self.tmp_dir, 'opi'))
+
+        self.assertEqual(len(opis), 2)
+        self.assertEqual(opis.files(), sorted([self.symbol, self.mmux]))
+        self.assertEqual(opis.files(catalogue.EDM_SYMBOL), [self.symbol])
+        self.assertEqual(opis.files(catalogue.MENU_MUX), [self.mmux])
+        self.assertEqual(opis.files(catalogue.RULES), [self.mmux])
+        self.assertEqual(opis.files(catalogue.FONTS), [])
+
+    def test_saved_catalogue_only_reads_changed_files(self):
+        basepath = os.path.join(self.tmp_dir, 'opi')
+        catalogue.scan(basepath, self.cache_file)
+        self.assertTrue(os.path.exists(self.cache_file))
+
+        self._write('a/symbol.opi', MMUX_RULES_OPI + '\n')
+        with mock.patch.object(catalogue, 'classify',
+                               wraps=catalogue.classify) as classify:
+            opis = catalogue.scan(basepath, self.cache_file)
+
+        classify.assert_called_once_with(self.symbol)
+        self.assertEqual(opis.files(catalogue.MENU_MUX), sorted([self.symbol, self.mmux]))
+        self.assertEqual(opis.files(catalogue.EDM_SYMBOL), [])
+
+    def test_saved_catalogue_keeps_other_basepaths(self):
+        catalogue.scan(os.path.join(self.tmp_dir, 'opi', 'a'), self.cache_file)
+        catalogue.scan(os.path.join(self.tmp_dir, 'opi', 'b'), self.cache_file)
+        with mock.patch.object(catalogue, 'classify') as classify:
+            opis = catalogue.scan(os.path.join(self.tmp_dir, 'opi', 'a'), self.cache_file)
+
+        self.assertFalse(classify.called)
+        self.assertEqual(opis.files(catalogue.EDM_SYMBOL), [self.symbol])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import pkg_resources
 pkg_resources.require('dls_css_utils')
 import os
+import shutil
+import tempfile
 import unittest
 import xml.etree.ElementTree as ET
 import difflib
@@ -753,6 +755,24 @@ MISC_COLOURS_TWK = """<widget typeId="org.csstudio.opibuilder.widgets.Unknown" v
     </foreground_color>
 </widget>"""
 
+NESTED = """<display typeId="org.csstudio.opibuilder.Display" version="1.0">
+  <widget typeId="org.csstudio.opibuilder.widgets.groupingContainer" version="1.0">
+    <foreground_color>
+      <color blue="0" green="0" name="Black" red="0" />
+    </foreground_color>
+    <widget typeId="org.csstudio.opibuilder.widgets.TextUpdate" version="1.0">
+      <foreground_color>
+        <color blue="0" green="0" name="Black" red="0" />
+      </foreground_color>
+      <widget typeId="org.csstudio.opibuilder.widgets.Label" version="1.0">
+        <foreground_color>
+          <color blue="0" green="0" name="Black" red="0" />
+        </foreground_color>
+      </widget>
+    </widget>
+  </widget>
+</display>"""
+
 
 class ColourChangeTest(unittest.TestCase):
 
@@ -809,6 +829,65 @@ class ColourChangeTest(unittest.TestCase):
     def test_change_colours_canvas(self):
         self.assertStringsEqual(self.do_colourtweak(DISPLAY), DISPLAY_TWK)
 
+    def test_nested_widget_colours_use_own_widget_type(self):
+        root = ET.fromstring(NESTED)
+        colourtweak.transform(root)
+        colours = [c.get('name') for c in root.iter('color')]
+        # Black foreground is "Text: FG" for the container but is left alone
+        # for the text update nested inside it.
+        self.assertEqual(colours, ['Text: FG', 'Black', 'Text: FG'])
+
+
+class ColourRolesTest(unittest.TestCase):
+
+    def setUp(self):
+        working_dir = os.path.dirname(os.path.realpath(__file__))
+        resource_path, _ = os.path.split(working_dir)
+        self.def_file = os.path.join(resource_path, colourtweak.COLOR_DEF_FILE)
+        colourtweak.init(filepath=self.def_file)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.roles_file = os.path.join(self.tmp_dir, colourtweak.COLOR_ROLES_FILE)
+
+    def tearDown(self):
+        colourtweak.init(filepath=self.def_file)
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self, text):
+        with open(self.roles_file, 'w') as f:
+            f.write(text)
+        colourtweak.load_roles(self.roles_file)
+
+    def lookup(self, name, type_id, prop):
+        colour = ET.Element('color', name=name)
+        colourtweak.process_element(colour, name, type_id, prop)
+        return colour.get('name')
+
+    def test_site_override_applied(self):
+        self.load('Black | LABEL | foreground_color | Exit: FG\n')
+        self.assertEqual(self.lookup('Black', colourtweak.LABEL, 'foreground_color'),
+                         'Exit: FG')
+        # Falls back to the static map elsewhere.
+        self.assertEqual(self.lookup('Black', colourtweak.LABEL, 'background_color'),
+                         'Black')
+
+    def test_first_matching_role_wins(self):
+        self.load('~canvas | LABEL | * | Canvas  # comment\n'
+                  'FE Canvas | LABEL | * | Text: FG\n')
+        self.assertEqual(self.lookup('FE Canvas', colourtweak.LABEL, 'value'), 'Canvas')
+
+    def test_unmapped_name_dropped(self):
+        self.load('')
+        self.assertIsNone(self.lookup('no such colour', colourtweak.LABEL, 'value'))
+
+    def test_ensure_init_loads_file_once(self):
+        self.load('')
+        colourtweak.ensure_init(self.def_file)
+        # Already loaded, so the roles file is not read again.
+        self.assertEqual(colourtweak.colour_roles, [])
+
+    def test_unknown_widget_type_rejected(self):
+        self.assertRaises(ValueError, self.load, 'Black | NOT_A_WIDGET | * | Black\n')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+import pkg_resources
+pkg_resources.require('dls_css_utils')
+pkg_resources.require('mock')
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+from convert import dependencies
+from dls_css_utils import coordinates
+
+
+class FindDependenciesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.release = os.path.join(self.tmp_dir, 'RELEASE')
+        with open(self.release, 'w') as f:
+            f.write('MOTOR=/dls_sw/prod/R3.14.12.3/support/motor/6-9\n')
+        self.coords = coordinates.from_path2('/dls_sw/prod/R3.14.12.3/ioc/LI/TI/5-3')
+        self.deps = {'motor': coordinates.from_path2(
+            '/dls_sw/prod/R3.14.12.3/support/motor/6-9')}
+
+        dependencies.clear()
+        patchers = [
+            mock.patch.object(dependencies, 'CACHE_FILE',
+                              os.path.join(self.tmp_dir, 'deps.pickle')),
+            mock.patch.object(dependencies, 'release_file',
+                              lambda coords, mirror_root=None: self.release),
+            mock.patch.object(dependencies, '_schedule_save'),
+            mock.patch('dls_css_utils.dependency.DependencyParser', create=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        from dls_css_utils import dependency
+        self.parser = dependency.DependencyParser
+        self.parser.from_coord.return_value.find_dependencies.return_value = self.deps
+
+    def tearDown(self):
+        dependencies.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_dependencies_resolved_once(self):
+        self.assertEqual(dependencies.find_dependencies(self.coords), self.deps)
+        self.assertEqual(dependencies.find_dependencies(self.coords), self.deps)
+        self.assertEqual(self.parser.from_coord.call_count, 1)
+
+    def test_result_may_be_modified_by_caller(self):
+        dependencies.find_dependencies(self.coords)['extra'] = self.coords
+        self.assertEqual(dependencies.find_dependencies(self.coords), self.deps)
+
+    def test_changed_release_file_resolved_again(self):
+        dependencies.find_dependencies(self.coords)
+        os.utime(self.release, (0, 0))
+        dependencies.find_dependencies(self.coords)
+        self.assertEqual(self.parser.from_coord.call_count, 2)
+
+    def test_prod_release_file_checked_if_not_in_mirror(self):
+        mirrored = os.path.join(self.tmp_dir, 'mirror', 'RELEASE')
+
+        def release_file(coords, mirror_root=None):
+            return self.release if mirror_root is None else mirrored
+
+        with mock.patch.object(dependencies, 'release_file', release_file):
+            dependencies.find_dependencies(self.coords, self.tmp_dir)
+            os.utime(self.release, (0, 0))
+            dependencies.find_dependencies(self.coords, self.tmp_dir)
+        self.assertEqual(self.parser.from_coord.call_count, 2)
+
+    def test_saved_dependencies_reused_by_later_run(self):
+        dependencies.find_dependencies(self.coords)
+        dependencies.save()
+        dependencies.clear()
+        self.assertEqual(dependencies.find_dependencies(self.coords), self.deps)
+        self.assertEqual(self.parser.from_coord.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
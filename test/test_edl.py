@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from convert import edl, symbols
+
+SYMBOL = """4 0 1
+beginScreenProperties
+major 4
+x 0
+y 0
+w 20
+h 10
+endScreenProperties
+
+# (Group)
+object activeGroupClass
+beginObjectProperties
+x 5
+y 7
+w 9
+h 9
+
+beginGroup
+
+# (Lines)
+object activeLineClass
+beginObjectProperties
+x 6
+y 8
+w 9
+h 9
+numPoints 2
+xPoints {
+  0 1
+  1 1
+}
+yPoints {
+  0 8
+  1 16
+}
+endObjectProperties
+
+endGroup
+
+endObjectProperties
+
+# (Group)
+object activeGroupClass
+beginObjectProperties
+x 30
+y 0
+w 9
+h 9
+
+beginGroup
+
+# (Rectangle)
+object activeRectangleClass
+beginObjectProperties
+x 30
+y 0
+w 9
+h 9
+endObjectProperties
+
+endGroup
+
+endObjectProperties
+"""
+
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.display = edl.parse(SYMBOL.splitlines(True))
+
+    def test_parse_finds_nested_objects(self):
+        objects = self.display.objects
+        self.assertEqual([o.cls for o in objects], [edl.GROUP_CLASS] * 2)
+        self.assertEqual([c.cls for c in objects[0].children], ['activeLineClass'])
+        self.assertEqual([c.cls for c in objects[1].children], ['activeRectangleClass'])
+
+    def test_get_reads_own_properties_only(self):
+        group = self.display.objects[0]
+        self.assertEqual(group.get_int('x'), 5)
+        self.assertEqual(group.get('numPoints'), None)
+        self.assertEqual(group.children[0].get('numPoints'), ['2'])
+
+    def test_lines_are_kept(self):
+        self.assertEqual(''.join(self.display.iter_lines()), SYMBOL)
+
+    def test_block_entries_are_not_properties(self):
+        kinds = [(kind, name) for kind, name, _ in edl.tokenize(['xPoints {\n', '  0 1\n', '}\n'])]
+        self.assertEqual(kinds, [(edl.TEXT, None)] * 3)
+        tokens = list(edl.tokenize(['beginObjectProperties\n', 'xPoints {\n', 'x 1\n', '}\n']))
+        self.assertEqual([(kind, name) for kind, name, _ in tokens],
+                         [(edl.MARKER, edl.PROPS_START), (edl.BLOCK, 'xPoints'),
+                          (edl.ENTRY, 'xPoints'), (edl.BLOCK_END, 'xPoints')])
+
+    def test_props_are_parsed_on_first_use(self):
+        line = self.display.objects[0].children[0]
+        self.assertIsNone(line._props)
+        self.assertEqual(line.props['yPoints'], ['0 8', '1 16'])
+        self.assertEqual(self.display.screen['w'], ['20'])
+
+    def test_walk_yields_all_objects_in_file_order(self):
+        self.assertEqual([o.cls for o in self.display.walk()],
+                         [edl.GROUP_CLASS, 'activeLineClass',
+                          edl.GROUP_CLASS, 'activeRectangleClass'])
+
+    def test_iter_objects_streams_objects_with_depth(self):
+        objects = list(edl.iter_objects(SYMBOL.splitlines(True)))
+        self.assertEqual([(d, o.cls) for d, o in objects],
+                         [(0, edl.GROUP_CLASS), (1, 'activeLineClass'),
+                          (0, edl.GROUP_CLASS), (1, 'activeRectangleClass')])
+        self.assertEqual(objects[1][1].get_int('numPoints'), 2)
+
+    def test_version(self):
+        self.assertEqual(self.display.version, (4, 0, 1))
+        self.assertEqual(edl.version(['# comment\n', '\n', '3 0\n', '4 0 1\n']), (3, 0))
+        self.assertIsNone(edl.version(['beginScreenProperties\n']))
+        self.assertIsNone(edl.version([]))
+
+    def test_unterminated_group_raises_EdlError(self):
+        lines = SYMBOL.splitlines(True)
+        self.assertRaises(edl.EdlError, edl.parse, lines[:lines.index('endGroup\n')])
+
+
+class CompressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.symbol_file = os.path.join(self.tmp_dir, 'symbol.edl')
+        with open(self.symbol_file, 'w') as f:
+            f.write(SYMBOL)
+
+    def test_compress_moves_each_state_next_to_the_last(self):
+        new_file = symbols.compress(self.symbol_file)
+
+        self.assertEqual(new_file, os.path.join(self.tmp_dir, 'symbol-10.edl'))
+        display = edl.parse_file(new_file)
+        first, second = display.objects
+        self.assertEqual((first.get_int('x'), first.get_int('y')), (0, 0))
+        self.assertEqual((second.get_int('x'), second.get_int('y')), (10, 0))
+        self.assertEqual(second.children[0].get_int('x'), 10)
+
+    def test_compress_moves_points_not_indices(self):
+        new_file = symbols.compress(self.symbol_file)
+
+        with open(new_file) as f:
+            text = f.read()
+        self.assertIn('w 20\nh 10\n', text)
+        self.assertIn('x 1\ny 1\n', text)
+        self.assertIn('xPoints {\n  0 -4\n  1 -4\n}\n', text)
+        self.assertIn('yPoints {\n  0 1\n  1 9\n}\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
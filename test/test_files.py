@@ -1,7 +1,29 @@
 import pkg_resources
 pkg_resources.require('dls_css_utils')
+pkg_resources.require('mock')
+import mock
+import os
+import shutil
+import sys
+import tempfile
 import unittest
-from convert import files
+from convert import files, render, server
+
+RESOURCE_PATH = os.path.split(os.path.dirname(os.path.realpath(__file__)))[0]
+
+# Stand-in for batch mode of res/ConverterServer.java: fails any file whose
+# name starts with 'bad' and exits at any whose name starts with 'crash'.
+FAKE_BATCH = r'''
+import os, sys
+for line in open(sys.argv[1]):
+    source, destination = line.rstrip('\n').split('\t')
+    if os.path.basename(source).startswith('crash'):
+        sys.exit(1)
+    elif os.path.basename(source).startswith('bad'):
+        print('FAIL\t%s\tconversion error' % source)
+    else:
+        print('OK\t%s' % source)
+'''
 
 
 class OldEdlTest(unittest.TestCase):
@@ -18,5 +40,159 @@ class OldEdlTest(unittest.TestCase):
         no_version_file = '/dls_sw/prod/R3.14.12.3/support/fastfeedback/11-21/fofbApp/opi/footer.edl'
         self.assertFalse(files.is_old_edl(no_version_file))
 
+
+class ServerConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, 'a.edl')
+        with open(self.source, 'w') as f:
+            f.write('4 0 1\n')
+        self.destination = os.path.join(self.tmp_dir, 'a.opi')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_server_error_falls_back_to_java_per_file(self):
+        dud = mock.Mock()
+        dud.convert.side_effect = server.ServerError('Converter server failed to start')
+        with mock.patch.object(files, '_server', dud), \
+                mock.patch('subprocess.call', return_value=0) as call:
+            self.assertTrue(files.convert_edl(self.source, self.destination))
+            self.assertIsNone(files._server)
+        call.assert_called_once_with(files.CONVERT_CMD + [self.source, self.destination])
+
+
+class BatchConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_edl(self, name, version='4 0 1'):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'w') as f:
+            f.write(version + '\n')
+        return filename, filename[:-3] + 'opi'
+
+    def test_batch_reports_result_per_file(self):
+        good = self._make_edl('good.edl')
+        bad = self._make_edl('bad.edl')
+        old = self._make_edl('old.edl', version='2 0 0')
+        with mock.patch('convert.files.BATCH_CMD', [sys.executable, '-c', FAKE_BATCH]), \
+                mock.patch('convert.files.TMP_DIR', self.tmp_dir):
+            results, old_files = files.convert_edl_batch([good, bad, old])
+
+        self.assertEqual(results, {good[0]: True, bad[0]: False})
+        self.assertEqual(old_files, [old[0]])
+
+    def test_files_after_batch_exits_still_converted(self):
+        first = self._make_edl('first.edl')
+        crash = self._make_edl('crash.edl')
+        last = self._make_edl('last.edl')
+        with mock.patch('convert.files.BATCH_CMD', [sys.executable, '-c', FAKE_BATCH]), \
+                mock.patch('convert.files.TMP_DIR', self.tmp_dir), \
+                mock.patch('convert.files.convert_edl', return_value=False) as single:
+            results, _ = files.convert_edl_batch([first, crash, last])
+
+        self.assertEqual(results, {first[0]: True, crash[0]: False, last[0]: True})
+        single.assert_called_once_with(*crash)
+
+
+SYMBOL = """4 0 1
+beginScreenProperties
+w 100
+h 100
+endScreenProperties
+object activeGroupClass
+beginObjectProperties
+x 20
+y 30
+w 9
+h 9
+beginGroup
+object %s
+beginObjectProperties
+x 20
+y 30
+w 9
+h 9
+endObjectProperties
+endGroup
+endObjectProperties
+"""
+
+
+class ConvertSymbolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.scratch_dir = os.path.join(self.tmp_dir, 'scratch')
+        self.destination = os.path.join(self.tmp_dir, 'opi')
+        os.mkdir(self.destination)
+        colours = render.load_colours(os.path.join(RESOURCE_PATH, render.COLORS_FILE))
+        for patcher in [mock.patch.object(render, '_colours', colours),
+                        mock.patch.object(files, 'SYMBOL_CACHE_DIR',
+                                          os.path.join(self.tmp_dir, 'cache'))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_symbol(self, object_class, filename='sym.edl'):
+        filename = os.path.join(self.tmp_dir, filename)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w') as f:
+            f.write(SYMBOL % object_class)
+        return filename
+
+    def test_drawable_symbol_converted_without_edm(self):
+        symbol = self._make_symbol('activeRectangleClass')
+        png = files.convert_symbol(symbol, [self.destination], self.scratch_dir,
+                                   use_script=False)
+        self.assertEqual(png, 'sym-10.png')
+        self.assertTrue(os.path.exists(os.path.join(self.destination, png)))
+
+    def test_symbol_with_same_content_taken_from_cache(self):
+        files.convert_symbol(self._make_symbol('activeRectangleClass'),
+                             [self.destination], self.scratch_dir, use_script=False)
+        vendored = self._make_symbol('activeRectangleClass', 'other/copy.edl')
+        with mock.patch.object(render, 'render_file') as render_file:
+            png = files.convert_symbol(vendored, [self.destination],
+                                       self.scratch_dir, use_script=False)
+        self.assertFalse(render_file.called)
+        self.assertEqual(png, 'copy-10.png')
+        self.assertTrue(os.path.exists(os.path.join(self.destination, png)))
+
+    def test_symbol_converted_again_after_code_change(self):
+        symbol = self._make_symbol('activeRectangleClass')
+        files.convert_symbol(symbol, [self.destination], self.scratch_dir,
+                             use_script=False)
+        with mock.patch.object(files, '_symbol_code_digest', 'changed'):
+            with mock.patch.object(render, 'render_file') as render_file:
+                files.convert_symbol(symbol, [self.destination],
+                                     self.scratch_dir, use_script=False)
+        self.assertTrue(render_file.called)
+
+    def test_cached_screenshot_not_used_if_edm_not_allowed(self):
+        symbol = self._make_symbol('activeXTextClass')
+        png = os.path.join(self.tmp_dir, 'shot.png')
+        open(png, 'w').close()
+        files._cache_symbol(files.symbol_key(symbol), png, '10', files.SCREENSHOT)
+        self.assertRaises(render.RenderError, files.convert_symbol, symbol,
+                          [self.destination], self.scratch_dir, use_script=False)
+        self.assertEqual(files.convert_symbol(symbol, [self.destination],
+                                              self.scratch_dir), 'sym-10.png')
+
+    def test_undrawable_symbol_raises_if_edm_not_allowed(self):
+        symbol = self._make_symbol('activeXTextClass')
+        self.assertRaises(render.RenderError, files.convert_symbol, symbol,
+                          [self.destination], self.scratch_dir, use_script=False)
+
+
 if __name__ == '__main__':
     unittest.main()
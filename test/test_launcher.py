@@ -1,6 +1,9 @@
 import pkg_resources
 pkg_resources.require('dls_css_utils')
+pkg_resources.require('mock')
+from convert import launcher, spoof
 from convert.launcher import _get_macros, LauncherCommand
+import mock
 import unittest
 
 
@@ -43,5 +46,29 @@ class LauncherCommandTest(unittest.TestCase):
         self.assertEqual(d[cmd1], "b")
         self.assertEqual(len(d), 1)
 
+
+class EntryPointsTest(unittest.TestCase):
+
+    def _cmd(self, path_to_run):
+        cmd = LauncherCommand('name', 'cmd', [])
+
+        def interpret():
+            if path_to_run is None:
+                raise spoof.SpoofError('not EDM')
+            cmd.path_to_run = path_to_run
+        cmd.interpret = interpret
+        return cmd
+
+    def test_entry_points_by_module(self):
+        cmds = [self._cmd('/dls_sw/prod/R3.14.12.3/support/motor/6-9/data/motor.opi'),
+                self._cmd('/dls_sw/prod/R3.14.12.3/support/motor/6-9/data/sub/axis.opi'),
+                self._cmd(None)]
+        with mock.patch('dls_css_utils.utils.parse_module_name',
+                        lambda p: ('/dls_sw/prod/R3.14.12.3/support', 'motor', '6-9',
+                                   p.split('6-9/')[1])):
+            points = launcher.entry_points(cmds)
+
+        self.assertEqual(points, {'motor': set(['data/motor.edl', 'data/sub/axis.edl'])})
+
 if __name__ == '__main__':
     unittest.main()
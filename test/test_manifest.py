@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from convert import manifest
+
+
+class DigestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = os.path.join(self.tmp_dir, 'screen.edl')
+        with open(self.source, 'w') as f:
+            f.write('4 0 1\n')
+
+    def test_module_file_exists(self):
+        self.assertTrue(os.path.exists(manifest.MODULE_FILE))
+
+    def test_layer_and_group_membership_change_digest(self):
+        plain = manifest.digest(self.source, True)
+        self.assertNotEqual(manifest.digest(self.source, True, layer=True), plain)
+        self.assertNotEqual(manifest.digest(self.source, True, group=True), plain)
+
+    def test_file_index_changes_digest(self):
+        before = manifest.index_digest({'a.opi': ('mod', 'data')}, {})
+        after = manifest.index_digest({'a.opi': ('lib', 'data')}, {})
+        self.assertNotEqual(manifest.digest(self.source, True, indexes_digest=before),
+                            manifest.digest(self.source, True, indexes_digest=after))
+
+    def test_copied_file_digest_is_its_contents(self):
+        self.assertEqual(manifest.digest(self.source, False, layer=True),
+                         manifest.file_digest(self.source))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,8 @@ pkg_resources.require('mock')
 
 import os
 import mock
+import shutil
+import tempfile
 import unittest
 from convert import module
 from dls_css_utils import coordinates
@@ -70,12 +72,90 @@ class ModuleTest(unittest.TestCase):
 
 class ConvertAllTest(unittest.TestCase):
 
+    def setUp(self):
+        self.origin = tempfile.mkdtemp()
+        self.destination = tempfile.mkdtemp()
+        coords = coordinates.from_path2('/dls_sw/prod/R3.14.12.3/ioc/LI/TI/5-3')
+        dummy_cfg = mock.MagicMock(edl_dir='data', opi_dir='opi', path_dirs=[],
+                                   extra_deps=[], groups=[], layers=[], has_opi=True)
+        with mock.patch('os.path.exists') as mp:
+            mp.return_value = True
+            self.m = module.Module(coords, dummy_cfg, '/tmp/mirror')
+
+        os.mkdir(os.path.join(self.origin, 'sub'))
+        self.copied = ['a.txt', 'b.txt', os.path.join('sub', 'c.txt')]
+        for name in self.copied:
+            with open(os.path.join(self.origin, name), 'w') as f:
+                f.write(name)
+        self.old_edl = os.path.join(self.origin, 'sub', 'old.edl')
+        with open(self.old_edl, 'w') as f:
+            f.write('2 0 0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.origin)
+        shutil.rmtree(self.destination)
+
     def test_convert_all(self):
         """
         Not yet implemented.
         """
         pass
 
+    def _check_convert_all(self, jobs):
+        old_edl_files = self.m._convert_all(self.origin, self.destination, False, jobs=jobs)
+        self.assertEqual(old_edl_files, [self.old_edl])
+        for name in self.copied:
+            with open(os.path.join(self.destination, name)) as f:
+                self.assertEqual(f.read(), name)
+
+    def test_convert_all_serial(self):
+        self._check_convert_all(jobs=1)
+
+    def test_convert_all_in_parallel(self):
+        self._check_convert_all(jobs=2)
+
+    def test_unchanged_files_skipped_on_rerun(self):
+        self.m._convert_all(self.origin, self.destination, False)
+        copied = os.path.join(self.destination, 'a.txt')
+        with open(copied, 'w') as f:
+            f.write('edited')
+        self.m._convert_all(self.origin, self.destination, False)
+        with open(copied) as f:
+            self.assertEqual(f.read(), 'edited')
+
+    def test_changed_files_redone_on_rerun(self):
+        self.m._convert_all(self.origin, self.destination, False)
+        with open(os.path.join(self.origin, 'a.txt'), 'w') as f:
+            f.write('changed')
+        self.m._convert_all(self.origin, self.destination, False)
+        with open(os.path.join(self.destination, 'a.txt')) as f:
+            self.assertEqual(f.read(), 'changed')
+
+    def test_references_read_earlier_not_read_again(self):
+        graph = module.references.build_graph([self.old_edl], {}, self.origin)
+        with mock.patch.object(module.references, 'read_references') as read:
+            self.m._convert_all(self.origin, self.destination, False, graph=graph)
+        self.assertFalse(read.called)
+
+    def test_references_of_up_to_date_files_not_read(self):
+        edl = os.path.join(self.origin, 'new.edl')
+        with open(edl, 'w') as f:
+            f.write('4 0 1\n')
+
+        def convert(source, target):
+            open(target, 'w').close()
+            return True
+
+        with mock.patch.object(module.files, 'convert_edl', side_effect=convert), \
+                mock.patch.object(module.Module, '_post_process'), \
+                mock.patch.object(module.references, 'read_references',
+                                  return_value=[]) as read:
+            self.m._convert_all(self.origin, self.destination, False)
+            read.assert_any_call(edl)
+            read.reset_mock()
+            self.m._convert_all(self.origin, self.destination, False)
+        self.assertFalse(read.called)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,223 @@
+import pkg_resources
+pkg_resources.require('mock')
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from convert import files, native
+
+SCREEN = """4 0 1
+beginScreenProperties
+major 4
+minor 0
+release 1
+x 50
+y 60
+w 300
+h 200
+font "helvetica-medium-r-18.0"
+fgColor index 14
+bgColor index 3
+title "Overview"
+endScreenProperties
+"""
+
+OBJECTS = """
+# (Group)
+object activeGroupClass
+beginObjectProperties
+major 4
+minor 0
+release 0
+x 10
+y 20
+w 100
+h 50
+
+beginGroup
+
+# (Static Text)
+object activeXTextClass
+beginObjectProperties
+major 4
+minor 1
+release 0
+x 15
+y 25
+w 40
+h 20
+font "helvetica-bold-r-12.0"
+fontAlign "center"
+fgColor index 14
+bgColor index 3
+useDisplayBg
+value {
+  "Two"
+  "lines"
+}
+endObjectProperties
+
+# (Related Display)
+object relatedDisplayClass
+beginObjectProperties
+major 4
+minor 2
+release 0
+x 60
+y 25
+w 40
+h 20
+fgColor index 14
+bgColor index 3
+topShadowColor index 1
+botShadowColor index 11
+font "helvetica-medium-r-12.0"
+buttonLabel "More..."
+numPvs 0
+numDsps 1
+displayFileName {
+  0 "sub/detail.edl"
+}
+menuLabel {
+  0 "Detail"
+}
+symbols {
+  0 "device=$(P):DEV,n=2"
+}
+endObjectProperties
+
+endGroup
+
+endObjectProperties
+
+# (Text Monitor)
+object activeXTextDspClass:noedit
+beginObjectProperties
+major 4
+minor 7
+release 0
+x 120
+y 30
+w 60
+h 20
+controlPv "$(P):VALUE"
+format "decimal"
+font "courier-medium-r-12.0"
+fgColor index 16
+fgAlarm
+bgColor index 10
+limitsFromDb
+precision 2
+objType "monitors"
+endObjectProperties
+"""
+
+UNSUPPORTED = """
+# (Bar)
+object activeBarClass
+beginObjectProperties
+major 4
+minor 1
+release 0
+x 0
+y 0
+w 10
+h 10
+endObjectProperties
+"""
+
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.edl_file = os.path.join(self.tmp_dir, 'screen.edl')
+        self.opi_file = os.path.join(self.tmp_dir, 'screen.opi')
+
+    def _convert(self, text):
+        with open(self.edl_file, 'w') as f:
+            f.write(text)
+        return native.convert(self.edl_file, self.opi_file)
+
+    def test_converts_screen_of_common_widgets(self):
+        self.assertTrue(self._convert(SCREEN + OBJECTS))
+
+        root = ET.parse(self.opi_file).getroot()
+        self.assertEqual(root.findtext('name'), 'Overview')
+        self.assertEqual(root.findtext('width'), '300')
+        self.assertEqual(root.find('background_color/color').get('name'), 'Canvas')
+        group, monitor = root.findall('widget')
+        self.assertEqual(group.get('typeId'), native.WIDGET_PREFIX + 'groupingContainer')
+        label, button = group.findall('widget')
+        # Positions inside a group are relative to the group
+        self.assertEqual((label.findtext('x'), label.findtext('y')), ('5', '5'))
+        self.assertEqual(label.findtext('text'), 'Two\nlines')
+        self.assertEqual(label.findtext('transparent'), 'true')
+        self.assertEqual(label.findtext('horizontal_alignment'), '1')
+        self.assertEqual(label.find('font/fontdata').attrib,
+                         {'fontName': 'helvetica', 'height': '12', 'style': '1'})
+
+        action = button.find('actions/action')
+        self.assertEqual(action.get('type'), 'OPEN_DISPLAY')
+        self.assertEqual(action.findtext('path'), 'sub/detail.opi')
+        self.assertEqual(action.findtext('macros/device'), '$(P):DEV')
+        self.assertEqual(action.findtext('macros/n'), '2')
+        self.assertEqual(action.findtext('macros/include_parent_macros'), 'true')
+
+        self.assertEqual(monitor.get('typeId'), native.WIDGET_PREFIX + 'TextUpdate')
+        self.assertEqual(monitor.findtext('pv_name'), '$(P):VALUE')
+        self.assertEqual(monitor.findtext('format_type'), '1')
+        self.assertEqual(monitor.findtext('forecolor_alarm_sensitive'), 'true')
+
+    def test_macros_not_propagated_if_turned_off(self):
+        self.assertTrue(self._convert(SCREEN + OBJECTS.replace(
+            'numDsps 1', 'numDsps 1\npropagateMacros 0')))
+        action = ET.parse(self.opi_file).getroot().find('.//action')
+        self.assertEqual(action.findtext('macros/include_parent_macros'), 'false')
+
+    def test_unsupported_class_is_left_for_java(self):
+        self.assertFalse(self._convert(SCREEN + OBJECTS + UNSUPPORTED))
+        self.assertFalse(os.path.exists(self.opi_file))
+
+    def test_unknown_property_is_left_for_java(self):
+        self.assertFalse(self._convert(SCREEN + OBJECTS.replace('limitsFromDb', 'visPv "$(P):VIS"')))
+
+    def test_dynamic_colour_is_left_for_java(self):
+        self.assertFalse(self._convert(SCREEN + OBJECTS.replace('bgColor index 10', 'bgColor index 999')))
+
+
+class ConvertEdlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.edl_file = os.path.join(self.tmp_dir, 'screen.edl')
+        self.opi_file = os.path.join(self.tmp_dir, 'screen.opi')
+        files.use_native()
+        self.addCleanup(files.use_native, False)
+
+    @mock.patch('subprocess.call', return_value=0)
+    def test_simple_screen_does_not_run_java(self, call):
+        with open(self.edl_file, 'w') as f:
+            f.write(SCREEN + OBJECTS)
+
+        self.assertTrue(files.convert_edl(self.edl_file, self.opi_file))
+        self.assertFalse(call.called)
+        self.assertTrue(os.path.exists(self.opi_file))
+
+    @mock.patch('subprocess.call', return_value=0)
+    def test_other_screens_use_java(self, call):
+        with open(self.edl_file, 'w') as f:
+            f.write(SCREEN + UNSUPPORTED)
+
+        self.assertTrue(files.convert_edl(self.edl_file, self.opi_file))
+        self.assertEqual(call.call_args[0][0][-2:], [self.edl_file, self.opi_file])
+
+
+if __name__ == '__main__':
+    unittest.main()
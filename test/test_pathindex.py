@@ -0,0 +1,52 @@
+import cPickle as pickle
+import unittest
+
+from convert import pathindex
+
+
+class PathIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = pathindex.PathIndex({
+            'a.opi': ('mod', 'data'),
+            'sub/b.opi': ('mod', 'data'),
+            'sub/c.png': ('mod', 'data'),
+            'subway.opi': ('lib', ''),
+            'z/sub/d.opi': ('lib', ''),
+        })
+
+    def test_keys_with_prefix_found_in_order(self):
+        self.assertEqual(list(self.index.with_prefix('sub')),
+                         ['sub/b.opi', 'sub/c.png', 'subway.opi'])
+        self.assertEqual(list(self.index.under('sub/')), ['sub/b.opi', 'sub/c.png'])
+        self.assertEqual(list(self.index.under('missing')), [])
+
+    def test_new_keys_found_after_change(self):
+        list(self.index.under('sub'))
+        self.index['sub/new.opi'] = ('mod', 'data')
+        del self.index['sub/b.opi']
+        self.assertEqual(list(self.index.under('sub')), ['sub/c.png', 'sub/new.opi'])
+
+    def test_clash_keeps_first_entry_and_records_both(self):
+        self.assertFalse(self.index.add('a.opi', ('other', ''), '/other/data',
+                                        lambda key: '/mod/data'))
+        self.assertTrue(self.index.add('new.opi', ('other', ''), '/other/data'))
+        self.assertEqual(self.index['a.opi'], ('mod', 'data'))
+        self.assertEqual(self.index.clashes, [pathindex.Clash(
+            'a.opi', (('mod', 'data'), '/mod/data'), (('other', ''), '/other/data'))])
+
+    def test_same_entry_from_same_directory_is_not_a_clash(self):
+        self.assertFalse(self.index.add('a.opi', ('mod', 'data'), '/mod/data'))
+        self.assertEqual(self.index.clashes, [])
+
+    def test_pickled_index_restored(self):
+        self.index.add('a.opi', ('other', ''), '/other/data')
+        restored = pickle.loads(pickle.dumps(self.index, pickle.HIGHEST_PROTOCOL))
+        self.assertIsInstance(restored, pathindex.PathIndex)
+        self.assertEqual(restored, self.index)
+        self.assertEqual(restored.clashes, self.index.clashes)
+        self.assertEqual(list(restored.under('sub')), ['sub/b.opi', 'sub/c.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
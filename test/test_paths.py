@@ -1,8 +1,14 @@
 import pkg_resources
 pkg_resources.require('dls_css_utils')
-from convert.paths import _index_dir, update_opi_path
+from convert import paths
+from convert.paths import _index_dir, index_paths, update_opi_path
 
+import mock
+import os
+import shutil
+import tempfile
 import unittest
+import xml.etree.ElementTree as et
 
 
 class IndexDirTest(unittest.TestCase):
@@ -140,5 +146,147 @@ class UpdatePathsTest(unittest.TestCase):
         self.assertEqual('./dir/dummy.opi', updated_path)
 
 
+class PathResolverTest(unittest.TestCase):
+
+    def test_symbol_png_located_without_changing_index(self):
+        index = {'symbols/valve.opi': ('lib', 'data')}
+        resolver = paths.PathResolver(index, 'mod', True)
+        self.assertEqual(resolver.resolve('symbols/valve-20.png', 1),
+                         '../lib/data/symbols/valve-20.png')
+        self.assertEqual(index, {'symbols/valve.opi': ('lib', 'data')})
+
+    def test_results_are_remembered(self):
+        index = {'dummy.opi': ('mod', 'dir')}
+        resolver = paths.PathResolver(index, 'other', True)
+        self.assertEqual(resolver.resolve('dummy.opi', 1), '../mod/dir/dummy.opi')
+        index['dummy.opi'] = ('changed', 'dir')
+        self.assertEqual(resolver.resolve('dummy.opi', 1), '../mod/dir/dummy.opi')
+        self.assertEqual(resolver.resolve('dummy.opi', 0), './changed/dir/dummy.opi')
+
+    def test_later_resolvers_correct_paths_left_by_earlier_ones(self):
+        root = et.fromstring(
+            '<display><widget><path>a.opi</path>'
+            '<actions><action><command>b.opi arg</command></action></actions>'
+            '</widget><image_file>c.png</image_file></display>')
+        first = paths.PathResolver({'a.opi': ('mod', 'dir')}, 'other', False)
+        second = paths.PathResolver({'mod/a.opi': ('top', ''),
+                                     'b.opi': ('lib', 'data')}, 'other', True)
+
+        paths.update_tree(root, 0, [first, second])
+
+        self.assertEqual(root.findtext('widget/path'), './top/mod/a.opi')
+        self.assertEqual(root.findtext('widget/actions/action/command'),
+                         './lib/data/b.opi arg')
+        self.assertEqual(root.findtext('image_file'), 'c.png')
+
+    def test_every_opi_file_in_script_updated(self):
+        root = et.fromstring(
+            '<display><scriptText>'
+            'widget.setPropertyValue("opi_file", "a.opi")\n'
+            'if x: widget.setPropertyValue( "opi_file" , "b.opi" ) # "q"\n'
+            'print "opi_file"'
+            '</scriptText></display>')
+        index = {'a.opi': ('mod', 'dir'), 'b.opi': ('lib', 'data')}
+
+        paths.update_tree(root, 1, [paths.PathResolver(index, 'other', True)])
+
+        self.assertEqual(
+            root.findtext('scriptText'),
+            'widget.setPropertyValue("opi_file", "../mod/dir/a.opi")\n'
+            'if x: widget.setPropertyValue( "opi_file" , "../lib/data/b.opi" ) # "q"\n'
+            'print "opi_file"')
+
+    def test_deeply_nested_tree_updated(self):
+        root = node = et.Element('display')
+        for _ in range(5000):
+            node = et.SubElement(node, 'widget')
+        path = et.SubElement(node, 'path')
+        path.text = 'a.opi'
+
+        paths.update_tree(root, 0, [paths.PathResolver({'a.opi': ('mod', '')},
+                                                       'other', True)])
+
+        self.assertEqual(path.text, './mod/a.opi')
+
+
+class PathDirsIndexTest(unittest.TestCase):
+
+    def test_files_under_path_dirs_keyed_by_name(self):
+        file_index = {'scripts/run': ('mod', 'data'),
+                      'bin/run': ('lib', 'data'),
+                      'bin/tool': ('lib', 'data'),
+                      'screen.opi': ('mod', 'data')}
+        self.assertEqual(paths.path_index(file_index, ['/scripts/', 'bin']),
+                         {'run': ('mod', 'scripts'), 'tool': ('lib', 'bin')})
+
+
+class IndexPathsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        paths.clear_index_cache()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'mod', '1-0', 'data')
+        os.makedirs(self.data_dir)
+        open(os.path.join(self.data_dir, 'a.edl'), 'w').close()
+        patcher = mock.patch.object(paths, 'INDEX_CACHE_DIR',
+                                    os.path.join(self.tmp_dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        paths.clear_index_cache()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_directory_indexed_once(self):
+        first = paths._cached_index_dir(self.data_dir, True)
+        open(os.path.join(self.data_dir, 'b.edl'), 'w').close()
+        second = paths._cached_index_dir(self.data_dir, True)
+        self.assertEqual(first, second)
+        self.assertIn('a.opi', second)
+
+    def test_cleared_cache_reindexes(self):
+        paths._cached_index_dir(self.data_dir, True)
+        open(os.path.join(self.data_dir, 'b.edl'), 'w').close()
+        paths.clear_index_cache()
+        self.assertIn('b.opi', paths._cached_index_dir(self.data_dir, True))
+
+    def test_saved_index_reused_by_later_run(self):
+        paths._cached_index_dir(self.data_dir, True)
+        paths.clear_index_cache()
+        with mock.patch.object(paths, '_index_dir') as index_dir:
+            index = paths._cached_index_dir(self.data_dir, True)
+        self.assertFalse(index_dir.called)
+        self.assertIn('a.opi', index)
+
+    def test_clash_between_directories_recorded(self):
+        other_dir = os.path.join(self.tmp_dir, 'lib', '2-0', 'data')
+        os.makedirs(other_dir)
+        open(os.path.join(other_dir, 'a.edl'), 'w').close()
+        index = index_paths([self.data_dir, other_dir], True)
+        [clash] = index.clashes
+        self.assertEqual(clash.key, 'a.opi')
+        self.assertEqual(clash.kept, (index['a.opi'], self.data_dir))
+        self.assertEqual(clash.ignored[1], other_dir)
+
+    def test_merged_index_and_path_index_made_once(self):
+        index = index_paths([self.data_dir], True)
+        path_dict = paths.index_path_dirs([self.data_dir], ['scripts'])
+        with mock.patch.object(paths, '_cached_index_dir') as cached_index_dir:
+            self.assertIs(index_paths([self.data_dir], True), index)
+            self.assertIs(paths.index_path_dirs([self.data_dir], ['scripts']),
+                          path_dict)
+        self.assertFalse(cached_index_dir.called)
+
+    def test_saved_index_invalidated_by_new_subdirectory_entry(self):
+        sub_dir = os.path.join(self.data_dir, 'sub')
+        os.mkdir(sub_dir)
+        paths._cached_index_dir(self.data_dir, True)
+        paths.clear_index_cache()
+        open(os.path.join(sub_dir, 'c.edl'), 'w').close()
+        # Make sure the change is visible even with coarse mtimes.
+        os.utime(sub_dir, (0, 0))
+        self.assertIn('sub/c.opi', paths._cached_index_dir(self.data_dir, True))
+
+
 if __name__ == '__main__':
     unittest.main()
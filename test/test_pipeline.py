@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as et
+
+from convert import pipeline
+
+OPI = '<display><widget><name>a</name></widget></display>'
+
+
+def rename(root):
+    root.find('./widget/name').text = 'b'
+
+
+def append_suffix(root):
+    name = root.find('./widget/name')
+    name.text += '-suffix'
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.opi = os.path.join(self.tmp_dir, 'test.opi')
+        with open(self.opi, 'w') as f:
+            f.write(OPI)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_transforms_applied_in_order(self):
+        pp = pipeline.Pipeline([rename])
+        pp.register(append_suffix)
+        self.assertTrue(pp.apply(self.opi))
+        self.assertEqual(et.parse(self.opi).find('./widget/name').text, 'b-suffix')
+
+    def test_invalid_xml_skipped(self):
+        with open(self.opi, 'w') as f:
+            f.write('<display>')
+        pp = pipeline.Pipeline([rename])
+        self.assertFalse(pp.apply(self.opi))
+        with open(self.opi) as f:
+            self.assertEqual(f.read(), '<display>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from convert import references
+
+RELATED = """
+object relatedDisplayClass
+beginObjectProperties
+major 4
+x 0
+y 0
+w 10
+h 10
+numDsps 2
+displayFileName {
+  0 "detail.edl"
+  1 "./sub/other"
+}
+endObjectProperties
+"""
+
+SYMBOL = """
+object activeSymbolClass
+beginObjectProperties
+major 4
+x 0
+y 0
+w 10
+h 10
+file "symbols/valve"
+endObjectProperties
+"""
+
+IMAGE = """
+object activePngClass
+beginObjectProperties
+major 4
+x 0
+y 0
+w 10
+h 10
+file "logo.png"
+endObjectProperties
+"""
+
+SCREEN = """4 0 1
+beginScreenProperties
+w 100
+h 100
+endScreenProperties
+"""
+
+
+def related(*names):
+    entries = ''.join('  {} "{}"\n'.format(i, n) for i, n in enumerate(names))
+    return SCREEN + RELATED.replace(
+        '  0 "detail.edl"\n  1 "./sub/other"\n', entries)
+
+
+class FindReferencesTest(unittest.TestCase):
+
+    def test_finds_displays_symbols_and_images(self):
+        text = SCREEN + RELATED + SYMBOL + IMAGE + RELATED
+        self.assertEqual(references.find_references(text.splitlines(True)),
+                         ['detail.opi', 'sub/other.opi', 'symbols/valve.opi', 'logo.png'])
+
+
+class ReferenceGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.top = self._write('top.edl', related('a.edl', '$(P)other.edl', 'lib.edl'))
+        self.a = self._write('a.edl', related('sub/b.edl', 'missing.edl'))
+        self.b = self._write('sub/b.edl', related('a.edl'))
+        self.unused = self._write('unused.edl', SCREEN)
+        file_index = {'lib.opi': ('lib', 'data')}
+        self.graph = references.build_graph(
+            [self.top, self.a, self.b, self.unused], file_index, self.root)
+
+    def _write(self, name, text):
+        filepath = os.path.join(self.root, name)
+        if not os.path.exists(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, 'w') as f:
+            f.write(text)
+        return filepath
+
+    def test_dangling_ignores_macros_and_indexed_files(self):
+        self.assertEqual(self.graph.dangling(), {self.a: ['missing.opi']})
+        self.assertEqual(self.graph.dangling([self.top]), {})
+
+    def test_reachable_follows_references_through_cycles(self):
+        self.assertEqual(self.graph.reachable([self.top]),
+                         set([self.top, self.a, self.b]))
+
+    def test_reachable_files_follows_references_into_other_modules(self):
+        lib_root = os.path.join(self.root, 'lib')
+        lib = self._write('lib/data/lib.edl', related('deeper.edl'))
+        deeper = self._write('lib/data/deeper.edl', SCREEN)
+        self._write('lib/data/orphan.edl', SCREEN)
+        lib_data = os.path.dirname(lib)
+        lib_graph = references.build_graph(
+            [lib, deeper, os.path.join(lib_data, 'orphan.edl')], {}, lib_data)
+
+        reached = references.reachable_files({'ioc': self.graph, 'lib': lib_graph},
+                                             {'lib': lib_root}, [self.top])
+
+        self.assertEqual(reached, set([self.top, self.a, self.b, lib, deeper]))
+
+    def test_reachable_files_follows_references_with_macros(self):
+        dynamic = self._write('dynamic.edl', related('$(dev)-detail.edl', '$(P)none.edl'))
+        x = self._write('x-detail.edl', SCREEN)
+        y = self._write('sub/y-detail.edl', SCREEN)
+        graph = references.build_graph([dynamic, x, y, self.unused], {}, self.root)
+
+        reached = references.reachable_files({'ioc': graph}, {}, [dynamic])
+
+        self.assertEqual(reached, set([dynamic, x, y]))
+
+
+if __name__ == '__main__':
+    unittest.main()
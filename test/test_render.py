@@ -0,0 +1,128 @@
+import os
+import struct
+import unittest
+import zlib
+
+from convert import render
+
+RESOURCE_PATH = os.path.split(os.path.dirname(os.path.realpath(__file__)))[0]
+
+SCREEN = """4 0 1
+beginScreenProperties
+major 4
+minor 0
+release 1
+x 0
+y 0
+w 20
+h 10
+bgColor index 3
+endScreenProperties
+"""
+
+RECTANGLE = """
+object activeRectangleClass
+beginObjectProperties
+major 4
+minor 0
+release 0
+x 0
+y 0
+w 9
+h 9
+lineColor index 14
+fill
+fillColor rgb 0 65535 0
+endObjectProperties
+"""
+
+POLYGON = """
+object activeGroupClass
+beginObjectProperties
+x 10
+y 0
+w 9
+h 9
+
+beginGroup
+
+object activeLineClass
+beginObjectProperties
+lineColor index 20
+fill
+fillColor index 20
+closePolygon
+numPoints 3
+xPoints {
+  0 10
+  1 19
+  2 10
+}
+yPoints {
+  0 0
+  1 5
+  2 9
+}
+endObjectProperties
+
+endGroup
+
+visPv "LOC\\\\dummy"
+endObjectProperties
+"""
+
+TEXT = """
+object activeXTextClass
+beginObjectProperties
+x 0
+y 0
+w 10
+h 10
+endObjectProperties
+"""
+
+
+class RenderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.colours = render.load_colours(
+            os.path.join(RESOURCE_PATH, render.COLORS_FILE))
+
+    def draw(self, text):
+        return render.render(text.splitlines(True), self.colours)
+
+    def test_colours_loaded_as_8_bit(self):
+        self.assertEqual(self.colours[14], (0, 0, 0))
+        self.assertEqual(self.colours[20], (255, 0, 0))
+
+    def test_canvas_is_display_size_with_transparent_background(self):
+        canvas = self.draw(SCREEN)
+        self.assertEqual((canvas.width, canvas.height), (20, 10))
+        self.assertEqual(canvas.get_pixel(5, 5), render.TRANSPARENT)
+
+    def test_filled_rectangle_with_outline(self):
+        canvas = self.draw(SCREEN + RECTANGLE)
+        self.assertEqual(canvas.get_pixel(0, 0), (0, 0, 0, 255))
+        self.assertEqual(canvas.get_pixel(9, 9), (0, 0, 0, 255))
+        self.assertEqual(canvas.get_pixel(4, 4), (0, 255, 0, 255))
+
+    def test_polygon_in_group(self):
+        canvas = self.draw(SCREEN + POLYGON)
+        self.assertEqual(canvas.get_pixel(12, 5), (255, 0, 0, 255))
+        self.assertEqual(canvas.get_pixel(18, 1), render.TRANSPARENT)
+
+    def test_unsupported_object_raises_render_error(self):
+        self.assertRaises(render.RenderError, self.draw, SCREEN + TEXT)
+
+    def test_png_encoding(self):
+        png = self.draw(SCREEN + RECTANGLE).png()
+        self.assertTrue(png.startswith('\x89PNG\r\n\x1a\n'))
+        width, height = struct.unpack('>II', png[16:24])
+        self.assertEqual((width, height), (20, 10))
+        idat_length = struct.unpack('>I', png[33:37])[0]
+        raw = zlib.decompress(png[41:41 + idat_length])
+        self.assertEqual(len(raw), height * (1 + width * 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
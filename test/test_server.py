@@ -0,0 +1,69 @@
+import pkg_resources
+pkg_resources.require('mock')
+import mock
+import sys
+import unittest
+
+from convert import server
+
+# Stand-in for res/ConverterServer.java speaking the same protocol.
+FAKE_SERVER = r'''
+import sys
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    line = line.strip()
+    if line == 'PING':
+        reply = 'PONG'
+    elif line.startswith('crash'):
+        sys.exit(1)
+    elif line.startswith('bad'):
+        reply = 'FAIL conversion error'
+    else:
+        reply = 'OK'
+    sys.stdout.write(reply + '\n')
+    sys.stdout.flush()
+'''
+
+
+class ConverterServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.ConverterServer([sys.executable, '-c', FAKE_SERVER])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_server_not_started_until_first_conversion(self):
+        self.assertFalse(self.server.is_alive())
+        self.server.convert('a.edl', 'a.opi')
+        self.assertTrue(self.server.is_alive())
+
+    def test_successful_conversion_returns_zero(self):
+        self.assertEqual(self.server.convert('a.edl', 'a.opi'), server.SUCCESS_CODE)
+
+    def test_failed_conversion_returns_non_zero(self):
+        self.assertEqual(self.server.convert('bad.edl', 'bad.opi'), server.FAILURE_CODE)
+        # A failure must not take the server down.
+        self.assertTrue(self.server.is_alive())
+
+    def test_server_restarted_after_crash(self):
+        self.assertEqual(self.server.convert('crash.edl', 'crash.opi'), server.CRASH_CODE)
+        self.assertFalse(self.server.is_alive())
+        self.assertEqual(self.server.convert('a.edl', 'a.opi'), server.SUCCESS_CODE)
+
+    def test_server_not_pinged_before_each_conversion(self):
+        self.server.convert('a.edl', 'a.opi')
+        with mock.patch.object(self.server, '_ping') as ping:
+            self.server.convert('b.edl', 'b.opi')
+            self.server.convert('c.edl', 'c.opi')
+        self.assertFalse(ping.called)
+
+    def test_start_failure_raises_server_error(self):
+        dud = server.ConverterServer([sys.executable, '-c', 'pass'])
+        self.assertRaises(server.ServerError, dud.convert, 'a.edl', 'a.opi')
+
+
+if __name__ == '__main__':
+    unittest.main()